@@ -54,8 +54,14 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "mis.memo.PayrollMemoMiddleware",
 ]
 
+# Alias του cache (CACHES) για τα αποτελέσματα μισθοδοσίας ανάμεσα σε
+# αιτήσεις (βλ. mis/memo.py). Με None μόνο ανά αίτηση.
+MIS_PAYROLL_CACHE = None
+MIS_PAYROLL_CACHE_TIMEOUT = None
+
 ROOT_URLCONF = "djangomis.urls"
 
 TEMPLATES = [
@@ -91,6 +97,22 @@ DATABASES = {
     }
 }
 
+# Φάκελος για τα αρχεία ΑΠΔ/ΦΜΥ (zip) με κλειδί το hash των δεδομένων τους
+# (βλ. mis/exports.py). Με None τα αρχεία φτιάχνονται σε κάθε αίτηση.
+MIS_EXPORT_CACHE_DIR = os.path.join(DBPATH, "exports")
+# Νήματα για τις εργασίες αρχείων στο παρασκήνιο (βλ. mis/jobs.py). Με 0 η
+# εργασία τρέχει μέσα στην αίτηση.
+MIS_EXPORT_WORKERS = 1
+# Δευτερόλεπτα χωρίς ενημέρωση (heartbeat) μετά τα οποία μια εργασία άλλης
+# διεργασίας θεωρείται χαμένη (βλ. mis/jobs.py)
+MIS_EXPORT_JOB_TIMEOUT = 600
+# Διεργασίες για το πακέτο αρχείων μιας χρονιάς (βλ. mis/bundle.py). Με None
+# όσες οι CPU.
+MIS_BUNDLE_WORKERS = None
+# Διεργασίες (spawn) για τα πακέτα και τις αποδείξεις των εργασιών στο
+# παρασκήνιο (βλ. mis/jobs.py). Με 1 η εργασία τρέχει σειριακά στο νήμα της.
+MIS_JOB_PROCESSES = 1
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -1,12 +1,61 @@
 from django.contrib import admin
 from django import forms
+from django.urls import reverse
+from django.utils.html import format_html
 # from django.conf.locale.he import formats as el_formats
+from . import jobs
 from . import models as mdl
 # el_formats.DATE_FORMAT = "d/M/Y"
 
 admin.site.site_header = 'Mis 2020'
 
 
+class ActiveFilter(admin.SimpleListFilter):
+    """Ενεργοί (χωρίς αποχώρηση) ή ενεργοί σε περίοδο YYYYMM με ?active=YYYYMM.
+    Το queryset πρέπει να έχει active_in και with_active.
+    """
+    title = 'Ενεργός'
+    parameter_name = 'active'
+
+    def lookups(self, request, model_admin):
+        return (('1', 'Ναι'), ('0', 'Όχι'))
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value == '1':
+            return queryset.filter(active=True)
+        if value == '0':
+            return queryset.filter(active=False)
+        if value and value.isdigit() and len(value) == 6:
+            try:
+                return queryset.active_in(int(value))
+            except ValueError:
+                pass
+        return queryset
+
+
+def active_column(description):
+    """Στήλη με το annotation active (with_active στο get_queryset)"""
+    @admin.display(boolean=True, description=description, ordering='active')
+    def active(self, obj):
+        return obj.active
+    return active
+
+
+def bundle_action(kind):
+    """Ενέργεια που φτιάχνει στο παρασκήνιο πακέτο (zip) με τα αρχεία των
+    επιλεγμένων (mis/jobs.py). Το αρχείο κατεβαίνει από την εργασία.
+    """
+    @admin.action(description='Πακέτο αρχείων των επιλεγμένων')
+    def make_bundle(modeladmin, request, queryset):
+        items = [(kind, pk) for pk in queryset.order_by('pk').values_list('pk', flat=True)]
+        job = jobs.submit_bundle(items)
+        url = reverse('admin:mis_exportjob_change', args=[job.pk])
+        modeladmin.message_user(request, format_html(
+            'Το πακέτο φτιάχνεται στο παρασκήνιο: <a href="{}">{}</a>', url, job))
+    return make_bundle
+
+
 # admin.site.register(mdl.ApasxolisiEidos)
 # admin.site.register(mdl.ApasxolisiType)
 # admin.site.register(mdl.ApdDetails)
@@ -21,6 +70,7 @@ class ApdAdmin(admin.ModelAdmin):
     inlines = [ApdDetailsLine]
     list_display = ['minas', 'etos', 'apdtype', 'ekdosi', 'misthodosies']
     list_filter = ['minas', 'etos', 'apdtype', 'ekdosi']
+    actions = [bundle_action('apd')]
 
 
 admin.site.register(mdl.Apd, ApdAdmin)
@@ -94,9 +144,14 @@ class ErgOikKatInLine(admin.TabularInline):
 
 
 class ErgazomenosAdmin(admin.ModelAdmin):
-    list_display = ['epo', 'ono', 'pat', 'afm', 'amka', 'ama']
+    list_display = ['epo', 'ono', 'pat', 'afm', 'amka', 'ama', 'active']
+    list_filter = [ActiveFilter]
     search_fields = ('epo', 'ono', 'afm')
     inlines = [ErgOikKatInLine, ]
+    active = active_column('Ενεργός')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_active()
 
 
 admin.site.register(mdl.Ergazomenos, ErgazomenosAdmin)
@@ -110,6 +165,24 @@ class ErgazomenosTypeAdmin(admin.ModelAdmin):
 # admin.site.register(mdl.ErgazomenosType, ErgazomenosTypeAdmin)
 
 
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'kind', 'status', 'progress', 'total', 'created',
+                    'finished', 'download']
+    list_filter = ['kind', 'status']
+    readonly_fields = ['kind', 'params', 'apd', 'fmy', 'status', 'progress', 'total',
+                       'key', 'filename', 'error', 'created', 'finished', 'download']
+
+    @admin.display(description='Αρχείο')
+    def download(self, obj):
+        if obj.status != mdl.ExportJob.DONE:
+            return '-'
+        url = reverse('export_job_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.filename)
+
+
+admin.site.register(mdl.ExportJob, ExportJobAdmin)
+
+
 class FormulaAdmin(admin.ModelAdmin):
     list_display = ['part', 'ergt', 'mist',
                     'apodt', 'evalu', 'meresefka', 'argiaefka']
@@ -128,6 +201,7 @@ class FmyAdmin(admin.ModelAdmin):
     inlines = [FmyDetailsLine]
     list_display = ['minas', 'etos']
     list_filter = ['minas', 'etos']
+    actions = [bundle_action('fmy')]
 
 
 # admin.site.register(mdl.FmyDetails)
@@ -203,11 +277,16 @@ class ProslipsiAdmin(admin.ModelAdmin):
         'last_apodoxes',
         'aptyp',
         'apeid',
-        'is_active'
+        'active'
     ]
-    list_filter = ['proslipsidate', 'eid', 'erg']
+    list_filter = [ActiveFilter, 'proslipsidate', 'eid', 'erg']
+    list_select_related = ['erg', 'eid', 'ergazomenostype', 'aptyp', 'apeid']
     autocomplete_fields = ['erg']
     search_fields = ['erg__epo', 'erg__ono', 'erg__afm', 'proslipsidate']
+    active = active_column('Ενεργός')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_active()
 
 
 admin.site.register(mdl.Proslipsi, ProslipsiAdmin)
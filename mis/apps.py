@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MisConfig(AppConfig):
     name = 'mis'
+
+    def ready(self):
+        from . import signals  # noqa: F401
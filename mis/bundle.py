@@ -0,0 +1,254 @@
+"""
+Πακέτο με όλα τα αρχεία ΑΠΔ και ΦΜΥ μιας χρονιάς (ή περιόδων)
+
+Οι μισθοδοσίες των δηλώσεων υπολογίζονται (snapshot) πρώτα στην κύρια
+διεργασία, ώστε οι διεργασίες να μη γράφουν ταυτόχρονα στη βάση. Μετά
+κάθε δήλωση φτιάχνεται σε ProcessPoolExecutor (mis/exports.py, με χρήση
+του cache των αρχείων). Το πακέτο είναι zip με τα αρχεία σε apd/ και fmy/
+και ένα manifest.json με τα σύνολα κάθε αρχείου και τους χρόνους.
+
+Με τον ίδιο τρόπο η ΑΠΔ μιας εταιρείας με πολλά παραρτήματα χωρίζεται σε
+ένα αρχείο ανά παράρτημα (build_branches).
+"""
+import json
+import os
+import tempfile
+import time
+import zipfile
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from utils.ziputil import stream_zip_members
+from . import exports
+from . import models as md
+from .compute import process_imap, process_map
+from .memo import payroll_memo
+
+
+def period_range(apo, eos=None):
+    """(από, έως) σε μορφή YYYYMM από έτος (YYYY) ή περίοδο (YYYYMM)"""
+    eos = apo if eos is None else eos
+    apo = apo * 100 + 1 if apo < 10000 else apo
+    eos = eos * 100 + 12 if eos < 10000 else eos
+    if apo > eos:
+        raise ValueError(f"Λάθος διάστημα περιόδων {apo}-{eos}")
+    return apo, eos
+
+
+def declarations(apo, eos):
+    """Οι ΑΠΔ και τα ΦΜΥ των περιόδων apo-eos (YYYYMM) ως (είδος, id)"""
+    apds = [
+        ("apd", apd.pk)
+        for apd in md.Apd.objects.filter(
+            etos__gte=apo // 100, etos__lte=eos // 100
+        ).select_related("minas").order_by("etos", "minas__code", "apdtype")
+        if apo <= int(f"{apd.etos}{apd.minas.code}") <= eos
+    ]
+    fmys = [
+        ("fmy", pk)
+        for pk in md.Fmy.objects.filter(period__gte=apo, period__lte=eos)
+        .order_by("period")
+        .values_list("pk", flat=True)
+    ]
+    return apds + fmys
+
+
+def snapshot(items, workers=None):
+    """Υπολογίζει τις μισθοδοσίες των δηλώσεων που δεν έχουν αποτέλεσμα"""
+    apds = [pk for kind, pk in items if kind == "apd"]
+    fmys = [pk for kind, pk in items if kind == "fmy"]
+    misthodosies = md.Misthodosia.objects.filter(
+        Q(pk__in=md.ApdDetails.objects.filter(apd__in=apds).values("mis"))
+        | Q(pk__in=md.FmyDetails.objects.filter(fmy__in=fmys).values("mis"))
+    )
+    for misthodosia in misthodosies.order_by("pk"):
+        misthodosia.snapshot(workers)
+
+
+def build_one(item):
+    """Ένα αρχείο του πακέτου (τρέχει και σε διεργασία)"""
+    kind, pk = item
+    start = time.perf_counter()
+    with payroll_memo.scope():
+        if kind == "apd":
+            declaration = md.Apd.objects.select_related("minas", "apdtype").get(pk=pk)
+            export = exports.apd_export(declaration)
+            meres, apodoxes, eisfores = declaration.calc_totals()
+            totals = {"meres": meres, "apodoxes": apodoxes, "eisfores": eisfores}
+        else:
+            declaration = md.Fmy.objects.select_related("minas").get(pk=pk)
+            export = exports.fmy_export(declaration)
+            totals = declaration.calc_totals()
+        path, temporary = _export_file(export)
+    return {
+        "kind": kind,
+        "id": pk,
+        "declaration": str(declaration),
+        "filename": f"{kind}/{export.filename}" if path is not None else None,
+        "key": export.key,
+        "size": os.path.getsize(path) if path is not None else 0,
+        "totals": {key: str(value) for key, value in totals.items()},
+        "seconds": round(time.perf_counter() - start, 3),
+        "path": path,
+        "temporary": temporary,
+    }
+
+
+def _export_file(export):
+    """(αρχείο, προσωρινό) με το zip της δήλωσης ή (None, False) χωρίς
+    δεδομένα
+
+    Το αρχείο είναι στο cache των αρχείων και μόνο αν το cache είναι κλειστό
+    γράφεται προσωρινό αρχείο (που σβήνει το build). Έτσι στην κύρια
+    διεργασία δεν επιστρέφονται τα bytes των αρχείων.
+    """
+    path = export.cached()
+    if path is not None:
+        return path, False
+    chunks = export.stream()
+    if chunks is None:
+        return None, False
+    if export.path() is not None:
+        for _ in chunks:
+            pass
+        return export.cached(), False
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    with os.fdopen(fd, "wb") as fil:
+        for chunk in chunks:
+            fil.write(chunk)
+    return path, True
+
+
+def workers():
+    """settings.MIS_BUNDLE_WORKERS ή όσες οι CPU (για τις εντολές, οι
+    εργασίες στο παρασκήνιο έχουν το mis.jobs.processes)
+    """
+    return getattr(settings, "MIS_BUNDLE_WORKERS", None) or os.cpu_count()
+
+
+def _map(func, items, workers, progress=None, mp_context=None):
+    """process_map για func που διαβάζουν τη βάση στις διεργασίες"""
+    if workers and workers > 1 and len(items) > 1:
+        # Οι διεργασίες ανοίγουν δικές τους συνδέσεις στη βάση
+        connections.close_all()
+    # Με spawn οι διεργασίες ξεκινούν χωρίς φορτωμένο το Django
+    return process_map(
+        func, items, workers, django.setup, progress, mp_context
+    )
+
+
+def _imap(func, items, workers, mp_context=None):
+    """Όπως το _map, αλλά τα αποτελέσματα ένα-ένα (compute.process_imap)"""
+    if workers and workers > 1 and len(items) > 1:
+        connections.close_all()
+    return process_imap(func, items, workers, django.setup, mp_context)
+
+
+def build(items, fileobj, workers=None, progress=None, mp_context=None):
+    """Γράφει στο fileobj το πακέτο των δηλώσεων items ((είδος, id)) και
+    επιστρέφει το manifest
+
+    workers   : Αριθμός διεργασιών. Με None ή 1 τα αρχεία φτιάχνονται
+                σειριακά.
+    progress  : Καλείται με το πλήθος των αρχείων που έχουν γίνει
+    mp_context: Το multiprocessing context των διεργασιών (βλ.
+                compute.process_imap). Με context οι μισθοδοσίες
+                υπολογίζονται σειριακά.
+    """
+    start = time.perf_counter()
+    snapshot(items, workers if mp_context is None else None)
+    snapshot_time = time.perf_counter() - start
+    files = _map(build_one, items, workers, progress, mp_context)
+    paths = [(fil.pop("path"), fil.pop("temporary")) for fil in files]
+    try:
+        with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_STORED) as bundle:
+            for fil, (path, _) in zip(files, paths):
+                if path is not None:
+                    bundle.write(path, fil["filename"])
+            elapsed = time.perf_counter() - start
+            manifest = {
+                "files": files,
+                "timing": {
+                    "workers": workers or 1,
+                    "snapshot": round(snapshot_time, 3),
+                    "files": round(sum(fil["seconds"] for fil in files), 3),
+                    "total": round(elapsed, 3),
+                },
+            }
+            bundle.writestr(
+                "manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2)
+            )
+    finally:
+        for path, temporary in paths:
+            if temporary:
+                os.remove(path)
+    return manifest
+
+
+def build_branch(item):
+    """Οι γραμμές ενός αρχείου του zip της ΑΠΔ (Apd.apd_members) και ο
+    χρόνος του (τρέχει και σε διεργασία)
+    """
+    apd_pk, result_pks, name, totals = item
+    start = time.perf_counter()
+    with payroll_memo.scope():
+        declaration = md.Apd.objects.select_related("minas", "apdtype").get(pk=apd_pk)
+        # Με τη σειρά του Apd.results, που κρατάει και τη σειρά των εγγραφών
+        by_pk = md.MisthodosiaResult.objects.in_bulk(result_pks)
+        results = [by_pk[pk] for pk in result_pks]
+        lines = list(dict(declaration.apd_members(results, totals))[name])
+    return lines, round(time.perf_counter() - start, 3)
+
+
+def build_branches(apd, fileobj, workers=None):
+    """Γράφει στο fileobj το zip της ΑΠΔ (τα ίδια αρχεία με το
+    Apd.apd_members, ένα CSL01 ανά παράρτημα) με manifest.json και
+    επιστρέφει το manifest
+
+    Τα αποτελέσματα και τα σύνολα όλων των παραρτημάτων υπολογίζονται μία
+    φορά στην κύρια διεργασία (Apd.totals_by_parartima) και κάθε αρχείο
+    φτιάχνεται σε δική του διεργασία.
+    """
+    start = time.perf_counter()
+    results = apd.results()
+    totals = apd.totals_by_parartima(results)
+    branches = apd.apd_branches(results)
+    files = []
+    for name, parartima in branches:
+        meres, apodoxes, eisfores = (
+            (0, 0, 0) if parartima is None else totals[parartima.pk]
+        )
+        files.append(
+            {
+                "parartima": "" if parartima is None else str(parartima),
+                "parno": None if parartima is None else parartima.parno,
+                "ypno": None if parartima is None else parartima.efkayp.ypno,
+                "filename": name,
+                "totals": {
+                    "meres": str(meres),
+                    "apodoxes": str(apodoxes),
+                    "eisfores": str(eisfores),
+                },
+            }
+        )
+    manifest = {"declaration": str(apd), "files": files}
+    result_pks = [result.pk for result in results]
+    items = [(apd.pk, result_pks, name, totals) for name, _ in branches]
+
+    def members():
+        rendered = _imap(build_branch, items, workers)
+        for fil, (lines, seconds) in zip(files, rendered):
+            fil["seconds"] = seconds
+            yield fil["filename"], lines
+        manifest["timing"] = {
+            "workers": workers or 1,
+            "files": round(sum(fil["seconds"] for fil in files), 3),
+            "total": round(time.perf_counter() - start, 3),
+        }
+        # ASCII, ώστε να διαβάζεται ίδιο με την κωδικοποίηση των CSL01
+        yield "manifest.json", json.dumps(manifest, indent=2).split("\n")
+
+    for chunk in stream_zip_members(members(), date_time=apd.ekdosi):
+        fileobj.write(chunk)
+    return manifest
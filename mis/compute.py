@@ -0,0 +1,191 @@
+"""
+Υπολογισμός της μισθοδοσίας ανά εργαζόμενο με απλά δεδομένα (tuples,
+dict, Decimal) αντί για αντικείμενα του ORM.
+
+Ο υπολογισμός κάθε εργαζομένου είναι ανεξάρτητος από τους υπόλοιπους,
+οπότε οι εργαζόμενοι μπορούν να μοιραστούν σε ομάδες και να υπολογιστούν
+παράλληλα σε διεργασίες (concurrent.futures.ProcessPoolExecutor). Τόσο ο
+σειριακός όσο και ο παράλληλος υπολογισμός περνούν από την calc_employee,
+άρα δίνουν το ίδιο αποτέλεσμα.
+
+Τα ποσά του αποτελέσματος είναι utils.money.Money (ακέραια λεπτά). Η
+μετατροπή σε Decimal γίνεται όταν περνούν στα μοντέλα.
+
+Το module δεν χρησιμοποιεί το Django ώστε να φορτώνεται γρήγορα στις
+διεργασίες.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from utils.forologia import calc_foros_eea_periodou
+from utils.formula import formulas
+from utils.money import Money
+
+# Τύπος υπολογισμού (Formula)
+FormulaData = namedtuple("FormulaData", "pk evalu apodt_id meresefka argiaefka")
+# Τα κοινά δεδομένα της μισθοδοσίας
+# formulas : {(ptyp_id, ergt_id): FormulaData} για τον τύπο μισθοδοσίας
+# plirotees: Τα id των τύπων αποδοχών ΕΦΚΑ που πληρώνονται
+PayrollData = namedtuple("PayrollData", "etos barytis formulas plirotees")
+# Τα δεδομένα ενός εργαζομένου για την περίοδο της μισθοδοσίας
+# parousies: ((ptyp_id, val, apo, eos), ...)
+# kpks     : ((eidkek_id, perg, ptot), ...) τα ποσοστά ΚΠΚ της περιόδου
+EmployeeData = namedtuple(
+    "EmployeeData",
+    "pro_id ergt_id misthos imeromisthio oromisthio paidia parousies kpks",
+)
+# Το αποτέλεσμα ενός εργαζομένου
+# apodoxes: {apodt_id: vals} με τη δομή της Misthodosia.calc_misthodosia,
+#           κλειδί στα kratiseis το eidkek_id και ποσά Money
+# missing : Τα ptyp_id χωρίς τύπο υπολογισμού
+# foroi   : Τα ποσά (Money) της γραμμής στη μισθοδοτική κατάσταση
+EmployeeResult = namedtuple("EmployeeResult", "pro_id apodoxes missing foroi")
+
+FOROI_FIELDS = (
+    "meres",
+    "apodoxes",
+    "kr_enos",
+    "kr_etis",
+    "kr_total",
+    "forologiteo",
+    "foros",
+    "eea",
+    "pliroteo",
+)
+
+
+def calc_employee(payroll, emp):
+    """Αποδοχές, κρατήσεις και φόροι ενός εργαζομένου"""
+    # Για την ΑΠΔ, 0 αν δεν είναι ημερομίσθιος
+    imeromisthio_apd = emp.imeromisthio if emp.ergt_id == 2 else 0
+    apodoxes = {}
+    missing = []
+    for ptyp_id, val, apo, eos in emp.parousies:
+        frm = payroll.formulas.get((ptyp_id, emp.ergt_id))
+        if frm is None:
+            missing.append(ptyp_id)
+            continue
+        apod = Money.of(
+            formulas.get(frm.pk, frm.evalu)(
+                val=val,
+                misthos=emp.misthos,
+                imeromisthio=emp.imeromisthio,
+                oromisthio=emp.oromisthio,
+            )
+        )
+        if not apod:
+            continue
+        vals = apodoxes.setdefault(
+            frm.apodt_id,
+            {
+                "apod": Money(),
+                "meres": 0,
+                "argia": 0,
+                "apo": "",
+                "eos": "",
+                "imeromisthio": imeromisthio_apd,
+            },
+        )
+        vals["apod"] += apod
+        vals["meres"] += val if frm.meresefka else 0
+        vals["argia"] += val if frm.argiaefka else 0
+        vals["apo"] = apo
+        vals["eos"] = eos
+    foroi = dict.fromkeys(FOROI_FIELDS, Money())
+    foroi["meres"] = 0
+    for apodt_id, vals in apodoxes.items():
+        vals["kratiseis"] = {}
+        for eidkek_id, perg, ptot in emp.kpks:
+            kr_enos = vals["apod"].percent(perg)
+            kr_total = vals["apod"].percent(ptot)
+            vals["kratiseis"][eidkek_id] = {
+                "enos": kr_enos,
+                "etis": kr_total - kr_enos,
+                "total": kr_total,
+            }
+        # Αν ο τύπος αποδοχών δεν είναι για πληρωμή (πχ 18.Αναστολή )
+        if apodt_id not in payroll.plirotees:
+            continue
+        foroi["meres"] += vals["meres"]
+        foroi["apodoxes"] += vals["apod"]
+        for vls in vals["kratiseis"].values():
+            foroi["kr_enos"] += vls["enos"]
+            foroi["kr_etis"] += vls["etis"]
+            foroi["kr_total"] += vls["total"]
+    if apodoxes:
+        foroi["forologiteo"] = foroi["apodoxes"] - foroi["kr_enos"]
+        foroi["foros"], foroi["eea"] = calc_foros_eea_periodou(
+            payroll.etos, foroi["forologiteo"], emp.paidia, payroll.barytis
+        )
+        foroi["pliroteo"] = foroi["forologiteo"] - foroi["foros"] - foroi["eea"]
+    return EmployeeResult(emp.pro_id, apodoxes, missing, foroi)
+
+
+def calc_chunk(payroll, employees):
+    return [calc_employee(payroll, emp) for emp in employees]
+
+
+def chunks(items, size):
+    return [items[idx : idx + size] for idx in range(0, len(items), size)]
+
+
+def process_imap(func, items, workers=None, initializer=None, mp_context=None):
+    """Τα func(item) με τη σειρά των items, καθένα μόλις είναι έτοιμο, σε
+    workers διεργασίες
+
+    Με None ή 1 worker (ή ένα item) τρέχει σειριακά στην ίδια διεργασία.
+    initializer: Τρέχει μία φορά σε κάθε διεργασία (ProcessPoolExecutor)
+    mp_context : Το multiprocessing context των διεργασιών (π.χ. spawn όταν
+                 η διεργασία έχει νήματα). Με None το default (fork).
+    """
+    items = list(items)
+    if not workers or workers <= 1 or len(items) < 2:
+        for item in items:
+            yield func(item)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=initializer, mp_context=mp_context
+    ) as pool:
+        yield from pool.map(func, items)
+
+
+def process_map(
+    func, items, workers=None, initializer=None, progress=None, mp_context=None
+):
+    """[func(item)] με τη σειρά των items (βλ. process_imap)
+
+    progress: Καλείται με το πλήθος των αποτελεσμάτων μετά από το καθένα
+    """
+    results = []
+    for result in process_imap(func, items, workers, initializer, mp_context):
+        results.append(result)
+        if progress is not None:
+            progress(len(results))
+    return results
+
+
+def calc_employees(
+    payroll, employees, workers=None, chunksize=None, vectorized=False
+):
+    """Υπολογίζει τους εργαζόμενους με τη σειρά που δόθηκαν
+
+    workers   : Αριθμός διεργασιών. Με None ή 1 ο υπολογισμός είναι σειριακός
+    chunksize : Εργαζόμενοι ανά ομάδα (εξ ορισμού 4 ομάδες ανά διεργασία)
+    vectorized: Υπολογισμός όλων μαζί με NumPy (mis.vectorized) στην ίδια
+                διεργασία. Χωρίς numpy γίνεται ο σειριακός υπολογισμός.
+    """
+    employees = list(employees)
+    if vectorized:
+        from .vectorized import calc_employees as calc_vectorized
+
+        return calc_vectorized(payroll, employees)
+    if not workers or workers <= 1 or len(employees) < 2:
+        return calc_chunk(payroll, employees)
+    if chunksize is None:
+        chunksize = max(1, -(-len(employees) // (workers * 4)))
+    results = []
+    for chunk in process_map(
+        partial(calc_chunk, payroll), chunks(employees, chunksize), workers
+    ):
+        results.extend(chunk)
+    return results
@@ -0,0 +1,252 @@
+"""
+Cache των αρχείων ΑΠΔ και ΦΜΥ (zip) στο δίσκο
+
+Κάθε αρχείο αποθηκεύεται στο settings.MIS_EXPORT_CACHE_DIR με όνομα το
+sha256 όλων των δεδομένων από τα οποία φτιάχνεται:
+
+- η δήλωση (έτος, περίοδος, τύπος, ημερομηνία έκδοσης)
+- οι εταιρείες, τα παραρτήματα και τα υποκαταστήματα ΕΦΚΑ τους
+- η έκδοση του αποτελέσματος κάθε μισθοδοσίας (input_version)
+- τα στοιχεία των εργαζομένων και των ειδικοτήτων που γράφονται στο
+  αρχείο (δεν αλλάζουν την έκδοση του αποτελέσματος)
+- το EXPORT_VERSION, που αλλάζει όταν αλλάζει η μορφή των αρχείων
+
+Το zip γράφεται με ημερομηνία την ημερομηνία έκδοσης της δήλωσης, οπότε
+τα ίδια δεδομένα δίνουν ακριβώς τα ίδια bytes. Το hash είναι και το ETag
+της απάντησης. Τα αρχεία δεν σβήνονται ποτέ από εδώ. Ένα παλιό αρχείο
+απλά δεν ξαναζητιέται.
+"""
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from utils.ziputil import stream_zip_members
+from . import models as md
+
+EXPORT_VERSION = 2
+
+
+def _row(obj):
+    """Οι τιμές όλων των πεδίων της εγγραφής ως κείμενο (ή None)"""
+    if obj is None:
+        return None
+    return tuple(
+        (field.attname, str(getattr(obj, field.attname)))
+        for field in obj._meta.concrete_fields
+    )
+
+
+def _company_rows():
+    """Όλα τα παραρτήματα (η ΑΠΔ έχει ένα αρχείο ανά παράρτημα) και όλες οι
+    εταιρείες
+    """
+    companies = md.Company.objects.select_related("ctyp").order_by("pk")
+    parartimata = md.CompanyParartima.objects.select_related("efkayp").order_by(
+        "pk"
+    )
+    return (
+        [(_row(company), _row(company.ctyp)) for company in companies],
+        [(_row(parartima), _row(parartima.efkayp)) for parartima in parartimata],
+    )
+
+
+def _person_rows(results):
+    """Τα στοιχεία εργαζομένων, προσλήψεων και ειδικοτήτων των results"""
+    lines = list(
+        md.MisthodosiaResultLine.objects.filter(result__in=results)
+        .order_by("result_id", "pro_id")
+        .values_list(
+            "result_id",
+            "pro_id",
+            "pro__parartima__parno",
+            "pro__apeid__plires_orario",
+            "pro__apeid__oles_ergasimes",
+            "pro__eid_id",
+            "pro__erg__ama",
+            "pro__erg__amka",
+            "pro__erg__epo",
+            "pro__erg__ono",
+            "pro__erg__pat",
+            "pro__erg__mit",
+            "pro__erg__gen",
+            "pro__erg__afm",
+        )
+    )
+    eids = {line[5] for line in lines}
+    keks = list(
+        md.EidikotitaKek.objects.filter(eid__in=eids)
+        .order_by("pk")
+        .values_list("pk", "eid_id", "kad", "eidefka", "kpk__kpk")
+    )
+    return lines, keks
+
+
+def export_key(declaration, details):
+    """sha256 (hex) των δεδομένων της δήλωσης (Apd ή Fmy)
+
+    details: Οι γραμμές της δήλωσης (ApdDetails ή FmyDetails)
+    """
+    results = [detail.mis.snapshot() for detail in details]
+    data = (
+        EXPORT_VERSION,
+        type(declaration).__name__,
+        _row(declaration),
+        getattr(declaration.minas, "code", None),
+        _company_rows(),
+        [(result.misthodosia_id, result.input_version()) for result in results],
+        _person_rows(results),
+    )
+    return hashlib.sha256(repr(data).encode("utf-8")).hexdigest()
+
+
+class Export:
+    """Ένα αρχείο ΑΠΔ ή ΦΜΥ
+
+    key      : Το hash των δεδομένων του (export_key)
+    filename : Το όνομα του zip για τον χρήστη
+    members  : Συνάρτηση που δίνει τα αρχεία μέσα στο zip ως
+               [(όνομα, εγγραφές)] (ή None αν δεν υπάρχουν δεδομένα)
+    date_time: Η ημερομηνία των αρχείων μέσα στο zip
+    records  : Συνάρτηση που δίνει (περίπου) το πλήθος των εγγραφών
+    """
+
+    def __init__(self, key, filename, members, date_time, records):
+        self.key = key
+        self.filename = filename
+        self.members = members
+        self.date_time = date_time
+        self.records = records
+
+    @property
+    def etag(self):
+        return f'"{self.key}"'
+
+    def path(self):
+        """Το αρχείο στο cache ή None αν το cache είναι κλειστό"""
+        folder = getattr(settings, "MIS_EXPORT_CACHE_DIR", None)
+        if not folder:
+            return None
+        return os.path.join(folder, self.key[:2], f"{self.key}.zip")
+
+    def cached(self):
+        """Το αρχείο στο cache αν υπάρχει"""
+        path = self.path()
+        if path is not None and os.path.exists(path):
+            return path
+        return None
+
+    def stream(self, progress=None, every=500):
+        """Τα bytes του zip. Αν το cache είναι ανοιχτό γράφονται και σε
+        προσωρινό αρχείο που μετονομάζεται μόνο όταν ολοκληρωθεί.
+
+        progress: Καλείται με το πλήθος των εγγραφών κάθε every εγγραφές
+        """
+        members = self.members()
+        if members is None:
+            return None
+        if progress is not None:
+            members = _counted(members, progress, every)
+        chunks = stream_zip_members(members, date_time=self.date_time)
+        path = self.path()
+        if path is None:
+            return chunks
+        return self._tee(chunks, path)
+
+    def _tee(self, chunks, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fil:
+                for chunk in chunks:
+                    fil.write(chunk)
+                    yield chunk
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def content(self):
+        """Όλα τα bytes του zip (από το cache αν υπάρχει) ή None"""
+        path = self.cached()
+        if path is None:
+            chunks = self.stream()
+            if chunks is None:
+                return None
+            return b"".join(chunks)
+        with open(path, "rb") as fil:
+            return fil.read()
+
+
+def _counted(members, progress, every):
+    """Τα members με μέτρηση των εγγραφών όλων μαζί"""
+    count = 0
+
+    def counted(lines):
+        nonlocal count
+        for line in lines:
+            yield line
+            count += 1
+            if count % every == 0:
+                progress(count)
+
+    for name, lines in members:
+        yield name, counted(lines)
+    progress(count)
+
+
+def _results(details):
+    return md.MisthodosiaResult.objects.filter(
+        misthodosia__in=[detail.mis_id for detail in details]
+    )
+
+
+def apd_export(apd):
+    details = list(apd.apddetails_set.select_related("mis"))
+
+    def records():
+        # Εγγραφές 1 και EOF ανά παράρτημα, μία ανά εργαζόμενο και μία ανά
+        # κράτηση
+        results = _results(details)
+        lines = md.MisthodosiaResultLine.objects.filter(result__in=results)
+        employees = lines.values("pro").distinct().count()
+        parartimata = lines.values("pro__parartima").distinct().count()
+        kratiseis = md.MisthodosiaResultKratisi.objects.filter(
+            result__in=results
+        ).count()
+        return 2 * max(parartimata, 1) + employees + kratiseis
+
+    return Export(
+        export_key(apd, details),
+        apd.apd_filename(),
+        apd.apd_members,
+        apd.ekdosi,
+        records,
+    )
+
+
+def fmy_export(fmy):
+    details = list(fmy.fmydetails_set.select_related("mis"))
+
+    def records():
+        # Εγγραφές 0, 1, 2 και μία ανά εργαζόμενο
+        employees = (
+            md.MisthodosiaResultLine.objects.filter(result__in=_results(details))
+            .values("pro__erg__afm")
+            .distinct()
+            .count()
+        )
+        return 3 + employees
+
+    def members():
+        lines = fmy.fmy_lines()
+        if lines is None:
+            return None
+        return [("JL10", lines)]
+
+    return Export(
+        export_key(fmy, details),
+        fmy.fmy_filename(),
+        members,
+        fmy.cdate,
+        records,
+    )
@@ -0,0 +1,297 @@
+"""
+Δημιουργία αρχείων ΑΠΔ και ΦΜΥ (και πακέτων αρχείων ή αποδείξεων) στο
+παρασκήνιο
+
+Οι εργασίες (ExportJob) τρέχουν σε ThreadPoolExecutor της ίδιας διεργασίας
+με settings.MIS_EXPORT_WORKERS νήματα, χωρίς εξωτερικό broker. Με 0 νήματα
+η εργασία τρέχει αμέσως στο submit (εντολές, tests). Η κατάσταση και το
+πλήθος των εγγραφών αποθηκεύονται στη βάση καθώς γράφεται το αρχείο. Από
+εκεί τα διαβάζει η σελίδα της δήλωσης.
+
+Κάθε εργασία γράφει στη βάση τη διεργασία που την τρέχει (owner, host:pid)
+και ανανεώνει το heartbeat όσο προχωράει, ώστε με πολλές διεργασίες (π.χ.
+workers του gunicorn) η κατάσταση να κρίνεται από τη βάση. Μια εργασία σε
+αναμονή ή σε εξέλιξη θεωρείται χαμένη και στη θέση της ξεκινά νέα μόνο αν
+(is_lost):
+- είναι αυτής της διεργασίας και δεν τρέχει πια σε αυτή,
+- είναι διεργασίας του ίδιου host που δεν υπάρχει πια ή
+- δεν έχει ενημερωθεί για settings.MIS_EXPORT_JOB_TIMEOUT δευτερόλεπτα.
+
+Τα πακέτα και οι αποδείξεις τρέχουν σειριακά στο νήμα της εργασίας ή σε
+settings.MIS_JOB_PROCESSES διεργασίες που ξεκινούν με spawn (όχι fork από
+διεργασία με νήματα). Οι διεργασίες δεν επιστρέφουν όλα τα αρχεία μαζί:
+τα αρχεία των δηλώσεων μένουν στο cache και οι αποδείξεις γράφονται στο
+zip μόλις γίνει η καθεμία.
+"""
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from . import bundle
+from . import models as md
+from . import payslips
+from .memo import payroll_memo
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+# job id -> Future των εργασιών αυτής της διεργασίας
+_futures = {}
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=workers(),
+                thread_name_prefix="mis-export",
+            )
+        return _executor
+
+
+def workers():
+    return getattr(settings, "MIS_EXPORT_WORKERS", 1)
+
+
+def processes():
+    """Διεργασίες για τα πακέτα και τις αποδείξεις (settings.MIS_JOB_PROCESSES)"""
+    return getattr(settings, "MIS_JOB_PROCESSES", 1)
+
+
+def mp_context():
+    """Οι εργασίες τρέχουν σε νήμα, οπότε οι διεργασίες τους ξεκινούν με spawn
+    (το fork μιας διεργασίας με νήματα μπορεί να κολλήσει σε locks)
+    """
+    return multiprocessing.get_context("spawn")
+
+
+def timeout():
+    return getattr(settings, "MIS_EXPORT_JOB_TIMEOUT", 600)
+
+
+def owner():
+    """host:pid αυτής της διεργασίας"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def is_lost(job):
+    """Η εργασία σε αναμονή ή σε εξέλιξη δεν τρέχει πια πουθενά"""
+    if job.owner == owner():
+        future = _futures.get(job.pk)
+        return future is None or future.done()
+    host, _, pid = job.owner.rpartition(":")
+    if host == socket.gethostname() and pid.isdigit() and not _pid_exists(int(pid)):
+        return True
+    heartbeat = job.heartbeat or job.created
+    return timezone.now() - heartbeat > timedelta(seconds=timeout())
+
+
+def submit(apd=None, fmy=None, kind=md.ExportJob.EXPORT, params=None):
+    """Η εργασία για την ΑΠΔ ή το ΦΜΥ (ή για το kind με τα params). Αν
+    τρέχει ήδη ίδια εργασία επιστρέφεται αυτή.
+
+    Ο έλεγχος και η δημιουργία γίνονται μαζί (κλειδωμένα στη διεργασία
+    και σε μία συναλλαγή με select_for_update για τις άλλες διεργασίες),
+    ώστε να μη γίνουν δύο ίδιες εργασίες.
+    """
+    params = params or {}
+    active = md.ExportJob.objects.filter(
+        kind=kind,
+        apd=apd,
+        fmy=fmy,
+        params=params,
+        status__in=[md.ExportJob.PENDING, md.ExportJob.RUNNING],
+    )
+    pool = executor() if workers() > 0 else None
+    with _lock:
+        with transaction.atomic():
+            for job in active.select_for_update():
+                if not is_lost(job):
+                    return job
+                md.ExportJob.objects.filter(pk=job.pk).update(
+                    status=md.ExportJob.FAILED,
+                    error="Η εργασία διακόπηκε",
+                    finished=timezone.now(),
+                )
+            job = md.ExportJob.objects.create(
+                kind=kind,
+                params=params,
+                apd=apd,
+                fmy=fmy,
+                owner=owner(),
+                heartbeat=timezone.now(),
+            )
+        # Μετά το commit, ώστε το νήμα να βρίσκει την εργασία, αλλά πριν
+        # ανοίξει το _lock, ώστε το is_lost να βρίσκει το future
+        if pool is not None:
+            future = _futures[job.pk] = pool.submit(_run_thread, job.pk)
+    if pool is None:
+        run(job.pk)
+    else:
+        future.add_done_callback(lambda _: _forget(job.pk))
+    job.refresh_from_db()
+    return job
+
+
+def _forget(job_id):
+    with _lock:
+        _futures.pop(job_id, None)
+
+
+def _run_thread(job_id):
+    close_old_connections()
+    try:
+        run(job_id)
+    finally:
+        connection.close()
+
+
+def submit_bundle(items):
+    """Η εργασία για πακέτο με τα αρχεία των δηλώσεων items ((είδος, id))"""
+    return submit(
+        kind=md.ExportJob.BUNDLE,
+        params={"items": [[kind, pk] for kind, pk in items]},
+    )
+
+
+def submit_payslips(misthodosia):
+    """Η εργασία για τις αποδείξεις πληρωμής της misthodosia"""
+    return submit(kind=md.ExportJob.PAYSLIPS, params={"misthodosia": misthodosia.pk})
+
+
+def run(job_id):
+    """Εκτελεί την εργασία: γράφει το αρχείο στο cache των αρχείων"""
+    job = md.ExportJob.objects.select_related("apd", "fmy").get(pk=job_id)
+    try:
+        with payroll_memo.scope():
+            job.status = RUNNERS[job.kind](job)
+    except Exception as err:
+        logger.exception("Export job %s failed", job_id)
+        job.status = md.ExportJob.FAILED
+        job.error = f"{type(err).__name__}: {err}"
+    job.finished = timezone.now()
+    job.save()
+    return job
+
+
+def _start(job):
+    job.status = md.ExportJob.RUNNING
+    job.heartbeat = timezone.now()
+    job.save(update_fields=["key", "filename", "total", "status", "heartbeat"])
+
+
+def _progress(job):
+    """Συνάρτηση που γράφει στη βάση το progress και το heartbeat"""
+
+    def progress(count):
+        job.progress = count
+        job.heartbeat = timezone.now()
+        md.ExportJob.objects.filter(pk=job.pk).update(
+            progress=count, heartbeat=job.heartbeat
+        )
+
+    return progress
+
+
+def _run_export(job):
+    export = job.export()
+    if export.path() is None:
+        raise ImproperlyConfigured(
+            "Οι εργασίες αρχείων χρειάζονται το MIS_EXPORT_CACHE_DIR"
+        )
+    job.key = export.key
+    job.filename = export.filename
+    job.total = export.records()
+    _start(job)
+    if export.cached() is not None:
+        job.progress = job.total
+        return md.ExportJob.DONE
+    chunks = export.stream(_progress(job))
+    if chunks is None:
+        return md.ExportJob.EMPTY
+    for _ in chunks:
+        pass
+    job.total = job.progress
+    return md.ExportJob.DONE
+
+
+def _run_bundle(job):
+    """Το πακέτο των δηλώσεων στο path() της εργασίας (progress ανά αρχείο)"""
+    items = [tuple(item) for item in job.params["items"]]
+    kinds = "-".join(sorted({kind for kind, _ in items}))
+    job.filename = f"{kinds}-bundle.zip"
+    job.total = len(items)
+    path = job.path()
+    if path is None:
+        raise ImproperlyConfigured(
+            "Οι εργασίες αρχείων χρειάζονται το MIS_EXPORT_CACHE_DIR"
+        )
+    _start(job)
+    with _output(path) as fil:
+        bundle.build(items, fil, processes(), _progress(job), mp_context())
+    return md.ExportJob.DONE
+
+
+def _run_payslips(job):
+    """Οι αποδείξεις σε zip στο path() της εργασίας (progress ανά PDF)"""
+    misthodosia = md.Misthodosia.objects.get(pk=job.params["misthodosia"])
+    job.filename = f"apodeixeis-{misthodosia.pk}.zip"
+    # Ένα PDF ανά εργαζόμενο και ένα με όλες τις αποδείξεις
+    job.total = misthodosia.snapshot().lines.count() + 1
+    path = job.path()
+    if path is None:
+        raise ImproperlyConfigured(
+            "Οι εργασίες αρχείων χρειάζονται το MIS_EXPORT_CACHE_DIR"
+        )
+    _start(job)
+    with _output(path) as fil:
+        payslips.build(
+            misthodosia,
+            fil,
+            processes(),
+            progress=_progress(job),
+            mp_context=mp_context(),
+        )
+    return md.ExportJob.DONE
+
+
+@contextmanager
+def _output(path):
+    """Αρχείο για γράψιμο που παίρνει το όνομα path μόνο αν ολοκληρωθεί"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fil:
+            yield fil
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+RUNNERS = {
+    md.ExportJob.EXPORT: _run_export,
+    md.ExportJob.BUNDLE: _run_bundle,
+    md.ExportJob.PAYSLIPS: _run_payslips,
+}
@@ -0,0 +1,181 @@
+"""
+Οι εγγραφές των αρχείων ΑΠΔ (ΕΦΚΑ, CSL01) και ΦΜΥ (ΑΑΔΕ, JL10)
+"""
+from utils.layout import Field as F, Layout
+
+# ΑΠΔ εγγραφή 1: Στοιχεία εργοδότη και σύνολα
+APD_HEADER = Layout(
+    "APD_HEADER",
+    414,
+    [
+        F("record", 1, value="1"),
+        F("diktyo", 2, value="01"),
+        F("ekdosi_arxeiou", 2, value="01"),
+        F("arxeio", 8, value="CSL01"),
+        F("eidos", 2, value="01"),
+        F("apdtype", 2, "zeros"),
+        F("ypno", 3, "zeros"),
+        F("ypnam", 50),
+        F("epon", 80),
+        F("name", 30),
+        F("patr", 30),
+        F("ame", 10),
+        F("afm", 9),
+        F("adodo", 50),
+        F("adnum", 10),
+        F("adtk", 5),
+        F("adpol", 30),
+        F("apo_minas", 2),
+        F("apo_etos", 4),
+        F("eos_minas", 2),
+        F("eos_etos", 4),
+        F("meres", 8, "zeros"),
+        F("apodoxes", 12, "money"),
+        F("eisfores", 12, "money"),
+        F("ekdosi", 8, "date"),
+        F("paysi", 8, "date", value=""),
+        F("keno", 30, value=""),
+    ],
+)
+
+# ΑΠΔ εγγραφή 2: Στοιχεία ασφαλισμένου
+APD_ERGAZOMENOS = Layout(
+    "APD_ERGAZOMENOS",
+    178,
+    [
+        F("record", 1, value="2"),
+        F("ama", 9, "zeros"),
+        F("amka", 11, "exact"),
+        F("epo", 50),
+        F("ono", 30),
+        F("pat", 30),
+        F("mit", 30),
+        F("gen", 8, "date"),
+        F("afm", 9, "exact"),
+    ],
+)
+
+# ΑΠΔ εγγραφή 3: Αποδοχές και εισφορές ανά τύπο αποδοχών και ΚΠΚ
+APD_EISFORES = Layout(
+    "APD_EISFORES",
+    138,
+    [
+        F("record", 1, value="3"),
+        F("parno", 4, "zeros"),
+        F("kad", 4, "exact"),
+        F("plires_orario", 1, "exact"),
+        F("oles_ergasimes", 1, "exact"),
+        F("argia", 1, "zeros"),
+        F("eidefka", 6, "exact"),
+        F("eidikes_periptoseis", 2, value="00"),
+        F("kpk", 4, "zeros"),
+        F("minas", 2),
+        F("etos", 4),
+        F("apo", 8, "date"),
+        F("eos", 8, "date"),
+        F("apodtypeefka", 2, "exact"),
+        F("meres", 3, "zeros"),
+        F("imeromisthio", 10, "money"),
+        F("apodoxes", 10, "money"),
+        F("enos", 10, "money"),
+        F("etis", 10, "money"),
+        F("total", 11, "money"),
+        F("epidotisi_poso", 10, "money", value=0),
+        F("epidotisi_pososto", 5, "money", value=0),
+        F("epidotisi_eisfora", 10, "money", value=0),
+        F("katavlitees", 11, "money"),
+    ],
+)
+
+# ΦΜΥ εγγραφή 0: Αρχείο
+FMY_HEADER = Layout(
+    "FMY_HEADER",
+    148,
+    [
+        F("record", 1, value="0"),
+        F("arxeio", 8, value="JL10"),
+        F("cdate", 8, "exact"),
+        F("etos", 4, "exact"),
+        F("keno", 127, value=""),
+    ],
+)
+
+# ΦΜΥ εγγραφή 1: Στοιχεία εργοδότη
+FMY_ERGODOTIS = Layout(
+    "FMY_ERGODOTIS",
+    148,
+    [
+        F("record", 1, value="1"),
+        F("etos", 4, "exact"),
+        F("epon", 18, "cut"),
+        F("name", 9, "cut"),
+        F("patr", 3, "cut"),
+        F("fmytype", 1, "exact"),
+        F("afm", 9, "cut"),
+        F("dra", 16, "cut"),
+        F("adpol", 10, "cut"),
+        F("adodo", 16, "cut"),
+        F("adnum", 5, "cut"),
+        F("adtk", 5, "cut"),
+        F("minas", 2),
+        F("keno", 49, value=""),
+    ],
+)
+
+# ΦΜΥ εγγραφή 2: Σύνολα
+FMY_SYNOLA = Layout(
+    "FMY_SYNOLA",
+    148,
+    [
+        F("record", 1, value="2"),
+        F("apo", 16, "money"),
+        F("kra", 16, "money"),
+        F("kath", 16, "money"),
+        F("parakratisi", 15, "money", value=0),
+        F("foros", 15, "money"),
+        F("eea", 15, "money"),
+        F("xartosimo", 14, "money", value=0),
+        F("oga", 13, "money", value=0),
+        F("keno", 27, value=""),
+    ],
+)
+
+# ΦΜΥ εγγραφή 3: Δικαιούχος
+FMY_DIKAIOUXOS = Layout(
+    "FMY_DIKAIOUXOS",
+    148,
+    [
+        F("record", 1, value="3"),
+        F("afm", 9, "exact"),
+        F("keno1", 1, value=""),
+        F("epo", 18, "cut"),
+        F("ono", 9, "cut"),
+        F("pat", 3, "cut"),
+        F("amka", 11),
+        F("paidia", 2, "zeros"),
+        F("eidos", 2, value="01"),
+        F("apo", 11, "money"),
+        F("kra", 10, "money"),
+        F("kath", 11, "money"),
+        F("eidos_foros", 1, value="0"),
+        F("keno2", 2, value=""),
+        F("ekso", 2, "zeros", value=0),
+        F("ekso_poso", 5, "zeros", value=0),
+        F("foros", 10, "money"),
+        F("eea", 10, "money"),
+        F("xartosimo", 9, "money", value=0),
+        F("oga", 8, "money", value=0),
+        F("etos_anadr", 4, "zeros", value=0),
+        F("keno3", 9, value=""),
+    ],
+)
+
+LAYOUTS = (
+    APD_HEADER,
+    APD_ERGAZOMENOS,
+    APD_EISFORES,
+    FMY_HEADER,
+    FMY_ERGODOTIS,
+    FMY_SYNOLA,
+    FMY_DIKAIOUXOS,
+)
@@ -0,0 +1,257 @@
+"""
+Φόρτωση όλων των δεδομένων που χρειάζεται ο υπολογισμός μιας μισθοδοσίας
+με σταθερό αριθμό queries, ανεξάρτητα από το πλήθος των εργαζομένων.
+"""
+from collections import defaultdict, namedtuple
+from django.db.models import Max, Min, Prefetch, Sum
+from utils.timeline import Timeline
+from . import models as md
+from .compute import EmployeeData, FormulaData, PayrollData, calc_employees
+from .memo import payroll_memo
+from .registry import formula_registry
+
+# Αποδοχές και τύπος εργαζομένου που ισχύουν για μια περίοδο. Έχει τα ίδια
+# ονόματα πεδίων με την Proslipsi ώστε να χρησιμοποιείται ως self στους
+# τύπους του ErgazomenosType.
+Amoivi = namedtuple("Amoivi", "apodoxes ergazomenostype")
+# Οι αποδοχές της πρόσληψης για την περίοδο της μισθοδοσίας
+Amoives = namedtuple("Amoives", "ergtype misthos imeromisthio oromisthio")
+# Τα στοιχεία της πρόσληψης στις εγγραφές 3 της ΑΠΔ
+ApdPro = namedtuple("ApdPro", "parno kad eidefka kpk plires_orario oles_ergasimes")
+
+
+class EmployeeTimelines:
+    """Οικογενειακή κατάσταση εργαζομένων και αλλαγές αποδοχών προσλήψεων
+    με ισχύ από περίοδο, φορτωμένες μαζικά για όλες τις προσλήψεις.
+
+    proslipseis: {pro_id: Proslipsi}
+    """
+
+    def __init__(self, proslipseis):
+        self.proslipseis = proslipseis
+        erg_ids = {pro.erg_id for pro in proslipseis.values()}
+        paidia = defaultdict(list)
+        for erg_id, period, num in md.ErgOikKat.objects.filter(
+            ergazomenos__in=erg_ids
+        ).values_list("ergazomenos_id", "period", "paidia"):
+            paidia[erg_id].append((period, num))
+        self._paidia = {erg_id: Timeline(items) for erg_id, items in paidia.items()}
+        rows = list(
+            md.ProslipsiApodoxes.objects.filter(proslipsi__in=proslipseis).values_list(
+                "proslipsi_id", "period", "apodoxes", "ergtyp_id"
+            )
+        )
+        ergtypes = md.ErgazomenosType.objects.in_bulk() if rows else {}
+        amoives = defaultdict(list)
+        for pro_id, period, apodoxes, ergtyp_id in rows:
+            amoives[pro_id].append((period, Amoivi(apodoxes, ergtypes[ergtyp_id])))
+        self._amoives = {pro_id: Timeline(items) for pro_id, items in amoives.items()}
+
+    def paidia(self, erg_id, period):
+        """Αριθμός παιδιών του εργαζομένου για την περίοδο"""
+        timeline = self._paidia.get(erg_id)
+        if timeline is None:
+            return 0
+        return timeline.at(period, 0)
+
+    def amoivi(self, pro, period):
+        """Αποδοχές και τύπος εργαζομένου της πρόσληψης για την περίοδο.
+        Αν δεν υπάρχει αλλαγή αποδοχών επιστρέφεται η ίδια η πρόσληψη.
+        """
+        timeline = self._amoives.get(pro.pk)
+        if timeline is None:
+            return pro
+        return timeline.at(period, pro)
+
+
+class PayrollGraph:
+    """Ο γράφος αντικειμένων μιας μισθοδοσίας
+
+    details      : Οι παρουσίες της μισθοδοσίας αθροισμένες στη βάση ανά
+                   πρόσληψη-τύπο παρουσίας ως tuples
+                   (pro_id, ptyp_id, Σ value, MIN apo, MAX eos)
+    ptypes       : {ptyp_id: ParousiaType}
+    proslipseis  : {pro_id: Proslipsi} με erg, eid, ergazomenostype και
+                   ΚΑΔ-ΕΙΔ-ΚΠΚ
+    timelines    : EmployeeTimelines των προσλήψεων
+    last         : {pro_id: η τελευταία περίοδος με παρουσίες της πρόσληψης}
+    apodtypes    : {apodt_id: ApodoxesTypeEfka} των τύπων υπολογισμού
+                   (μετά την payroll_data)
+
+    Αν δοθεί pro_ids φορτώνονται μόνο αυτές οι προσλήψεις (για τον
+    επανυπολογισμό λίγων εργαζομένων της μισθοδοσίας).
+
+    Οι τύποι υπολογισμού και τα ποσοστά ΚΠΚ έρχονται από το registry.
+    Ο υπολογισμός γίνεται στο compute με τα payroll_data και employees.
+    """
+
+    def __init__(self, misthodosia, pro_ids=None):
+        self.misthodosia = misthodosia
+        details = md.ParousiaDetails.objects.filter(
+            parousia__period__gte=misthodosia.apoperiod,
+            parousia__period__lte=misthodosia.period,
+        )
+        if pro_ids is not None:
+            details = details.filter(pro__in=pro_ids)
+        rows = list(
+            details.values_list("pro", "ptyp")
+            .annotate(Sum("value"), Min("apo"), Max("eos"), Max("parousia__period"))
+            .order_by("pro", "ptyp")
+        )
+        pro_ids = {pro_id for pro_id, *_ in rows}
+        self.ptypes = md.ParousiaType.objects.in_bulk(
+            {ptyp_id for _, ptyp_id, *_ in rows}
+        )
+        eid_keks = md.EidikotitaKek.objects.select_related("kpk")
+        self.proslipseis = md.Proslipsi.objects.filter(
+            id__in=pro_ids
+        ).select_related(
+            "erg", "eid", "ergazomenostype"
+        ).prefetch_related(
+            Prefetch("eid__eidikotitakek_set", queryset=eid_keks),
+        ).in_bulk()
+        # Ίδια σειρά με τις γραμμές παρουσιών (ParousiaDetails.Meta.ordering):
+        # πρώτα όσοι έχουν παρουσίες στην πιο πρόσφατη περίοδο και μετά με
+        # τη σειρά των προσλήψεων
+        self.last = last = {}
+        for pro_id, *_, period in rows:
+            last[pro_id] = max(last.get(pro_id, period), period)
+        rank = {pro_id: idx for idx, pro_id in enumerate(self.proslipseis)}
+        rows.sort(key=lambda row: (-last[row[0]], rank[row[0]], -row[5]))
+        self.details = [row[:5] for row in rows]
+        self.timelines = EmployeeTimelines(self.proslipseis)
+        self.period = misthodosia.periodos()
+        self._amoives = {}
+        self._results = None
+
+    def payroll_data(self):
+        """Τα κοινά δεδομένα της μισθοδοσίας ως compute.PayrollData.
+        Γεμίζει και το apodtypes ({apodt_id: ApodoxesTypeEfka}).
+        """
+        mistype = self.misthodosia.mistype
+        formulas = {}
+        self.apodtypes = {}
+        for (part_id, ergt_id, mist_id), frm in formula_registry.items():
+            if mist_id != mistype.id:
+                continue
+            formulas[(part_id, ergt_id)] = FormulaData(
+                frm.pk, frm.evalu, frm.apodt_id, frm.meresefka, frm.argiaefka
+            )
+            self.apodtypes[frm.apodt_id] = frm.apodt
+        plirotees = frozenset(
+            apodt_id for apodt_id, apodt in self.apodtypes.items() if apodt.plirotees
+        )
+        return PayrollData(
+            self.misthodosia.etos, mistype.barytis, formulas, plirotees
+        )
+
+    def employees(self):
+        """Τα δεδομένα κάθε εργαζομένου ως compute.EmployeeData"""
+        # Τα πεδία apo και eos έχουν νόημα μόνο για παρουσίες τύπου 1
+        with_dates = self.misthodosia.mistype_id == md.MisthodosiaType.TAKTIKES
+        parousies = {}
+        for pro_id, ptyp_id, val, apo, eos in self.details:
+            if not with_dates:
+                apo = eos = None
+            parousies.setdefault(pro_id, []).append(
+                (ptyp_id, val, apo or "", eos or "")
+            )
+        for pro_id, rows in parousies.items():
+            pro = self.proslipseis[pro_id]
+            ergtype, misthos, imeromisthio, oromisthio = self.amoives(pro)
+            kpks = []
+            for eid_kek in pro.eid.eid_keks():
+                kpk = eid_kek.kpk_periodou(self.period)
+                kpks.append((eid_kek.pk, kpk.perg, kpk.ptot))
+            yield EmployeeData(
+                pro_id,
+                ergtype.id,
+                misthos,
+                imeromisthio,
+                oromisthio,
+                self.paidia(pro),
+                tuple(rows),
+                tuple(kpks),
+            )
+
+    def results(self, workers=None, vectorized=False):
+        """Τα compute.EmployeeResult των εργαζομένων (υπολογίζονται μία φορά)"""
+        if self._results is None:
+            # Η έκδοση των πινάκων αναφοράς ελέγχεται μία φορά για όλους
+            with payroll_memo.scope():
+                self._results = calc_employees(
+                    self.payroll_data(),
+                    self.employees(),
+                    workers,
+                    vectorized=vectorized,
+                )
+        return self._results
+
+    def amoives(self, pro):
+        """Amoives της πρόσληψης για την περίοδο της μισθοδοσίας"""
+        amoives = self._amoives.get(pro.pk)
+        if amoives is None:
+            amoivi = self.timelines.amoivi(pro, self.period)
+            ergtype = amoivi.ergazomenostype
+            amoives = Amoives(
+                ergtype,
+                ergtype.calc("evalmisthos", amoivi),
+                ergtype.calc("evalimeromisthio", amoivi),
+                ergtype.calc("evaloromisthio", amoivi),
+            )
+            self._amoives[pro.pk] = amoives
+        return amoives
+
+    def paidia(self, pro):
+        """Παιδιά του εργαζομένου για την περίοδο της μισθοδοσίας"""
+        return self.timelines.paidia(pro.erg_id, self.period)
+
+
+class ApdContext:
+    """Τα στοιχεία των προσλήψεων για τις εγγραφές 3 μιας ΑΠΔ (παράρτημα,
+    ΚΑΔ-ΕΙΔ-ΚΠΚ, πλήρες ωράριο, όλες οι εργάσιμες) για όλους τους
+    εργαζόμενους των results, με δύο queries.
+
+    results  : Τα MisthodosiaResult της ΑΠΔ
+    parartima: Μόνο οι εργαζόμενοι του παραρτήματος
+
+    Ως ΚΑΔ-ΕΙΔ-ΚΠΚ της πρόσληψης γράφεται το πρώτο της ειδικότητας
+    (EidikotitaKek.Meta.ordering).
+    """
+
+    def __init__(self, results, parartima=None):
+        rows = md.MisthodosiaResultApodoxes.objects.filter(result__in=results)
+        if parartima is not None:
+            rows = rows.filter(pro__parartima=parartima)
+        rows = list(
+            rows.order_by()
+            .values_list(
+                "pro_id",
+                "pro__eid_id",
+                "pro__parartima__parno",
+                "pro__apeid__plires_orario",
+                "pro__apeid__oles_ergasimes",
+            )
+            .distinct()
+        )
+        keks = {}
+        for eid_id, *kek in md.EidikotitaKek.objects.filter(
+            eid__in={row[1] for row in rows}
+        ).values_list("eid_id", "kad", "eidefka", "kpk__kpk"):
+            keks.setdefault(eid_id, kek)
+        self.proslipseis = {}
+        for pro_id, eid_id, parno, plires_orario, oles_ergasimes in rows:
+            if eid_id not in keks:
+                raise ValueError(
+                    f"Η πρόσληψη {pro_id} δεν έχει ΚΑΔ-ΕΙΔ-ΚΠΚ στην ειδικότητα"
+                )
+            self.proslipseis[pro_id] = ApdPro(
+                parno, *keks[eid_id], int(plires_orario), int(oles_ergasimes)
+            )
+
+    def __getitem__(self, pro_id):
+        return self.proslipseis[pro_id]
+
+
+def load_payroll_graph(misthodosia, pro_ids=None):
+    return PayrollGraph(misthodosia, pro_ids)
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from mis import bundle
+from mis import models as md
+
+
+class Command(BaseCommand):
+    help = (
+        "Η ΑΠΔ χωρισμένη ανά παράρτημα: zip με ένα αρχείο CSL01 για κάθε "
+        "παράρτημα με εργαζόμενους, φτιαγμένα παράλληλα σε --workers "
+        "διεργασίες, με manifest.json (σύνολα ανά παράρτημα)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("apd", type=int, help="Το id της ΑΠΔ")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=bundle.workers(),
+            help="Αριθμός διεργασιών (1 για σειριακή δημιουργία)",
+        )
+        parser.add_argument(
+            "--output", help="Το αρχείο zip (εξ ορισμού το όνομα της ΑΠΔ)"
+        )
+
+    def handle(self, *args, **options):
+        apd = (
+            md.Apd.objects.select_related("minas", "apdtype")
+            .filter(pk=options["apd"])
+            .first()
+        )
+        if apd is None:
+            raise CommandError(f"Δεν υπάρχει ΑΠΔ με id {options['apd']}")
+        output = options["output"] or apd.apd_filename()
+        with open(output, "wb") as fil:
+            manifest = bundle.build_branches(apd, fil, options["workers"])
+        for fil in manifest["files"]:
+            totals = fil["totals"]
+            self.stdout.write(
+                f"{fil['parartima']}: {fil['filename']} μέρες {totals['meres']}, "
+                f"αποδοχές {totals['apodoxes']}, εισφορές {totals['eisfores']} "
+                f"({fil['seconds']:.3f}s)"
+            )
+        timing = manifest["timing"]
+        self.stdout.write(
+            f"{output}: {len(manifest['files'])} παραρτήματα, "
+            f"σύνολο {timing['total']:.3f}s με {timing['workers']} διεργασίες"
+        )
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from mis import bundle
+
+
+class Command(BaseCommand):
+    help = (
+        "Πακέτο (zip) με όλα τα αρχεία ΑΠΔ και ΦΜΥ ενός έτους ή διαστήματος "
+        "περιόδων, φτιαγμένα παράλληλα σε --workers διεργασίες, με "
+        "manifest.json (σύνολα ανά αρχείο) και αναφορά χρόνων."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("apo", type=int, help="Έτος (YYYY) ή περίοδος (YYYYMM)")
+        parser.add_argument(
+            "eos", type=int, nargs="?", help="Έτος ή περίοδος λήξης (εξ ορισμού apo)"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=bundle.workers(),
+            help="Αριθμός διεργασιών (1 για σειριακή δημιουργία)",
+        )
+        parser.add_argument(
+            "--output", help="Το αρχείο του πακέτου (εξ ορισμού bundle-apo-eos.zip)"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            apo, eos = bundle.period_range(options["apo"], options["eos"])
+        except ValueError as err:
+            raise CommandError(err)
+        items = bundle.declarations(apo, eos)
+        if not items:
+            raise CommandError(f"Δεν βρέθηκαν ΑΠΔ ή ΦΜΥ για {apo}-{eos}")
+        output = options["output"] or f"bundle-{apo}-{eos}.zip"
+        with open(output, "wb") as fil:
+            manifest = bundle.build(items, fil, options["workers"])
+        for fil in manifest["files"]:
+            self.stdout.write(
+                f"{fil['declaration']}: {fil['filename'] or 'χωρίς δεδομένα'} "
+                f"({fil['seconds']:.3f}s)"
+            )
+        timing = manifest["timing"]
+        self.stdout.write(
+            f"{output}: {len(manifest['files'])} αρχεία, "
+            f"μισθοδοσίες {timing['snapshot']:.3f}s, "
+            f"αρχεία {timing['files']:.3f}s, "
+            f"σύνολο {timing['total']:.3f}s με {timing['workers']} διεργασίες"
+        )
@@ -0,0 +1,66 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand, CommandError
+from mis import layouts
+from utils.money import Money
+
+SAMPLES = {
+    "text": lambda width: "Α" * (width // 2),
+    "cut": lambda width: "Β" * (width + 3),
+    "exact": lambda width: "1" * width,
+    "zeros": lambda width: 10 ** (width - 1),
+    "money": lambda width: Money(10 ** (width - 1) + 12345),
+    "date": lambda width: datetime.date(2020, 1, 31),
+}
+
+
+def sample_values(layout):
+    """Τιμές για κάθε μεταβλητό πεδίο της εγγραφής"""
+    return {
+        field.name: SAMPLES[field.kind](field.width)
+        for field in layout.fields
+        if field.value is None
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark της μορφοποίησης των εγγραφών ΑΠΔ και ΦΜΥ: χρόνος ανά "
+        "εγγραφή με τη μεταγλωττισμένη εγγραφή (Layout.format) και πεδίο-"
+        "πεδίο με τις συναρτήσεις του apd_functions (Layout.format_slow) "
+        "και ανάγνωση της εγγραφής από bytes (Layout.parse)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--number",
+            type=int,
+            default=20000,
+            help="Πόσες εγγραφές μορφοποιούνται για κάθε τύπο",
+        )
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        for layout in layouts.LAYOUTS:
+            values = sample_values(layout)
+            line = layout.format(**values)
+            if line != layout.format_slow(**values):
+                raise CommandError(f"{layout.name}: Διαφορετικό αποτέλεσμα")
+            raw = line.encode("CP1253")
+            if layout.format(**layout.parse(raw)._asdict()) != line:
+                raise CommandError(f"{layout.name}: Διαφορετική ανάγνωση")
+            times = []
+            for func in (layout.format, layout.format_slow):
+                start = time.perf_counter()
+                for _ in range(number):
+                    func(**values)
+                times.append((time.perf_counter() - start) / number * 1e6)
+            start = time.perf_counter()
+            for _ in range(number):
+                layout.parse(raw)
+            times.append((time.perf_counter() - start) / number * 1e6)
+            self.stdout.write(
+                f"{layout.name:16} {layout.length:3} χαρ.: "
+                f"{times[0]:.2f}μs/εγγραφή, πεδίο-πεδίο {times[1]:.2f}μs "
+                f"(x{times[1] / times[0]:.2f}), ανάγνωση {times[2]:.2f}μs"
+            )
@@ -0,0 +1,98 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from mis import models as md
+from mis.compute import calc_employees
+from mis.loaders import load_payroll_graph
+
+
+class Command(BaseCommand):
+    help = (
+        "Υπολογισμός και αποθήκευση μισθοδοσιών (MisthodosiaResult), "
+        "σειριακά ή παράλληλα με --workers. Με --benchmark συγκρίνει το "
+        "σειριακό με τον παράλληλο υπολογισμό και, με --vectorized, με τον "
+        "υπολογισμό με NumPy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "ids", nargs="*", type=int, help="id μισθοδοσιών (εξ ορισμού όλες)"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Αριθμός διεργασιών (1 για σειριακό υπολογισμό)",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Μέτρηση χρόνου σειριακού και παράλληλου υπολογισμού",
+        )
+        parser.add_argument(
+            "--vectorized",
+            action="store_true",
+            help="Υπολογισμός με NumPy (mis/vectorized.py)",
+        )
+        parser.add_argument(
+            "--replicate",
+            type=int,
+            default=100,
+            help="Πόσες φορές επαναλαμβάνονται οι εργαζόμενοι στο benchmark",
+        )
+
+    def handle(self, *args, **options):
+        misthodosies = md.Misthodosia.objects.order_by("id")
+        if options["ids"]:
+            misthodosies = misthodosies.filter(id__in=options["ids"])
+        if not misthodosies:
+            raise CommandError("Δεν βρέθηκαν μισθοδοσίες")
+        for misthodosia in misthodosies:
+            if options["benchmark"]:
+                self.benchmark(
+                    misthodosia,
+                    options["workers"],
+                    options["replicate"],
+                    options["vectorized"],
+                )
+            else:
+                self.store(misthodosia, options["workers"], options["vectorized"])
+
+    def store(self, misthodosia, workers, vectorized):
+        start = time.perf_counter()
+        result = md.MisthodosiaResult.store(misthodosia, workers, vectorized)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{misthodosia}: {result.lines.count()} εργαζόμενοι, "
+            f"πληρωτέο {result.pliroteo} ({elapsed:.3f}s)"
+        )
+
+    def benchmark(self, misthodosia, workers, replicate, vectorized):
+        graph = load_payroll_graph(misthodosia)
+        payroll = graph.payroll_data()
+        employees = list(graph.employees()) * replicate
+        start = time.perf_counter()
+        serial = calc_employees(payroll, employees)
+        serial_time = time.perf_counter() - start
+        start = time.perf_counter()
+        parallel = calc_employees(payroll, employees, workers)
+        parallel_time = time.perf_counter() - start
+        if parallel != serial:
+            raise CommandError(f"{misthodosia}: Διαφορετικό αποτέλεσμα")
+        self.stdout.write(
+            f"{misthodosia}: {len(employees)} εργαζόμενοι, "
+            f"σειριακά {serial_time:.3f}s, "
+            f"{workers} διεργασίες {parallel_time:.3f}s "
+            f"(x{serial_time / parallel_time:.2f})"
+        )
+        if not vectorized:
+            return
+        start = time.perf_counter()
+        result = calc_employees(payroll, employees, vectorized=True)
+        vectorized_time = time.perf_counter() - start
+        if result != serial:
+            raise CommandError(f"{misthodosia}: Διαφορετικό αποτέλεσμα με NumPy")
+        self.stdout.write(
+            f"{misthodosia}: NumPy {vectorized_time:.3f}s "
+            f"(x{serial_time / vectorized_time:.2f})"
+        )
@@ -0,0 +1,65 @@
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from mis import bundle
+from mis import models as md
+from mis import payslips
+
+
+class Command(BaseCommand):
+    help = (
+        "Οι αποδείξεις πληρωμής μιας μισθοδοσίας σε PDF: ένα αρχείο ανά "
+        "εργαζόμενο και ένα με όλες, φτιαγμένα παράλληλα σε --workers "
+        "διεργασίες, σε φάκελο ή zip. Με --benchmark μετράει σελίδες ανά "
+        "δευτερόλεπτο με και χωρίς το cache των fonts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("misthodosia", type=int, help="Το id της μισθοδοσίας")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=bundle.workers(),
+            help="Αριθμός διεργασιών (1 για σειριακή δημιουργία)",
+        )
+        parser.add_argument(
+            "--output",
+            help="Φάκελος ή αρχείο .zip (εξ ορισμού apodeixeis-<id>.zip)",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Σύγκριση με και χωρίς cache των fonts (χωρίς αρχεία)",
+        )
+
+    def handle(self, *args, **options):
+        misthodosia = md.Misthodosia.objects.filter(pk=options["misthodosia"]).first()
+        if misthodosia is None:
+            raise CommandError(
+                f"Δεν υπάρχει μισθοδοσία με id {options['misthodosia']}"
+            )
+        # Το αποτέλεσμα υπολογίζεται πριν τις μετρήσεις
+        misthodosia.snapshot(options["workers"])
+        if options["benchmark"]:
+            for cached in (False, True):
+                with tempfile.TemporaryFile() as fil:
+                    report = payslips.build(
+                        misthodosia, fil, options["workers"], cached
+                    )
+                self.report(report)
+            return
+        output = options["output"] or f"apodeixeis-{misthodosia.pk}.zip"
+        if output.lower().endswith(".zip"):
+            with open(output, "wb") as fil:
+                report = payslips.build(misthodosia, fil, options["workers"])
+        else:
+            report = payslips.build(misthodosia, output, options["workers"])
+        self.stdout.write(f"{output}: {report['files']} αρχεία")
+        self.report(report)
+
+    def report(self, report):
+        fonts = "με cache fonts" if report["cached"] else "χωρίς cache fonts"
+        self.stdout.write(
+            f"{report['employees']} εργαζόμενοι, {report['pages']} σελίδες σε "
+            f"{report['seconds']:.3f}s με {report['workers']} διεργασίες "
+            f"({fonts}): {report['pages_per_second']} σελίδες/s"
+        )
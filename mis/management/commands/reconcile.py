@@ -0,0 +1,89 @@
+from django.core.management.base import BaseCommand, CommandError
+from mis import models as md
+from mis import reconcile
+from utils.ziputil import read_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Έλεγχος αρχείων ΑΠΔ (CSL01) και ΦΜΥ (JL10), απλών ή σε zip: μήκη "
+        "και τιμές εγγραφών, σειρά και σύνολα. Με --apd ή --fmy το αρχείο "
+        "συγκρίνεται ανά εργαζόμενο και ποσό με αυτό που φτιάχνεται τώρα."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="Τα αρχεία (ή zip)")
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument("--apd", type=int, help="Σύγκριση με την ΑΠΔ (id)")
+        group.add_argument("--fmy", type=int, help="Σύγκριση με το ΦΜΥ (id)")
+        parser.add_argument(
+            "--member", help="Το αρχείο μέσα στο zip (εξ ορισμού το πρώτο)"
+        )
+
+    def handle(self, *args, **options):
+        generated = self.generated(options)
+        if generated is not None and len(options["files"]) != 1:
+            raise CommandError("Η σύγκριση γίνεται με ένα αρχείο")
+        failed = 0
+        for path in options["files"]:
+            try:
+                declaration = reconcile.validate(read_lines(path, options["member"]))
+            except (OSError, KeyError, ValueError) as err:
+                raise CommandError(f"{path}: {err}")
+            for error in declaration.errors:
+                self.stdout.write(f"{path}: {error}")
+            failed += bool(declaration.errors)
+            totals = ", ".join(
+                f"{name} {value}" for name, value in declaration.totals().items()
+            )
+            self.stdout.write(
+                f"{path}: {declaration.filetype.name}, {declaration.count} "
+                f"εγγραφές, {len(declaration.employees)} εργαζόμενοι, {totals}"
+            )
+        if generated is not None:
+            try:
+                differences = reconcile.diff(declaration, generated)
+            except ValueError as err:
+                raise CommandError(err)
+            for dif in differences:
+                self.stdout.write(self.describe(dif))
+            self.stdout.write(f"{len(differences)} διαφορές")
+        if failed:
+            raise CommandError(f"{failed} αρχεία με λάθη")
+
+    def generated(self, options):
+        """Η Declaration του αρχείου που φτιάχνεται τώρα (ή None)"""
+        if options["apd"] is not None:
+            apd = md.Apd.objects.filter(pk=options["apd"]).first()
+            if apd is None:
+                raise CommandError(f"Δεν υπάρχει ΑΠΔ με id {options['apd']}")
+            # Το ίδιο αρχείο του zip (ανά παράρτημα)
+            members = dict(apd.apd_members())
+            member = options["member"] or next(iter(members))
+            if member not in members:
+                raise CommandError(
+                    f"Η ΑΠΔ {apd} δεν έχει αρχείο {member} "
+                    f"(υπάρχουν: {', '.join(members)})"
+                )
+            return reconcile.validate(members[member], reconcile.APD)
+        if options["fmy"] is not None:
+            fmy = md.Fmy.objects.filter(pk=options["fmy"]).first()
+            if fmy is None:
+                raise CommandError(f"Δεν υπάρχει ΦΜΥ με id {options['fmy']}")
+            lines = fmy.fmy_lines()
+            if lines is None:
+                raise CommandError(f"Το ΦΜΥ {fmy} δεν έχει δεδομένα")
+            return reconcile.validate(lines, reconcile.FMY)
+        return None
+
+    def describe(self, dif):
+        if dif.employee is None:
+            return f"Σύνολο {dif.field}: {dif.submitted} -> {dif.generated}"
+        if dif.field is None:
+            where = "μόνο στο υποβληθέν" if dif.submitted else "μόνο στο τωρινό"
+            return f"Εργαζόμενος {dif.employee}: {where}"
+        item = "/".join(str(value) for value in dif.item if value is not None)
+        return (
+            f"Εργαζόμενος {dif.employee} [{item}] {dif.field}: "
+            f"{dif.submitted} -> {dif.generated}"
+        )
@@ -0,0 +1,114 @@
+"""
+Memo των αποτελεσμάτων μισθοδοσίας (MisthodosiaResult.as_foroi, as_res)
+
+Στην ίδια αίτηση η ίδια μισθοδοσία διαβάζεται πολλές φορές (σελίδα
+μισθοδοσίας, ΦΜΥ και ΑΠΔ του ίδιου μήνα). Το αποτέλεσμα κρατιέται:
+
+- για τη διάρκεια μιας αίτησης (PayrollMemoMiddleware) ή ενός
+  payroll_memo.scope() σε εντολές και εργασίες
+- προαιρετικά και ανάμεσα σε αιτήσεις στο cache του Django με alias το
+  settings.MIS_PAYROLL_CACHE (και διάρκεια MIS_PAYROLL_CACHE_TIMEOUT)
+
+Το κλειδί περιέχει το id της μισθοδοσίας και την έκδοση των δεδομένων του
+αποτελέσματος (MisthodosiaResult.input_version), οπότε μετά από
+επανυπολογισμό δεν χρησιμοποιείται ποτέ παλιό αποτέλεσμα. Το invalidate
+καλείται από τα signals όταν αλλάζουν δεδομένα.
+
+Οι τιμές που επιστρέφονται είναι κοινές και δεν πρέπει να αλλάζουν.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import caches
+
+_request_memo = ContextVar("payroll_memo", default=None)
+
+
+class PayrollMemo:
+    KINDS = ("foroi", "res")
+
+    def key(self, kind, result):
+        return f"mis:{kind}:{result.misthodosia_id}:{result.input_version()}"
+
+    def cache(self):
+        alias = getattr(settings, "MIS_PAYROLL_CACHE", None)
+        if not alias:
+            return None
+        return caches[alias]
+
+    def get(self, kind, result, compute):
+        """Η τιμή kind του result από το memo ή από το compute()"""
+        key = self.key(kind, result)
+        memo = _request_memo.get()
+        if memo is not None and key in memo:
+            return memo[key][1]
+        cache = self.cache()
+        value = None if cache is None else cache.get(key)
+        if value is None:
+            value = compute()
+            if cache is not None:
+                timeout = getattr(settings, "MIS_PAYROLL_CACHE_TIMEOUT", None)
+                if timeout is None:
+                    cache.set(key, value)
+                else:
+                    cache.set(key, value, timeout)
+        if memo is not None:
+            memo[key] = (result.misthodosia_id, value)
+        return value
+
+    def local(self, key, compute):
+        """Τιμή που κρατιέται μόνο για το scope (χωρίς το cache του Django).
+        Εκτός scope το compute() καλείται κάθε φορά.
+        """
+        memo = _request_memo.get()
+        if memo is None:
+            return compute()
+        if key not in memo:
+            memo[key] = (None, compute())
+        return memo[key][1]
+
+    def invalidate(self, misthodosia_id=None):
+        """Σβήνει από το memo τη μισθοδοσία (ή όλες με None). Στο cache του
+        Django σβήνεται η τρέχουσα έκδοση του αποτελέσματος της μισθοδοσίας.
+        """
+        memo = _request_memo.get()
+        if memo is not None:
+            for key, (mis_id, _) in list(memo.items()):
+                if misthodosia_id is None or mis_id == misthodosia_id:
+                    del memo[key]
+        cache = self.cache()
+        if cache is None or misthodosia_id is None:
+            return
+        from .models import MisthodosiaResult
+
+        result = MisthodosiaResult.objects.filter(
+            misthodosia_id=misthodosia_id
+        ).first()
+        if result is not None:
+            cache.delete_many([self.key(kind, result) for kind in self.KINDS])
+
+    @contextmanager
+    def scope(self):
+        """Memo για όσο διαρκεί το with (μία αίτηση, εντολή, εργασία)"""
+        if _request_memo.get() is not None:
+            yield
+            return
+        token = _request_memo.set({})
+        try:
+            yield
+        finally:
+            _request_memo.reset(token)
+
+
+payroll_memo = PayrollMemo()
+
+
+class PayrollMemoMiddleware:
+    """Memo αποτελεσμάτων μισθοδοσίας ανά αίτηση"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with payroll_memo.scope():
+            return self.get_response(request)
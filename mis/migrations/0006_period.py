@@ -0,0 +1,84 @@
+from django.db import migrations, models
+
+
+def periodos(etos, minas):
+    return int(f"{etos}{minas.code}")
+
+
+def fill_periods(apps, schema_editor):
+    for name in ("Parousia", "Fmy"):
+        for obj in apps.get_model("mis", name).objects.select_related("minas"):
+            obj.period = periodos(obj.etos, obj.minas)
+            obj.save(update_fields=["period"])
+    for name in ("ErgOikKat", "ProslipsiApodoxes"):
+        for obj in apps.get_model("mis", name).objects.select_related("apomina"):
+            obj.period = periodos(obj.apoetos, obj.apomina)
+            obj.save(update_fields=["period"])
+    Misthodosia = apps.get_model("mis", "Misthodosia")
+    for obj in Misthodosia.objects.select_related("apomina", "eosmina"):
+        obj.apoperiod = periodos(obj.etos, obj.apomina)
+        obj.period = periodos(obj.etos, obj.eosmina)
+        obj.save(update_fields=["apoperiod", "period"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0005_auto_20210921_2138'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ergoikkat',
+            name='period',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Περίοδος'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='proslipsiapodoxes',
+            name='period',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Περίοδος'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='parousia',
+            name='period',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Περίοδος'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='fmy',
+            name='period',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Περίοδος'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='misthodosia',
+            name='apoperiod',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Από περίοδο'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='misthodosia',
+            name='period',
+            field=models.IntegerField(db_index=True, default=0, editable=False, verbose_name='Έως περίοδο'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_periods, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='ergoikkat',
+            options={'ordering': ['ergazomenos', 'period'], 'verbose_name': 'ΑΛΛΑΓΗ ΟΙΚΟΓΕΝΕΙΑΚΗΣ ΚΑΤΑΣΤΑΣΗΣ', 'verbose_name_plural': 'ΑΛΛΑΓΕΣ ΟΙΚΟΓΕΝΕΙΑΚΗΣ ΚΑΤΑΣΤΑΣΗΣ'},
+        ),
+        migrations.AlterModelOptions(
+            name='fmy',
+            options={'ordering': ['-period'], 'verbose_name': 'ΜΙΣΘΟΔΟΣΙΕΣ ΦΜΥ', 'verbose_name_plural': 'ΜΙΣΘΟΔΟΣΙΕΣ ΦΜΥ'},
+        ),
+        migrations.AlterModelOptions(
+            name='parousia',
+            options={'ordering': ['-period'], 'verbose_name': 'ΠΑΡΟΥΣΙΑ', 'verbose_name_plural': 'ΠΑΡΟΥΣΙΕΣ'},
+        ),
+        migrations.AlterModelOptions(
+            name='proslipsiapodoxes',
+            options={'ordering': ['proslipsi', 'period'], 'verbose_name': 'ΑΛΛΑΓΗ ΑΠΟΔΟΧΩΝ', 'verbose_name_plural': 'ΑΛΛΑΓΕΣ ΑΠΟΔΟΧΩΝ'},
+        ),
+    ]
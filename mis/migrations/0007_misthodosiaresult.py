@@ -0,0 +1,99 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0006_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MisthodosiaResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.IntegerField(default=0, verbose_name='Έκδοση υπολογισμού')),
+                ('stale', models.BooleanField(default=False, verbose_name='Χρειάζεται επανυπολογισμό')),
+                ('computed', models.DateTimeField(auto_now=True, verbose_name='Υπολογίστηκε')),
+                ('diagnostics', models.JSONField(default=list, verbose_name='Παρατηρήσεις')),
+                ('meres', models.IntegerField(default=0, verbose_name='Μέρες')),
+                ('apodoxes', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Αποδοχές')),
+                ('kr_enos', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Κρατήσεις εργαζομένου')),
+                ('kr_etis', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Κρατήσεις εργοδότη')),
+                ('kr_total', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Κρατήσεις σύνολο')),
+                ('foros', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Φ.Μ.Υ.')),
+                ('eea', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Ε.Ε.Α.')),
+                ('pliroteo', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Πληρωτέο')),
+                ('misthodosia', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='result', to='mis.misthodosia', verbose_name='Μισθοδοσία')),
+            ],
+            options={
+                'verbose_name': 'ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ',
+                'verbose_name_plural': 'ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΩΝ',
+            },
+        ),
+        migrations.CreateModel(
+            name='MisthodosiaResultApodoxes',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('apod', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Αποδοχές')),
+                ('meres', models.IntegerField(default=0, verbose_name='Μέρες')),
+                ('argia', models.IntegerField(default=0, verbose_name='Κυριακές')),
+                ('apo', models.DateField(blank=True, null=True, verbose_name='Από')),
+                ('eos', models.DateField(blank=True, null=True, verbose_name='Εως')),
+                ('imeromisthio', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Ημερομίσθιο')),
+                ('apodt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mis.apodoxestypeefka', verbose_name='Τύπος αποδοχών(ΕΦΚΑ)')),
+                ('pro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mis.proslipsi', verbose_name='Εργαζόμενος')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='apodoxes_lines', to='mis.misthodosiaresult')),
+            ],
+            options={
+                'verbose_name': 'ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΤΥΠΟ ΑΠΟΔΟΧΩΝ',
+                'verbose_name_plural': 'ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΤΥΠΟ ΑΠΟΔΟΧΩΝ',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MisthodosiaResultKratisi',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enos', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Εργαζομένου')),
+                ('etis', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Εργοδότη')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Σύνολο')),
+                ('apodt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mis.apodoxestypeefka', verbose_name='Τύπος αποδοχών(ΕΦΚΑ)')),
+                ('eidkek', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mis.eidikotitakek', verbose_name='ΚΑΔ-ΕΙΔ-ΚΠΚ')),
+                ('pro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mis.proslipsi', verbose_name='Εργαζόμενος')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='kratiseis', to='mis.misthodosiaresult')),
+            ],
+            options={
+                'verbose_name': 'ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ ΚΡΑΤΗΣΕΙΣ',
+                'verbose_name_plural': 'ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΑΣ ΚΡΑΤΗΣΕΙΣ',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MisthodosiaResultLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('imeromisthio', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Ημερομίσθιο')),
+                ('paidia', models.IntegerField(default=0, verbose_name='Παιδιά')),
+                ('meres', models.IntegerField(default=0, verbose_name='Μέρες')),
+                ('apodoxes', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Αποδοχές')),
+                ('kr_enos', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Κρατήσεις εργαζομένου')),
+                ('kr_etis', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Κρατήσεις εργοδότη')),
+                ('kr_total', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Κρατήσεις σύνολο')),
+                ('forologiteo', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Φορολογητέο')),
+                ('foros', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Φ.Μ.Υ.')),
+                ('eea', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Ε.Ε.Α.')),
+                ('pliroteo', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Πληρωτέο')),
+                ('pro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mis.proslipsi', verbose_name='Εργαζόμενος')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='mis.misthodosiaresult')),
+            ],
+            options={
+                'verbose_name': 'ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΕΡΓΑΖΟΜΕΝΟ',
+                'verbose_name_plural': 'ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΕΡΓΑΖΟΜΕΝΟ',
+                'ordering': ['id'],
+            },
+        ),
+    ]
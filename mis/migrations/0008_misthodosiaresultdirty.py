@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0007_misthodosiaresult'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='misthodosiaresultapodoxes',
+            name='last',
+            field=models.IntegerField(default=0, verbose_name='Τελευταία περίοδος παρουσιών'),
+        ),
+        migrations.AddField(
+            model_name='misthodosiaresultapodoxes',
+            name='seq',
+            field=models.IntegerField(default=0, verbose_name='Σειρά'),
+        ),
+        migrations.CreateModel(
+            name='MisthodosiaResultDirty',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mis.proslipsi', verbose_name='Εργαζόμενος')),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dirty', to='mis.misthodosiaresult')),
+            ],
+            options={
+                'verbose_name': 'ΑΛΛΑΓΗ ΑΠΟΤΕΛΕΣΜΑΤΟΣ ΜΙΣΘΟΔΟΣΙΑΣ',
+                'verbose_name_plural': 'ΑΛΛΑΓΕΣ ΑΠΟΤΕΛΕΣΜΑΤΟΣ ΜΙΣΘΟΔΟΣΙΑΣ',
+                'unique_together': {('result', 'pro')},
+            },
+        ),
+    ]
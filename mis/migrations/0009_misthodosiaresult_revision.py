@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0008_misthodosiaresultdirty'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='misthodosiaresult',
+            name='revision',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Αναθεώρηση'),
+        ),
+    ]
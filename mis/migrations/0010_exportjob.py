@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0009_misthodosiaresult_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Σε αναμονή'), ('running', 'Σε εξέλιξη'), ('done', 'Ολοκληρώθηκε'), ('empty', 'Χωρίς δεδομένα'), ('failed', 'Απέτυχε')], default='pending', max_length=10, verbose_name='Κατάσταση')),
+                ('progress', models.IntegerField(default=0, verbose_name='Εγγραφές')),
+                ('total', models.IntegerField(default=0, verbose_name='Εγγραφές συνολικά')),
+                ('key', models.CharField(blank=True, max_length=64, verbose_name='Κλειδί αρχείου')),
+                ('filename', models.CharField(blank=True, max_length=100, verbose_name='Αρχείο')),
+                ('error', models.TextField(blank=True, verbose_name='Λάθος')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Δημιουργήθηκε')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Ολοκληρώθηκε')),
+                ('apd', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='mis.apd', verbose_name='ΑΠΔ')),
+                ('fmy', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='mis.fmy', verbose_name='ΦΜΥ')),
+            ],
+            options={
+                'verbose_name': 'ΕΡΓΑΣΙΑ ΑΡΧΕΙΟΥ',
+                'verbose_name_plural': 'ΕΡΓΑΣΙΕΣ ΑΡΧΕΙΩΝ',
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0010_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Τελευταία ενημέρωση'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='owner',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Διεργασία'),
+        ),
+    ]
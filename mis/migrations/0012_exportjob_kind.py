@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0011_exportjob_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='kind',
+            field=models.CharField(choices=[('export', 'Αρχείο δήλωσης'), ('bundle', 'Πακέτο αρχείων')], default='export', max_length=10, verbose_name='Είδος'),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='params',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Παράμετροι'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0012_exportjob_kind'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='kind',
+            field=models.CharField(choices=[('export', 'Αρχείο δήλωσης'), ('bundle', 'Πακέτο αρχείων'), ('payslips', 'Αποδείξεις πληρωμής')], default='export', max_length=10, verbose_name='Είδος'),
+        ),
+    ]
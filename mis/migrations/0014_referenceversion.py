@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mis', '0013_exportjob_payslips'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True, verbose_name='Πίνακας')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Έκδοση')),
+            ],
+            options={
+                'verbose_name': 'ΕΚΔΟΣΗ ΠΙΝΑΚΑ ΑΝΑΦΟΡΑΣ',
+                'verbose_name_plural': 'ΕΚΔΟΣΕΙΣ ΠΙΝΑΚΩΝ ΑΝΑΦΟΡΑΣ',
+            },
+        ),
+    ]
@@ -1,22 +1,33 @@
+import calendar
+import datetime
+import os
+from itertools import groupby
+from operator import attrgetter
 from decimal import Decimal
-from django.db import models
-from django.db.models import Sum, Max
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import (
+    BooleanField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Prefetch,
+    Q,
+    Sum,
+)
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 
 # from django.core.validators import MinValueValidator, MaxValueValidator, int_list_validator
 from django.urls import reverse
-from utils.apd_functions import (
-    fill_spaces,
-    fill_spaces_cut,
-    decimal2flat,
-    isodate2flat,
-    leading_zeroes,
-)
 from utils.validators import is_afm, is_amka
-from utils.foros import calc_foros_eea_periodou
+from utils.formula import FormulaError, compile_formula, formulas, ergtype_formulas
+from utils.merge import merge_sorted
+from utils.money import Money, decimals, round_decimal
+from utils.timeline import Timeline
 
 # from utils.ziputil import create_zip
-from utils.ziputil import create_zip_stream
+from . import layouts
 
 # from mispdf.txt2pdf import txt2pdf
 
@@ -201,31 +212,39 @@ class Kpk(models.Model):
         verbose_name_plural = "ΕΦΚΑ ΠΑΚΕΤΑ ΚΑΛΥΨΗΣ"
 
     def kpk_periodou(self, period):
-        kpk_periods = self.kpkapo_set.all()
-        kpk_max = None
-        period_max = 190001  # Ελάχιστη περίοδος το 1900 01
-        for kpk_period in kpk_periods:
-            if kpk_period.apo <= period:
-                if period_max < kpk_period.apo:
-                    period_max = kpk_period.apo
-                    kpk_max = kpk_period
-        return kpk_max
+        """Το KpkApo που ισχύει για την περίοδο (YYYYMM) ή None"""
+        from .registry import kpk_rates
+
+        return kpk_rates.rate(self.pk, period)
 
     def kpk_per_test(self, period):
-        try:
-            return self.kpkapo_set.get(
-                apo=self.kpkapo_set.filter(apo__lte=period).aggregate(Max("apo"))[
-                    "apo__max"
-                ]
-            )
-        except Exception:
-            return None
+        return self.kpk_periodou(period)
 
     def __str__(self):
         return f"{self.kpk} {self.per}"
 
 
+class ReferenceQuerySet(models.QuerySet):
+    """QuerySet πίνακα αναφοράς που κρατιέται στη μνήμη (mis/registry.py).
+    Οι αλλαγές χωρίς signals αλλάζουν κι αυτές την έκδοση του πίνακα
+    (ReferenceVersion) με όνομα model.REFERENCE.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        ReferenceVersion.bump(self.model.REFERENCE)
+        return objs
+
+    def update(self, **kwargs):
+        # Και για το bulk_update, που καλεί το update
+        rows = super().update(**kwargs)
+        ReferenceVersion.bump(self.model.REFERENCE)
+        return rows
+
+
 class KpkApo(models.Model):
+    REFERENCE = "kpkapo"
+
     kpk = models.ForeignKey(
         Kpk, verbose_name="Πακέτο κάλυψης", on_delete=models.PROTECT
     )
@@ -234,6 +253,8 @@ class KpkApo(models.Model):
     peti = models.DecimalField("Ποσοστό εργοδότη", max_digits=4, decimal_places=2)
     ptot = models.DecimalField("Συνολικό ποσοστό", max_digits=4, decimal_places=2)
 
+    objects = ReferenceQuerySet.as_manager()
+
     def is_correct(self):
         return self.ptot == (self.perg + self.peti)
 
@@ -286,7 +307,9 @@ class EidikotitaKek(models.Model):
     kpk = models.ForeignKey(Kpk, verbose_name="ΚΠΚ", on_delete=models.PROTECT)
 
     def kpk_periodou(self, period):
-        return self.kpk.kpk_periodou(period)
+        from .registry import kpk_rates
+
+        return kpk_rates.rate(self.kpk_id, period)
 
     class Meta:
         ordering = ("kad", "eid", "kpk")
@@ -336,6 +359,101 @@ class OikKatType(models.Model):
         return f"{self.oik}"
 
 
+def period_dates(period):
+    """Η πρώτη και η τελευταία ημέρα της περιόδου YYYYMM (ValueError για
+    λάθος μήνα)
+    """
+    etos, minas = divmod(period, 100)
+    if not 1 <= minas <= 12:
+        raise ValueError(f"Λάθος μήνας στην περίοδο {period}")
+    last = calendar.monthrange(etos, minas)[1]
+    return datetime.date(etos, minas, 1), datetime.date(etos, minas, last)
+
+
+def period_of(etos, minas):
+    """YYYYMM από έτος και μήνα (Minas)"""
+    return int(f"{etos}{minas.code}")
+
+
+class PeriodQuerySet(models.QuerySet):
+    """QuerySet μοντέλων με στήλες περιόδου (PeriodModel)
+
+    Τα bulk_create/bulk_update δεν περνάνε από το save(), γι' αυτό
+    συμπληρώνουν εδώ τις στήλες. Το update() δεν μπορεί να τις υπολογίσει
+    (ο κωδικός μήνα είναι σε άλλο πίνακα) και δεν δέχεται αλλαγή έτους ή
+    μήνα χωρίς τις στήλες περιόδου: Η αλλαγή γίνεται με save() ανά εγγραφή.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.set_period()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if set(fields) & self.model.period_sources():
+            for obj in objs:
+                obj.set_period()
+            fields = list(fields) + list(self.model.PERIOD_FIELDS)
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        sources = set(kwargs) & self.model.period_sources()
+        if sources and not set(self.model.PERIOD_FIELDS) <= set(kwargs):
+            raise ValueError(
+                f"{self.model.__name__}: Τα {', '.join(sorted(sources))} "
+                "αλλάζουν μόνο με save() (στήλες περιόδου)"
+            )
+        return super().update(**kwargs)
+
+
+class PeriodModel:
+    """Mixin για μοντέλα με στήλες περιόδου YYYYMM (για φίλτρα και
+    ταξινόμηση) που υπολογίζονται από έτος και μήνα στο save()
+    """
+
+    # {στήλη περιόδου: (πεδίο έτους, πεδίο μήνα)}
+    PERIOD_FIELDS = {"period": ("etos", "minas")}
+
+    @classmethod
+    def period_sources(cls):
+        """Τα πεδία (και οι στήλες _id) από τα οποία υπολογίζονται"""
+        sources = set()
+        for etos, minas in cls.PERIOD_FIELDS.values():
+            sources.update((etos, minas, f"{minas}_id"))
+        return sources
+
+    def set_period(self):
+        for column, (etos, minas) in self.PERIOD_FIELDS.items():
+            setattr(self, column, period_of(getattr(self, etos), getattr(self, minas)))
+
+    def save(self, *args, **kwargs):
+        self.set_period()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = set(update_fields) | set(self.PERIOD_FIELDS)
+        super().save(*args, **kwargs)
+
+
+class ErgazomenosQuerySet(models.QuerySet):
+    def with_active(self):
+        """Με active (annotation): Έχει πρόσληψη χωρίς αποχώρηση (όπως η
+        μέθοδος is_active)
+        """
+        return self.annotate(
+            active=Exists(
+                Proslipsi.objects.filter(erg=OuterRef("pk"), apoxorisi__isnull=True)
+            )
+        )
+
+    def active_in(self, period):
+        """Οι εργαζόμενοι με πρόσληψη ενεργή στην περίοδο YYYYMM"""
+        return self.filter(
+            Exists(Proslipsi.objects.active_in(period).filter(erg=OuterRef("pk")))
+        )
+
+
 class Ergazomenos(models.Model):
     """Εργαζόμενοι"""
 
@@ -366,6 +484,8 @@ class Ergazomenos(models.Model):
     mobile = models.CharField("Κινητό τηλέφωνο", max_length=10)
     telhome = models.CharField("Tηλέφωνο οικίας", max_length=10, blank=True)
 
+    objects = ErgazomenosQuerySet.as_manager()
+
     @property
     def onomatep(self):
         return f"{self.epo} {self.ono}"
@@ -375,18 +495,10 @@ class Ergazomenos(models.Model):
         return f"{self.epo} {self.ono} {self.afm}"
 
     def active_for_period(self, period):
-        proslipseis = self.proslipsi_set.all()
-        for prs in proslipseis:
-            if prs.active_for_period(period):
-                return True
-        return False
+        return Proslipsi.objects.active_in(period).filter(erg=self).exists()
 
     def is_active(self):
-        proslipseis = self.proslipsi_set.all()
-        for prs in proslipseis:
-            if prs.is_active():
-                return True
-        return False
+        return self.proslipsi_set.filter(apoxorisi__isnull=True).exists()
 
     is_active.boolean = True
 
@@ -397,17 +509,8 @@ class Ergazomenos(models.Model):
 
     def paidia(self, period):
         assert period >= 190001
-        oikats = self.ergoikkat_set.all()
-        oik_max = None
-        period_max = 190001  # Ελάχιστη περίοδος το 1900 01
-        paidia = 0
-        for oikat in oikats:
-            oikper = oikat.periodos()
-            if oikper <= period:
-                if period_max < oikper:
-                    period_max = oikper
-                    paidia = oikat.paidia
-        return paidia
+        oikats = Timeline(self.ergoikkat_set.values_list("period", "paidia"))
+        return oikats.at(period, 0)
 
     class Meta:
         ordering = ["epo", "ono", "pat", "mit"]
@@ -422,7 +525,7 @@ class Ergazomenos(models.Model):
         return reverse("erg_detail", args=[str(self.id)])
 
 
-class ErgOikKat(models.Model):
+class ErgOikKat(PeriodModel, models.Model):
     """Άν δεν υπάρχει εγραφή οικογενειακής κατάστασης εδώ,
     θεωρούμε ότι ο εργαζόμενος είναι άγαμος χωρίς παιδιά.
     """
@@ -438,13 +541,17 @@ class ErgOikKat(models.Model):
         OikKatType, verbose_name="Οικογενειακή κατάσταση", on_delete=models.PROTECT
     )
     paidia = models.IntegerField("Παιδιά", default=0)
+    period = models.IntegerField("Περίοδος", editable=False, db_index=True)
+
+    PERIOD_FIELDS = {"period": ("apoetos", "apomina")}
+    objects = PeriodQuerySet.as_manager()
 
     def periodos(self):
         """ReturnsYYYYMM as integer"""
-        return int(str(self.apoetos) + self.apomina.code)
+        return self.period
 
     class Meta:
-        ordering = ["ergazomenos", "apoetos", "apomina"]
+        ordering = ["ergazomenos", "period"]
         unique_together = ("apoetos", "apomina", "ergazomenos")
         verbose_name = "ΑΛΛΑΓΗ ΟΙΚΟΓΕΝΕΙΑΚΗΣ ΚΑΤΑΣΤΑΣΗΣ"
         verbose_name_plural = "ΑΛΛΑΓΕΣ ΟΙΚΟΓΕΝΕΙΑΚΗΣ ΚΑΤΑΣΤΑΣΗΣ"
@@ -493,6 +600,23 @@ class ErgazomenosType(models.Model):
     evalimeromisthio = models.CharField("Ημερομίσθιο", max_length=100)
     evaloromisthio = models.CharField("Ωρομίσθιο", max_length=100)
 
+    FORMULA_FIELDS = ("evalmisthos", "evalimeromisthio", "evaloromisthio")
+
+    def clean(self):
+        errors = {}
+        for field in self.FORMULA_FIELDS:
+            try:
+                compile_formula(getattr(self, field), ergtype_formulas.names)
+            except FormulaError as err:
+                errors[field] = str(err)
+        if errors:
+            raise ValidationError(errors)
+
+    def calc(self, field, proslipsi):
+        """Υπολογίζει τον τύπο field για την πρόσληψη (self στον τύπο)"""
+        formula = ergtype_formulas.get((self.pk, field), getattr(self, field))
+        return round_decimal(formula(self=proslipsi))
+
     class Meta:
         ordering = ("id",)
         verbose_name = "ΕΡΓΑΖΟΜΕΝΟΣ ΤΥΠΟΣ"
@@ -502,6 +626,28 @@ class ErgazomenosType(models.Model):
         return f"{self.ergtype}"
 
 
+class ProslipsiQuerySet(models.QuerySet):
+    def with_active(self):
+        """Με active (annotation): Δεν έχει αποχώρηση (όπως η μέθοδος
+        is_active)
+        """
+        return self.annotate(
+            active=ExpressionWrapper(
+                Q(apoxorisi__isnull=True), output_field=BooleanField()
+            )
+        )
+
+    def active_in(self, period):
+        """Οι προσλήψεις ενεργές στην περίοδο YYYYMM: Πρόσληψη μέχρι το
+        τέλος του μήνα και αποχώρηση (αν υπάρχει) από την αρχή του και μετά
+        """
+        apo, eos = period_dates(period)
+        return self.filter(
+            Q(apoxorisi__isnull=True) | Q(apoxorisi__apoxorisidate__gte=apo),
+            proslipsidate__lte=eos,
+        )
+
+
 class Proslipsi(models.Model):
     """Πρόσληψη"""
 
@@ -527,13 +673,15 @@ class Proslipsi(models.Model):
     )
     apodoxes = models.DecimalField("Αποδοχές", max_digits=8, decimal_places=2)
 
+    objects = ProslipsiQuerySet.as_manager()
+
     def misthos(self):
-        return round(eval(self.ergazomenostype.evalmisthos), 2)
+        return self.ergazomenostype.calc("evalmisthos", self)
 
     misthos.short_description = "Μισθός"
 
     def imeromisthio(self):
-        return round(eval(self.ergazomenostype.evalimeromisthio), 2)
+        return self.ergazomenostype.calc("evalimeromisthio", self)
 
     imeromisthio.short_description = "Ημερομίσθιο"
 
@@ -543,7 +691,7 @@ class Proslipsi(models.Model):
         return 0
 
     def oromisthio(self):
-        return round(eval(self.ergazomenostype.evaloromisthio), 2)
+        return self.ergazomenostype.calc("evaloromisthio", self)
 
     oromisthio.short_description = "Ωρομίσθιο"
 
@@ -608,11 +756,10 @@ class Proslipsi(models.Model):
             return 999912
 
     def last_apodoxes(self):
-        set_apodoxes = list(self.proslipsiapodoxes_set.all())
-        if set_apodoxes:
-            return set_apodoxes[-1].apodoxes
-        else:
-            return self.apodoxes
+        last = self.proslipsiapodoxes_set.last()
+        if last:
+            return last.apodoxes
+        return self.apodoxes
 
     last_apodoxes.short_description = "Αποδοχές"
 
@@ -626,7 +773,7 @@ class Proslipsi(models.Model):
         return f"{self.erg} {self.proslipsidate}"
 
 
-class ProslipsiApodoxes(models.Model):
+class ProslipsiApodoxes(PeriodModel, models.Model):
     """Για την παρακολούθηση αλλαγών σε αποδοχές και τύπο εργαζομένου"""
 
     proslipsi = models.ForeignKey(
@@ -640,9 +787,13 @@ class ProslipsiApodoxes(models.Model):
         ErgazomenosType, verbose_name="Τύπος", on_delete=models.PROTECT
     )
     apodoxes = models.DecimalField("Αποδοχές", max_digits=8, decimal_places=2)
+    period = models.IntegerField("Περίοδος", editable=False, db_index=True)
+
+    PERIOD_FIELDS = {"period": ("apoetos", "apomina")}
+    objects = PeriodQuerySet.as_manager()
 
     class Meta:
-        ordering = ["proslipsi", "apoetos", "apomina"]
+        ordering = ["proslipsi", "period"]
         unique_together = ("apoetos", "apomina", "proslipsi")
         verbose_name = "ΑΛΛΑΓΗ ΑΠΟΔΟΧΩΝ"
         verbose_name_plural = "ΑΛΛΑΓΕΣ ΑΠΟΔΟΧΩΝ"
@@ -685,13 +836,16 @@ class Apoxorisi(models.Model):
         return f"{self.apoxorisidate} {self.proslipsi.erg} (πρόσληψη: {self.proslipsi.proslipsidate})"
 
 
-class Parousia(models.Model):
+class Parousia(PeriodModel, models.Model):
     etos = models.IntegerField("Έτος", default=2020)
     minas = models.ForeignKey(Minas, verbose_name="Μήνας", on_delete=models.PROTECT)
+    period = models.IntegerField("Περίοδος", editable=False, db_index=True)
+
+    objects = PeriodQuerySet.as_manager()
 
     def periodos(self):
         """ReturnsYYYYMM as integer"""
-        return int(str(self.etos) + self.minas.code)
+        return self.period
 
     periodos.short_description = "Περίοδος"
 
@@ -717,7 +871,7 @@ class Parousia(models.Model):
     number_per_partype.short_description = "tots"
 
     class Meta:
-        ordering = ["-etos", "-minas"]
+        ordering = ["-period"]
         verbose_name = "ΠΑΡΟΥΣΙΑ"
         verbose_name_plural = "ΠΑΡΟΥΣΙΕΣ"
 
@@ -745,21 +899,36 @@ class ParousiaDetails(models.Model):
         perio = self.parousia.periodos()
         apodoxes = self.apod()
         eidikotita = self.pro.eid
-        ergtype = self.pro.ergtyp
-        kratiseis = 0
+        apodoxes = Money.of(apodoxes)
+        kratiseis = Money()
         for eid_kek in eidikotita.eid_keks():
             kpk = eid_kek.kpk_periodou(perio)
-            kratiseis += round(kpk.perg * apodoxes / Decimal(100), 2)
-        return kratiseis
+            kratiseis += apodoxes.percent(kpk.perg)
+        return kratiseis.decimal()
 
     kratiseis_enos.short_description = "Κρατήσεις Εργαζομένου"
 
-    def apod(self):
-        val = Decimal(self.value)
-        misthos = self.pro.misthos()
-        imeromisthio = self.pro.imeromisthio()
-        oromisthio = self.pro.oromisthio()
-        return eval(self.ptyp.formula)
+    def apod(self, mistype_id=None):
+        """Αποδοχές της γραμμής με τον τύπο υπολογισμού του τύπου μισθοδοσίας
+        mistype_id (εξ ορισμού των τακτικών αποδοχών)
+        """
+        from .registry import formula_registry
+
+        if mistype_id is None:
+            mistype_id = MisthodosiaType.TAKTIKES
+        formula = formula_registry.get(
+            self.ptyp_id, self.pro.ergazomenostype_id, mistype_id
+        )
+        if formula is None:
+            return Decimal(0)
+        return round_decimal(
+            formula.calc(
+                val=Decimal(self.value),
+                misthos=self.pro.misthos(),
+                imeromisthio=self.pro.imeromisthio(),
+                oromisthio=self.pro.oromisthio(),
+            )
+        )
 
     apod.short_description = "Αποδ"
 
@@ -781,6 +950,9 @@ class ParousiaDetails(models.Model):
 class MisthodosiaType(models.Model):
     """Τακτικές αποδοχές , Δ.Πάσχα, Επ.Αδείας κλπ"""
 
+    # Το id των τακτικών αποδοχών
+    TAKTIKES = 1
+
     mistype = models.CharField("Τύπος Μισθοδοσίας", max_length=50, unique=True)
     barytis = models.DecimalField(
         "Βαρύτητα", max_digits=5, decimal_places=1, default=14
@@ -795,7 +967,21 @@ class MisthodosiaType(models.Model):
         return f"{self.mistype}"
 
 
-class Misthodosia(models.Model):
+class Misthodosia(PeriodModel, models.Model):
+    # Επικεφαλίδες της μισθοδοτικής κατάστασης (calc_misthodosia_foroi)
+    FOROI_HEAD = {
+        "onomatep": "ΟΝΟΜΑΤΕΠΩΝΥΜΟ",
+        "eid": "ΕΙΔΙΚΟΤΗΤΑ",
+        "imeromisthio": "ΗΜ/ΣΘΙΟ",
+        "meres": "ΜΕΡΕΣ",
+        "apodoxes": "ΑΠΟΔΟΧΕΣ",
+        "kr_enos": "ΕΡΓ/ΝΟΣ",
+        "kr_etis": "ΕΡΓ/ΤΗΣ",
+        "kr_total": "ΣΥΝΟΛΟ",
+        "foros": "Φ.Μ.Υ.",
+        "eea": "ΕΕΑ",
+        "pliroteo": "ΠΛΗΡΩΤΕΟ",
+    }
     etos = models.IntegerField("Έτος", default=2021)
     mistype = models.ForeignKey(
         MisthodosiaType, verbose_name="Τύπος μισθοδοσίας", on_delete=models.PROTECT
@@ -813,9 +999,19 @@ class Misthodosia(models.Model):
         on_delete=models.PROTECT,
     )
     ekdosidate = models.DateField("Ημερομηνία έκδοσης")
+    apoperiod = models.IntegerField("Από περίοδο", editable=False, db_index=True)
+    period = models.IntegerField("Έως περίοδο", editable=False, db_index=True)
+
+    PERIOD_FIELDS = {
+        "apoperiod": ("etos", "apomina"),
+        "period": ("etos", "eosmina"),
+    }
+    objects = PeriodQuerySet.as_manager()
 
     def clean(self):
-        if (self.mistype.id == 1) and (self.apomina != self.eosmina):
+        if (self.mistype_id == MisthodosiaType.TAKTIKES) and (
+            self.apomina != self.eosmina
+        ):
             raise ValidationError(
                 "Δεν επιτρέπεται για Τακτικές αποδοχές πάνω από μια περίοδος"
             )
@@ -833,7 +1029,31 @@ class Misthodosia(models.Model):
 
     def periodos(self):
         """ReturnsYYYYMM as integer"""
-        return int(str(self.etos) + self.eosmina.code)
+        return self.period
+
+    def snapshot(self, workers=None, vectorized=False):
+        """Το αποθηκευμένο αποτέλεσμα της μισθοδοσίας (MisthodosiaResult).
+        Υπολογίζεται και αποθηκεύεται ξανά αν δεν υπάρχει ή δεν ισχύει.
+
+        workers, vectorized: Όπως στην calc_misthodosia, για τον πλήρη
+        υπολογισμό
+        """
+        result = getattr(self, "_snapshot", None)
+        if result is None:
+            dirty = MisthodosiaResultDirty.objects.filter(result=OuterRef("pk"))
+            result = (
+                MisthodosiaResult.objects.filter(
+                    misthodosia=self, version=MisthodosiaResult.VERSION, stale=False
+                )
+                .annotate(has_dirty=Exists(dirty))
+                .first()
+            )
+            if result is None:
+                result = MisthodosiaResult.store(self, workers, vectorized)
+            elif result.has_dirty:
+                result.update_dirty()
+            self._snapshot = result
+        return result
 
     def has_fmy(self):
         try:
@@ -864,81 +1084,47 @@ class Misthodosia(models.Model):
     def __str__(self):
         return self.title()
 
-    def calc_misthodosia(self):
-        parousiesheads = Parousia.objects.filter(
-            etos=self.etos, minas__gte=self.apomina, minas__lte=self.eosmina
-        )
-        pros = {}
-        # 1o loop για άθροιση παρουσιών ανά πρόσληψη-τύπο παρουσίας
-        # Για κάθε παρουσία που βρίσκουμε στο αρχείο
-        #    Με βάση την πρόσληψη και τον τύπο παρουσίας
-        #        αθροίζουμε τις τιμές της παρουσίας
-        # Τα πεδία apo και eos έχουν νόημα μόνο για παρουσίες τύπου 1
-        for parousiahead in parousiesheads:
-            parousies = parousiahead.parousiadetails_set.all()
-            for par in parousies:
-                pros[par.pro] = pros.get(par.pro, {})
-                pros[par.pro][par.ptyp] = pros[par.pro].get(
-                    par.ptyp, {"val": 0, "apo": "", "eos": ""}
-                )
-                if self.mistype.id == 1:
-                    pros[par.pro][par.ptyp]["apo"] = par.apo or ""
-                    pros[par.pro][par.ptyp]["eos"] = par.eos or ""
-                pros[par.pro][par.ptyp]["val"] += par.value
+    def calc_misthodosia(self, graph=None, workers=None, vectorized=False):
+        """
+        graph     : Ο γράφος δεδομένων της μισθοδοσίας (loaders.PayrollGraph).
+                    Αν δεν δοθεί φορτώνεται εδώ με σταθερό αριθμό queries.
+        workers   : Αριθμός διεργασιών για παράλληλο υπολογισμό των
+                    εργαζομένων (βλ. mis/compute.py). Με None σειριακά.
+        vectorized: Υπολογισμός με NumPy (βλ. mis/vectorized.py)
+        """
+        from .registry import MissingFormula
+
+        if graph is None:
+            from .loaders import load_payroll_graph
+
+            graph = load_payroll_graph(self)
+        self.diagnostics = []
         res = {}
-        # 2ο loop για υπολογισμό αποδοχών και συγκέντρωση αθροιστικά ανά
-        # ανά εργαζόμενο-τύπο μισθοδοσίας
-        for pro, prod in pros.items():
-            misthos = pro.misthos()
-            imeromisthio = pro.imeromisthio()
-            oromisthio = pro.oromisthio()
-            # eidikotita = pro.eid
-            for ptyp, ptypd in prod.items():
-                try:
-                    formula = Formula.objects.get(
-                        part=ptyp, ergt=pro.ergazomenostype, mist=self.mistype
+        # Ο υπολογισμός γίνεται ανά εργαζόμενο στο compute.calc_employee με
+        # κλειδιά τα id. Εδώ τα id αντικαθίστανται με τα αντικείμενα.
+        for result in graph.results(workers, vectorized):
+            pro = graph.proslipseis[result.pro_id]
+            for ptyp_id in result.missing:
+                self.diagnostics.append(
+                    MissingFormula(
+                        pro, graph.ptypes[ptyp_id], graph.amoives(pro).ergtype, self.mistype
                     )
-                except Exception:
-                    print(
-                        f"formula for {ptyp}, "
-                        f"{pro.ergazomenostype} "
-                        f"{self.mistype} does not exist"
-                    )
-                    continue
-                val = ptypd["val"]
-                # Εδώ γίνεται ο υπολογισμός των αποδοχών
-                apodoxes = round(eval(formula.evalu), 2)
-                if apodoxes == 0:
-                    continue
-                apod_type = formula.apodt
-                tmeres = val if formula.meresefka else 0
-                targia = val if formula.argiaefka else 0
-                res[pro] = res.get(pro, {})
-                res[pro][apod_type] = res[pro].get(
-                    apod_type, {"apod": 0, "meres": 0, "argia": 0, "apo": "", "eos": ""}
                 )
-                res[pro][apod_type]["apod"] += apodoxes
-                res[pro][apod_type]["meres"] += tmeres
-                res[pro][apod_type]["argia"] += targia
-                res[pro][apod_type]["apo"] = ptypd["apo"]
-                res[pro][apod_type]["eos"] = ptypd["eos"]
-                # {'enos': 0, 'etis': 0, 'total': 0}
-        # 3ο loop για υπολογισμό κρατήσεων ανά εργαζόμενο - τύπο μισθοδοσίας
-        # και ΚΑΔ-ΕΙΔ_ΚΠΚ. Καλύπουμε και την περίπτωση που ένας εργαζόμενος
-        # έχει παραπάνω από ένα ΚΠΚ (π.χ. επικουρικό ταμείο έξτρα)
-        for pro, apod in res.items():
-            for aptype, vals in apod.items():
-                vals["kratiseis"] = {}
-                for eid_kek in pro.eid.eid_keks():
-                    kpk = eid_kek.kpk_periodou(self.periodos())
-                    kr_enos = round(kpk.perg * vals["apod"] / Decimal(100), 2)
-                    kr_total = round(kpk.ptot * vals["apod"] / Decimal(100), 2)
-                    kr_etis = kr_total - kr_enos
-                    vals["kratiseis"][eid_kek] = {
-                        "enos": kr_enos,
-                        "etis": kr_etis,
-                        "total": kr_total,
-                    }
+            if not result.apodoxes:
+                continue
+            eid_keks = {eid_kek.pk: eid_kek for eid_kek in pro.eid.eid_keks()}
+            res[pro] = {
+                graph.apodtypes[apodt_id]: {
+                    **decimals(vals),
+                    "kratiseis": {
+                        eid_keks[eidkek_id]: decimals(vls)
+                        for eidkek_id, vls in vals["kratiseis"].items()
+                    },
+                }
+                for apodt_id, vals in result.apodoxes.items()
+            }
+        # Όσοι συνδυασμοί δεν έχουν τύπο υπολογισμού καταγράφονται στο
+        # self.diagnostics ως registry.MissingFormula
         # Το res έχει την δομή:
         # {
         #  {obj_proslipsi: {
@@ -948,6 +1134,7 @@ class Misthodosia(models.Model):
         #         'argia': 0,
         #         'apo': '',
         #         'eos': '',
+        #         'imeromisthio': 0,  # Για την ΑΠΔ, 0 αν δεν είναι ημερομίσθιος
         #         'kratiseis': {
         #             obj_eidikotitakek: {
         #                 'enos': 0,
@@ -961,21 +1148,16 @@ class Misthodosia(models.Model):
         # }
         return res
 
-    def calc_misthodosia_foroi(self):
-        res = self.calc_misthodosia()
-        head = {
-            "onomatep": "ΟΝΟΜΑΤΕΠΩΝΥΜΟ",
-            "eid": "ΕΙΔΙΚΟΤΗΤΑ",
-            "imeromisthio": "ΗΜ/ΣΘΙΟ",
-            "meres": "ΜΕΡΕΣ",
-            "apodoxes": "ΑΠΟΔΟΧΕΣ",
-            "kr_enos": "ΕΡΓ/ΝΟΣ",
-            "kr_etis": "ΕΡΓ/ΤΗΣ",
-            "kr_total": "ΣΥΝΟΛΟ",
-            "foros": "Φ.Μ.Υ.",
-            "eea": "ΕΕΑ",
-            "pliroteo": "ΠΛΗΡΩΤΕΟ",
-        }
+    def calc_misthodosia_foroi(self, graph=None, workers=None, vectorized=False):
+        """
+        graph, workers, vectorized: Όπως στην calc_misthodosia. Αν έχει ήδη
+        γίνει ο υπολογισμός με τον ίδιο graph δεν επαναλαμβάνεται.
+        """
+        if graph is None:
+            from .loaders import load_payroll_graph
+
+            graph = load_payroll_graph(self)
+        head = dict(self.FOROI_HEAD)
         lines = []
         totals = {
             "meres": 0,
@@ -987,54 +1169,23 @@ class Misthodosia(models.Model):
             "eea": 0,
             "pliroteo": 0,
         }
-        for pro, dapo in res.items():
+        for result in graph.results(workers, vectorized):
+            if not result.apodoxes:
+                continue
+            pro = graph.proslipseis[result.pro_id]
             fl1 = {
                 "pro": pro,
                 "onomatep": pro.erg.onomatep,
                 "eid": pro.eid.eid,
-                "imeromisthio": pro.imeromisthio(),
-                "meres": 0,
-                "apodoxes": 0,
-                "kr_enos": 0,
-                "kr_etis": 0,
-                "kr_total": 0,
-                "forologiteo": 0,
-                "foros": 0,
-                "eea": 0,
-                "pliroteo": 0,
+                "imeromisthio": graph.amoives(pro).imeromisthio,
+                "paidia": graph.paidia(pro),
+                **decimals(result.foroi),
             }
-            for typeapo, vals in dapo.items():
-                # Αν ο τύπος αποδοχών δεν είναι για πληρωμή (πχ 18.Αναστολή )
-                if not typeapo.plirotees:
-                    continue
-                fl1["meres"] += vals["meres"]
-                fl1["apodoxes"] += vals["apod"]
-
-                for eidkek, vls in vals["kratiseis"].items():
-                    fl1["kr_enos"] += vls["enos"]
-                    fl1["kr_etis"] += vls["etis"]
-                    fl1["kr_total"] += vls["total"]
-            fl1["forologiteo"] = fl1["apodoxes"] - fl1["kr_enos"]
-            paidia = pro.erg.paidia(self.periodos()) or 0
-            foros, eea = calc_foros_eea_periodou(
-                self.etos, fl1["forologiteo"], paidia, self.mistype.barytis
-            )
-            # print("models:933>Edo Foros", fl1['forologiteo'], self.mistype.barytis, foros, eea)
-            fl1["foros"] = foros
-            fl1["eea"] = eea
-            fl1["pliroteo"] = fl1["forologiteo"] - foros - eea
             # fl1['kostos'] = fl1['apodoxes'] + fl1['kr_etis']
             lines.append(fl1)
-            totals["meres"] += fl1["meres"]
-            totals["apodoxes"] += fl1["apodoxes"]
-            totals["kr_enos"] += fl1["kr_enos"]
-            totals["kr_etis"] += fl1["kr_etis"]
-            totals["kr_total"] += fl1["kr_total"]
-            totals["foros"] += fl1["foros"]
-            totals["eea"] += fl1["eea"]
-            totals["pliroteo"] += fl1["pliroteo"]
-            # totals['kostos'] += fl1['kostos']
-            lines.sort(key=lambda x: x["onomatep"])
+            for key in totals:
+                totals[key] += fl1[key]
+        lines.sort(key=lambda x: x["onomatep"])
         return head, lines, totals
 
     def calc_print(self):
@@ -1049,7 +1200,421 @@ class Misthodosia(models.Model):
                     print(f"    {eidkek} {vls['enos']} {vls['etis']} {vls['total']}")
 
 
+def amount_field(verbose_name):
+    return models.DecimalField(
+        verbose_name, max_digits=12, decimal_places=2, default=0
+    )
+
+
+class MisthodosiaResult(models.Model):
+    """Αποθηκευμένο αποτέλεσμα υπολογισμού μισθοδοσίας με τα σύνολά της
+
+    Οι γραμμές του είναι σε τρεις πίνακες: ανά εργαζόμενο
+    (MisthodosiaResultLine), ανά εργαζόμενο-τύπο αποδοχών ΕΦΚΑ
+    (MisthodosiaResultApodoxes) και ανά εργαζόμενο-τύπο αποδοχών-ΚΑΔ-ΕΙΔ-ΚΠΚ
+    (MisthodosiaResultKratisi).
+    Όταν αλλάξουν δεδομένα ενός εργαζομένου (παρουσίες, αποδοχές,
+    οικογενειακή κατάσταση, ποσοστά ΚΠΚ) καταγράφεται στο
+    MisthodosiaResultDirty και υπολογίζονται ξανά μόνο οι γραμμές του, με
+    διόρθωση των συνόλων κατά τη διαφορά (update_dirty). Για αλλαγές που
+    αφορούν όλη τη μισθοδοσία γίνεται stale (βλ. mis/signals.py), ενώ
+    version != VERSION σημαίνει ότι άλλαξε ο τρόπος υπολογισμού. Στις δύο
+    τελευταίες περιπτώσεις υπολογίζεται ξανά ολόκληρο.
+    """
+
+    # Αυξάνεται όταν αλλάζει ο υπολογισμός της μισθοδοσίας
+    VERSION = 3
+
+    misthodosia = models.OneToOneField(
+        Misthodosia,
+        verbose_name="Μισθοδοσία",
+        related_name="result",
+        on_delete=models.CASCADE,
+    )
+    version = models.IntegerField("Έκδοση υπολογισμού", default=0)
+    stale = models.BooleanField("Χρειάζεται επανυπολογισμό", default=False)
+    # Αυξάνεται σε κάθε μερικό επανυπολογισμό (update_dirty)
+    revision = models.IntegerField("Αναθεώρηση", default=0, editable=False)
+    computed = models.DateTimeField("Υπολογίστηκε", auto_now=True)
+    # [[pro_id, κείμενο], ...]
+    diagnostics = models.JSONField("Παρατηρήσεις", default=list)
+    meres = models.IntegerField("Μέρες", default=0)
+    apodoxes = amount_field("Αποδοχές")
+    kr_enos = amount_field("Κρατήσεις εργαζομένου")
+    kr_etis = amount_field("Κρατήσεις εργοδότη")
+    kr_total = amount_field("Κρατήσεις σύνολο")
+    foros = amount_field("Φ.Μ.Υ.")
+    eea = amount_field("Ε.Ε.Α.")
+    pliroteo = amount_field("Πληρωτέο")
+
+    TOTALS = (
+        "meres",
+        "apodoxes",
+        "kr_enos",
+        "kr_etis",
+        "kr_total",
+        "foros",
+        "eea",
+        "pliroteo",
+    )
+
+    class Meta:
+        verbose_name = "ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ"
+        verbose_name_plural = "ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΩΝ"
+
+    def __str__(self):
+        return f"{self.misthodosia}"
+
+    @classmethod
+    def store(cls, misthodosia, workers=None, vectorized=False):
+        """Υπολογίζει τη μισθοδοσία και αποθηκεύει το αποτέλεσμα
+
+        workers, vectorized: Όπως στη Misthodosia.calc_misthodosia
+        """
+        from .loaders import load_payroll_graph
+
+        graph = load_payroll_graph(misthodosia)
+        res = misthodosia.calc_misthodosia(graph, workers, vectorized)
+        _, lines, totals = misthodosia.calc_misthodosia_foroi(graph)
+        with transaction.atomic():
+            cls.objects.filter(misthodosia=misthodosia).delete()
+            result = cls.objects.create(
+                misthodosia=misthodosia, version=cls.VERSION, **totals
+            )
+            result.save_lines(graph, res, lines, misthodosia.diagnostics)
+            result.save(update_fields=["diagnostics"])
+        return result
+
+    def update_dirty(self):
+        """Υπολογίζει ξανά μόνο τους εργαζόμενους του MisthodosiaResultDirty
+        και διορθώνει τα σύνολα κατά τη διαφορά
+        """
+        from .loaders import load_payroll_graph
+
+        misthodosia = self.misthodosia
+        with transaction.atomic():
+            dirty = self.dirty.select_for_update()
+            pro_ids = set(dirty.values_list("pro_id", flat=True))
+            dirty.delete()
+            if not pro_ids:
+                return self
+            graph = load_payroll_graph(misthodosia, pro_ids)
+            res = misthodosia.calc_misthodosia(graph)
+            _, lines, totals = misthodosia.calc_misthodosia_foroi(graph)
+            old = self.lines.filter(pro__in=pro_ids).aggregate(
+                **{key: Sum(key) for key in self.TOTALS}
+            )
+            for key in self.TOTALS:
+                delta = totals[key] - (old[key] or 0)
+                setattr(self, key, getattr(self, key) + delta)
+            self.diagnostics = [
+                diag for diag in self.diagnostics if diag[0] not in pro_ids
+            ]
+            for rows in (self.lines, self.apodoxes_lines, self.kratiseis):
+                rows.filter(pro__in=pro_ids).delete()
+            self.save_lines(graph, res, lines, misthodosia.diagnostics)
+            self.revision += 1
+            self.save()
+        return self
+
+    def input_version(self):
+        """Αλλάζει κάθε φορά που αλλάζουν οι γραμμές του αποτελέσματος"""
+        return f"{self.pk}.{self.version}.{self.revision}"
+
+    def save_lines(self, graph, res, lines, diagnostics):
+        """Αποθηκεύει τις γραμμές των εργαζομένων του res"""
+        apodoxes = []
+        kratiseis = []
+        for pro, dapo in res.items():
+            for seq, (apodt, vals) in enumerate(dapo.items()):
+                apodoxes.append(
+                    MisthodosiaResultApodoxes(
+                        result=self,
+                        pro=pro,
+                        apodt=apodt,
+                        last=graph.last[pro.pk],
+                        seq=seq,
+                        apod=vals["apod"],
+                        meres=vals["meres"],
+                        argia=vals["argia"],
+                        apo=vals["apo"] or None,
+                        eos=vals["eos"] or None,
+                        imeromisthio=vals["imeromisthio"],
+                    )
+                )
+                for eidkek, vls in vals["kratiseis"].items():
+                    kratiseis.append(
+                        MisthodosiaResultKratisi(
+                            result=self, pro=pro, apodt=apodt, eidkek=eidkek, **vls
+                        )
+                    )
+        MisthodosiaResultLine.objects.bulk_create(
+            MisthodosiaResultLine(
+                result=self,
+                pro=line["pro"],
+                **{key: line[key] for key in MisthodosiaResultLine.VALUES},
+            )
+            for line in lines
+        )
+        MisthodosiaResultApodoxes.objects.bulk_create(apodoxes)
+        MisthodosiaResultKratisi.objects.bulk_create(kratiseis)
+        self.diagnostics += [[diag.pro.pk, str(diag)] for diag in diagnostics]
+
+    def messages(self):
+        """Τα κείμενα των παρατηρήσεων"""
+        return [text for _, text in self.diagnostics]
+
+    def totals(self):
+        return {key: getattr(self, key) for key in self.TOTALS}
+
+    def as_foroi(self):
+        """head, lines, totals όπως η Misthodosia.calc_misthodosia_foroi
+        (μέσω του mis.memo)
+        """
+        from .memo import payroll_memo
+
+        return payroll_memo.get("foroi", self, self._as_foroi)
+
+    def _as_foroi(self):
+        lines = []
+        for line in self.lines.select_related("pro__erg", "pro__eid"):
+            fl1 = {
+                "pro": line.pro,
+                "onomatep": line.pro.erg.onomatep,
+                "eid": line.pro.eid.eid,
+            }
+            for key in MisthodosiaResultLine.VALUES:
+                fl1[key] = getattr(line, key)
+            lines.append(fl1)
+        lines.sort(key=lambda x: x["onomatep"])
+        return dict(Misthodosia.FOROI_HEAD), lines, self.totals()
+
+    def as_res(self):
+        """Το αποτέλεσμα με τη δομή της Misthodosia.calc_misthodosia
+        (μέσω του mis.memo)
+        """
+        from .memo import payroll_memo
+
+        return payroll_memo.get("res", self, self._as_res)
+
+    def _as_res(self):
+        eid_keks = EidikotitaKek.objects.select_related("kpk")
+        pros = {
+            line.pro_id: line.pro
+            for line in self.lines.select_related(
+                "pro__erg", "pro__eid", "pro__parartima", "pro__apeid"
+            ).prefetch_related(
+                Prefetch("pro__eid__eidikotitakek_set", queryset=eid_keks)
+            )
+        }
+        res = {}
+        index = {}
+        # Η σειρά της calc_misthodosia (βλ. loaders.PayrollGraph)
+        rows = self.apodoxes_lines.select_related("apodt").order_by(
+            "-last", "pro", "pro_id", "seq"
+        )
+        for row in rows:
+            vals = row.as_vals()
+            res.setdefault(pros[row.pro_id], {})[row.apodt] = vals
+            index[(row.pro_id, row.apodt_id)] = vals
+        for row in self.kratiseis.select_related("eidkek__kpk"):
+            index[(row.pro_id, row.apodt_id)]["kratiseis"][row.eidkek] = row.as_vals()
+        return res
+
+    def iter_res(self, chunk_size=500, parartima=None):
+        """Το as_res ανά εργαζόμενο ως ((ΑΜΑ, id πρόσληψης), (pro, dapo))
+        σε αύξουσα σειρά κλειδιού, χωρίς να φορτώνεται όλο στη μνήμη.
+        Με parartima μόνο οι εργαζόμενοι του παραρτήματος.
+        """
+        order = ("pro__erg__ama", "pro_id")
+        apodoxes = self.apodoxes_lines.all()
+        kratiseis = self.kratiseis.all()
+        if parartima is not None:
+            apodoxes = apodoxes.filter(pro__parartima=parartima)
+            kratiseis = kratiseis.filter(pro__parartima=parartima)
+        rows = (
+            apodoxes.select_related("apodt", "pro__erg")
+            .order_by(*order, "seq")
+            .iterator(chunk_size=chunk_size)
+        )
+        kratiseis = groupby(
+            kratiseis.select_related("eidkek__kpk")
+            .annotate(ama=F("pro__erg__ama"))
+            .order_by(*order, "id")
+            .iterator(chunk_size=chunk_size),
+            key=attrgetter("ama", "pro_id"),
+        )
+        pending = next(kratiseis, None)
+        for _, group in groupby(rows, key=attrgetter("pro_id")):
+            dapo = {}
+            index = {}
+            for row in group:
+                pro = row.pro
+                dapo[row.apodt] = index[row.apodt_id] = row.as_vals()
+            key = (pro.erg.ama, pro.pk)
+            # Οι κρατήσεις είναι με την ίδια σειρά εργαζομένων
+            while pending is not None and pending[0] < key:
+                pending = next(kratiseis, None)
+            if pending is not None and pending[0] == key:
+                for row in pending[1]:
+                    index[row.apodt_id]["kratiseis"][row.eidkek] = row.as_vals()
+                pending = next(kratiseis, None)
+            yield key, (pro, dapo)
+
+    def iter_foroi(self, chunk_size=500):
+        """Οι γραμμές του as_foroi ως (ΑΦΜ, γραμμή) σε αύξουσα σειρά ΑΦΜ"""
+        lines = (
+            self.lines.select_related("pro__erg")
+            .order_by("pro__erg__afm", "pro_id")
+            .iterator(chunk_size=chunk_size)
+        )
+        for line in lines:
+            fl1 = {"pro": line.pro}
+            for key in MisthodosiaResultLine.VALUES:
+                fl1[key] = getattr(line, key)
+            yield line.pro.erg.afm, fl1
+
+
+class MisthodosiaResultLine(models.Model):
+    """Αποτέλεσμα μισθοδοσίας ανά εργαζόμενο (μισθοδοτική κατάσταση)"""
+
+    VALUES = (
+        "imeromisthio",
+        "paidia",
+        "meres",
+        "apodoxes",
+        "kr_enos",
+        "kr_etis",
+        "kr_total",
+        "forologiteo",
+        "foros",
+        "eea",
+        "pliroteo",
+    )
+
+    result = models.ForeignKey(
+        MisthodosiaResult, related_name="lines", on_delete=models.CASCADE
+    )
+    pro = models.ForeignKey(
+        Proslipsi, verbose_name="Εργαζόμενος", on_delete=models.CASCADE
+    )
+    imeromisthio = amount_field("Ημερομίσθιο")
+    paidia = models.IntegerField("Παιδιά", default=0)
+    meres = models.IntegerField("Μέρες", default=0)
+    apodoxes = amount_field("Αποδοχές")
+    kr_enos = amount_field("Κρατήσεις εργαζομένου")
+    kr_etis = amount_field("Κρατήσεις εργοδότη")
+    kr_total = amount_field("Κρατήσεις σύνολο")
+    forologiteo = amount_field("Φορολογητέο")
+    foros = amount_field("Φ.Μ.Υ.")
+    eea = amount_field("Ε.Ε.Α.")
+    pliroteo = amount_field("Πληρωτέο")
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΕΡΓΑΖΟΜΕΝΟ"
+        verbose_name_plural = "ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΕΡΓΑΖΟΜΕΝΟ"
+
+    def __str__(self):
+        return f"{self.result} {self.pro}"
+
+
+class MisthodosiaResultApodoxes(models.Model):
+    """Αποτέλεσμα μισθοδοσίας ανά εργαζόμενο-τύπο αποδοχών ΕΦΚΑ"""
+
+    result = models.ForeignKey(
+        MisthodosiaResult, related_name="apodoxes_lines", on_delete=models.CASCADE
+    )
+    pro = models.ForeignKey(
+        Proslipsi, verbose_name="Εργαζόμενος", on_delete=models.CASCADE
+    )
+    apodt = models.ForeignKey(
+        ApodoxesTypeEfka, verbose_name="Τύπος αποδοχών(ΕΦΚΑ)", on_delete=models.CASCADE
+    )
+    # Για τη σειρά των εργαζομένων και των τύπων αποδοχών στο αποτέλεσμα
+    last = models.IntegerField("Τελευταία περίοδος παρουσιών", default=0)
+    seq = models.IntegerField("Σειρά", default=0)
+    apod = amount_field("Αποδοχές")
+    meres = models.IntegerField("Μέρες", default=0)
+    argia = models.IntegerField("Κυριακές", default=0)
+    apo = models.DateField("Από", blank=True, null=True)
+    eos = models.DateField("Εως", blank=True, null=True)
+    imeromisthio = amount_field("Ημερομίσθιο")
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΤΥΠΟ ΑΠΟΔΟΧΩΝ"
+        verbose_name_plural = "ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΑΣ ΑΝΑ ΤΥΠΟ ΑΠΟΔΟΧΩΝ"
+
+    def __str__(self):
+        return f"{self.result} {self.pro} {self.apodt}"
+
+    def as_vals(self):
+        """Οι τιμές με τη δομή της Misthodosia.calc_misthodosia"""
+        return {
+            "apod": self.apod,
+            "meres": self.meres,
+            "argia": self.argia,
+            "apo": self.apo or "",
+            "eos": self.eos or "",
+            "imeromisthio": self.imeromisthio,
+            "kratiseis": {},
+        }
+
+
+class MisthodosiaResultKratisi(models.Model):
+    """Κρατήσεις ανά εργαζόμενο-τύπο αποδοχών ΕΦΚΑ-ΚΑΔ-ΕΙΔ-ΚΠΚ"""
+
+    result = models.ForeignKey(
+        MisthodosiaResult, related_name="kratiseis", on_delete=models.CASCADE
+    )
+    pro = models.ForeignKey(
+        Proslipsi, verbose_name="Εργαζόμενος", on_delete=models.CASCADE
+    )
+    apodt = models.ForeignKey(
+        ApodoxesTypeEfka, verbose_name="Τύπος αποδοχών(ΕΦΚΑ)", on_delete=models.CASCADE
+    )
+    eidkek = models.ForeignKey(
+        EidikotitaKek, verbose_name="ΚΑΔ-ΕΙΔ-ΚΠΚ", on_delete=models.CASCADE
+    )
+    enos = amount_field("Εργαζομένου")
+    etis = amount_field("Εργοδότη")
+    total = amount_field("Σύνολο")
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "ΑΠΟΤΕΛΕΣΜΑ ΜΙΣΘΟΔΟΣΙΑΣ ΚΡΑΤΗΣΕΙΣ"
+        verbose_name_plural = "ΑΠΟΤΕΛΕΣΜΑΤΑ ΜΙΣΘΟΔΟΣΙΑΣ ΚΡΑΤΗΣΕΙΣ"
+
+    def __str__(self):
+        return f"{self.result} {self.pro} {self.apodt} {self.eidkek}"
+
+    def as_vals(self):
+        return {"enos": self.enos, "etis": self.etis, "total": self.total}
+
+
+class MisthodosiaResultDirty(models.Model):
+    """Εργαζόμενοι του αποτελέσματος που πρέπει να υπολογιστούν ξανά"""
+
+    result = models.ForeignKey(
+        MisthodosiaResult, related_name="dirty", on_delete=models.CASCADE
+    )
+    pro = models.ForeignKey(
+        Proslipsi, verbose_name="Εργαζόμενος", on_delete=models.CASCADE
+    )
+
+    class Meta:
+        unique_together = ("result", "pro")
+        verbose_name = "ΑΛΛΑΓΗ ΑΠΟΤΕΛΕΣΜΑΤΟΣ ΜΙΣΘΟΔΟΣΙΑΣ"
+        verbose_name_plural = "ΑΛΛΑΓΕΣ ΑΠΟΤΕΛΕΣΜΑΤΟΣ ΜΙΣΘΟΔΟΣΙΑΣ"
+
+    def __str__(self):
+        return f"{self.result} {self.pro}"
+
+
 class Formula(models.Model):
+    REFERENCE = "formula"
+
     part = models.ForeignKey(
         ParousiaType, verbose_name="Τύπος Παρουσίας", on_delete=models.PROTECT
     )
@@ -1066,6 +1631,20 @@ class Formula(models.Model):
     argiaefka = models.BooleanField("Σε Κυριακές για ΕΦΚΑ", default=False)
     evalu = models.TextField("Τύπος υπολογισμού")
 
+    objects = ReferenceQuerySet.as_manager()
+
+    def clean(self):
+        try:
+            compile_formula(self.evalu, formulas.names)
+        except FormulaError as err:
+            raise ValidationError({"evalu": str(err)})
+
+    def calc(self, **names):
+        """Υπολογίζει τον τύπο με τις μεταβλητές val, misthos,
+        imeromisthio, oromisthio
+        """
+        return formulas.get(self.pk, self.evalu)(**names)
+
     class Meta:
         verbose_name = "ΤΥΠΟΣ ΥΠΟΛΟΓΙΣΜΟΥ"
         verbose_name_plural = "ΤΥΠΟΙ ΥΠΟΛΟΓΙΣΜΟΥ"
@@ -1089,19 +1668,6 @@ class Apd(models.Model):
 
     misthodosies.short_description = "Μισθοδοσίες"
 
-    def join_mis(self):
-        """
-        Ενώνει τις μισθοδοσίες των περιόδων με κλειδί τον εργαζόμενο ...
-        """
-        fin = {}
-        for fmydet in self.fmydetails_set.all():
-            _, mis, totals = fmydet.mis.calc_misthodosia_foroi()
-            if totals["pliroteo"] <= 0:
-                continue
-            for lin in mis:
-                pass
-        return fin
-
     class Meta:
         unique_together = ("etos", "minas", "apdtype")
         ordering = ["-etos", "-minas", "-apdtype"]
@@ -1111,125 +1677,217 @@ class Apd(models.Model):
     def __str__(self):
         return f"{self.etos} {self.minas} {self.apdtype} ({self.misthodosies()})"
 
-    def join_mis(self):
+    def results(self):
+        """Τα αποτελέσματα (MisthodosiaResult) των μισθοδοσιών της ΑΠΔ"""
+        return [
+            apddet.mis.snapshot() for apddet in self.apddetails_set.select_related("mis")
+        ]
+
+    def join_mis(self, results=None, parartima=None):
         """
         Ενώνει τις μισθοδοσίες των περιόδων με κλειδί τον εργαζόμενο ...
+
+        Γεννήτρια (pro, {τύπος αποδοχών: τιμές}) σε σειρά ΑΜΑ. Κάθε
+        μισθοδοσία διαβάζεται ταξινομημένη (MisthodosiaResult.iter_res) και
+        οι μισθοδοσίες συγχωνεύονται (k-way merge), οπότε στη μνήμη είναι
+        μόνο ένας εργαζόμενος κάθε φορά. Με parartima μόνο οι εργαζόμενοι
+        του παραρτήματος.
         """
-        fin = {}
-        for apddet in self.apddetails_set.all():
-            for pro, prod in apddet.mis.calc_misthodosia().items():
-                fin[pro] = fin.get(pro, {})
+        if results is None:
+            results = self.results()
+        merged = merge_sorted(
+            [result.iter_res(parartima=parartima) for result in results]
+        )
+        for key, blocks in merged:
+            pro = blocks[0][0]
+            fin = {}
+            for _, prod in blocks:
                 for mtyp, mtypd in prod.items():
                     # Δεν επιτρέπεται να υπάρχει δύο φορές ο τύπος μισθοδοσίας
-                    if mtyp in fin[pro]:
-                        raise ValueError
-                    fin[pro][mtyp] = mtypd
-        return fin
-
-    def calc_totals(self, result):
+                    if mtyp in fin:
+                        raise ValueError(
+                            f"{pro}: Ο τύπος αποδοχών {mtyp} υπάρχει σε δύο μισθοδοσίες"
+                        )
+                    fin[mtyp] = mtypd
+            yield pro, fin
+
+    def totals_by_parartima(self, results=None):
+        """{id παραρτήματος: (μέρες, αποδοχές, εισφορές)} με ένα GROUP BY
+        παράρτημα στις αποδοχές και ένα στις κρατήσεις των μισθοδοσιών
+        """
+        if results is None:
+            results = self.results()
+        totals = {}
+        for par_id, meres, apod in (
+            MisthodosiaResultApodoxes.objects.filter(result__in=results)
+            .values_list("pro__parartima")
+            .annotate(Sum("meres"), Sum("apod"))
+            .order_by("pro__parartima")
+        ):
+            totals[par_id] = (meres, apod, 0)
+        for par_id, eisf in (
+            MisthodosiaResultKratisi.objects.filter(result__in=results)
+            .values_list("pro__parartima")
+            .annotate(Sum("total"))
+            .order_by("pro__parartima")
+        ):
+            meres, apod, _ = totals.get(par_id, (0, 0, 0))
+            totals[par_id] = (meres, apod, eisf)
+        return totals
+
+    def calc_totals(self, results=None, parartima=None):
+        """Μέρες, αποδοχές και εισφορές όλων των εργαζομένων (ή μόνο του
+        παραρτήματος)
+        """
+        totals = self.totals_by_parartima(results)
+        if parartima is not None:
+            return totals.get(parartima.pk, (0, 0, 0))
         tmeres = tapod = teisf = 0
-        for pro, dapo in result.items():
-            for typeapo, vals in dapo.items():
-                tmeres += vals["meres"]
-                tapod += vals["apod"]
-                for eidkek, vls in vals["kratiseis"].items():
-                    teisf += vls["total"]
+        for meres, apod, eisf in totals.values():
+            tmeres += meres
+            tapod += apod
+            teisf += eisf
         return tmeres, tapod, teisf
 
-    def apd2text(self):
-        parartima = CompanyParartima.objects.get(pk=1)
-        data = self.join_mis()
-        tmeres, tapod, teisf = self.calc_totals(data)
-        tx1 = []
-        tx1.append("1")
-        tx1.append("01")
-        tx1.append("01")
-        tx1.append("CSL01   ")
-        tx1.append("01")
-        tx1.append(f"{self.apdtype.id:02d}")
-        tx1.append(f"{parartima.efkayp.ypno:03d}")
-        tx1.append(fill_spaces(parartima.efkayp.ypnam, 50))
-        tx1.append(fill_spaces(parartima.company.epon, 80))
-        tx1.append(fill_spaces(parartima.company.name, 30))
-        tx1.append(fill_spaces(parartima.company.patr, 30))
-        tx1.append(fill_spaces(parartima.company.ame, 10))
-        tx1.append(fill_spaces(parartima.company.afm, 9))
-        tx1.append(fill_spaces(parartima.adodo, 50))
-        tx1.append(fill_spaces(parartima.adnum, 10))
-        tx1.append(fill_spaces(parartima.adtk, 5))
-        tx1.append(fill_spaces(parartima.adpol, 30))
-        tx1.append(fill_spaces(self.minas.code, 2))
-        tx1.append(fill_spaces(f"{self.etos}", 4))
-        tx1.append(fill_spaces(self.minas.code, 2))
-        tx1.append(fill_spaces(f"{self.etos}", 4))
-        # Σύνολα ΑΠΔ
-        tx1.append(f"{tmeres:08d}")
-        tx1.append(decimal2flat(tapod, 12))
-        tx1.append(decimal2flat(teisf, 12))
-        tx1.append(isodate2flat(f"{self.ekdosi}"))
-        tx1.append(isodate2flat(""))  # Παύση εργασιών
-        tx1.append(fill_spaces("", 30))
-        header = "".join(tx1)
-        assert len(header) == 414
-        apd_list = [header]
-        for pro, dapo in data.items():
-            tx2 = ["2"]
-            tx2.append(leading_zeroes(pro.erg.ama, 9))
-            tx2.append(pro.erg.amka)
-            tx2.append(fill_spaces(pro.erg.epo, 50))
-            tx2.append(fill_spaces(pro.erg.ono, 30))
-            tx2.append(fill_spaces(pro.erg.pat, 30))
-            tx2.append(fill_spaces(pro.erg.mit, 30))
-            tx2.append(isodate2flat(pro.erg.gen))
-            tx2.append(pro.erg.afm)
-            erg_line = "".join(tx2)
-            assert len(erg_line) == 178
-            apd_list.append(erg_line)
+    def parartimata(self, results=None):
+        """Τα παραρτήματα με εργαζόμενους στις μισθοδοσίες της ΑΠΔ"""
+        if results is None:
+            results = self.results()
+        return CompanyParartima.objects.select_related(
+            "company", "efkayp"
+        ).filter(
+            pk__in=MisthodosiaResultApodoxes.objects.filter(
+                result__in=results
+            ).values("pro__parartima")
+        )
+
+    def apd_lines(self, parartima=None, totals=None, results=None):
+        """Οι γραμμές του αρχείου ΑΠΔ μία-μία (χωρίς αλλαγή γραμμής)
+
+        parartima: Αρχείο μόνο για τους εργαζόμενους του παραρτήματος, με
+                   τα στοιχεία του στην εγγραφή 1. Χωρίς αυτό το αρχείο έχει
+                   όλους τους εργαζόμενους και τα στοιχεία του παραρτήματος 1.
+        totals   : (μέρες, αποδοχές, εισφορές) της εγγραφής 1 αν έχουν ήδη
+                   υπολογιστεί (totals_by_parartima)
+        results  : Τα αποτελέσματα των μισθοδοσιών αν τα έχει ήδη ο καλών
+                   (results)
+        """
+        if results is None:
+            results = self.results()
+        if totals is None:
+            totals = self.calc_totals(results, parartima)
+        tmeres, tapod, teisf = totals
+        records = parartima
+        if parartima is None:
+            parartima = CompanyParartima.objects.get(pk=1)
+        yield layouts.APD_HEADER.format(
+            apdtype=self.apdtype.id,
+            ypno=parartima.efkayp.ypno,
+            ypnam=parartima.efkayp.ypnam,
+            epon=parartima.company.epon,
+            name=parartima.company.name,
+            patr=parartima.company.patr,
+            ame=parartima.company.ame,
+            afm=parartima.company.afm,
+            adodo=parartima.adodo,
+            adnum=parartima.adnum,
+            adtk=parartima.adtk,
+            adpol=parartima.adpol,
+            apo_minas=self.minas.code,
+            apo_etos=self.etos,
+            eos_minas=self.minas.code,
+            eos_etos=self.etos,
+            meres=tmeres,
+            apodoxes=tapod,
+            eisfores=teisf,
+            ekdosi=self.ekdosi,
+        )
+        from .loaders import ApdContext
+
+        context = ApdContext(results, records)
+        for pro, dapo in self.join_mis(results, records):
+            erg = pro.erg
+            yield layouts.APD_ERGAZOMENOS.format(
+                ama=erg.ama,
+                amka=erg.amka,
+                epo=erg.epo,
+                ono=erg.ono,
+                pat=erg.pat,
+                mit=erg.mit,
+                gen=erg.gen,
+                afm=erg.afm,
+            )
+            info = context[pro.pk]
             for typeapo, vals in dapo.items():
-                eid_kek_set = pro.eid.eidikotitakek_set.all()[0]
-                tx3 = ["3"]
-                tx3.append(leading_zeroes(pro.parartima.parno, 4))
-                tx3.append(eid_kek_set.kad)
-                tx3.append(str(pro.apeid.plires_orario_int()))
-                tx3.append(str(pro.apeid.oles_ergasimes_int()))
-                tx3.append(leading_zeroes(vals["argia"], 1))
-                tx3.append(eid_kek_set.eidefka)
-                tx3.append("00")
-                tx3.append(leading_zeroes(eid_kek_set.kpk.kpk, 4))
-                tx3.append(fill_spaces(self.minas.code, 2))
-                tx3.append(fill_spaces(f"{self.etos}", 4))
-                tx3.append(isodate2flat(vals["apo"]))
-                tx3.append(isodate2flat(vals["eos"]))
-                tx3.append(typeapo.apodtypeefka)
-                tx3.append(leading_zeroes(vals["meres"], 3))
-                tx3.append(decimal2flat(pro.imeromisthio_for_apd(), 10))
-                tx3.append(decimal2flat(vals["apod"], 10))
+                apodoxes = dict(
+                    parno=info.parno,
+                    kad=info.kad,
+                    plires_orario=info.plires_orario,
+                    oles_ergasimes=info.oles_ergasimes,
+                    argia=vals["argia"],
+                    eidefka=info.eidefka,
+                    kpk=info.kpk,
+                    minas=self.minas.code,
+                    etos=self.etos,
+                    apo=vals["apo"],
+                    eos=vals["eos"],
+                    apodtypeefka=typeapo.apodtypeefka,
+                    meres=vals["meres"],
+                    imeromisthio=vals["imeromisthio"],
+                    apodoxes=vals["apod"],
+                )
                 for eidkek, vls in vals["kratiseis"].items():
-                    tx4 = []
-                    tx4.append(decimal2flat(vls["enos"], 10))
-                    tx4.append(decimal2flat(vls["etis"], 10))
-                    tx4.append(decimal2flat(vls["total"], 11))
-                    tx4.append(decimal2flat(0, 10))
-                    tx4.append(decimal2flat(0, 5))
-                    tx4.append(decimal2flat(0, 10))
-                    tx4.append(decimal2flat(vls["total"], 11))
-                    eisf_line = "".join(tx3 + tx4)
-                    assert len(eisf_line) == 139
-                    apd_list.append(eisf_line)
-        return "\n".join(apd_list + ["EOF"])
+                    yield layouts.APD_EISFORES.format(
+                        **apodoxes,
+                        enos=vls["enos"],
+                        etis=vls["etis"],
+                        total=vls["total"],
+                        katavlitees=vls["total"],
+                    )
+        yield "EOF"
+
+    def apd_branches(self, results=None):
+        """Τα αρχεία του zip της ΑΠΔ ως [(όνομα, παράρτημα)]: Ένα CSL01 ανά
+        παράρτημα με εργαζόμενους (<αρ. παραρτήματος>/CSL01). Αν οι
+        εργαζόμενοι είναι σε ένα μόνο παράρτημα, σκέτο CSL01 (και χωρίς
+        εργαζόμενους CSL01 με παράρτημα None).
+        """
+        parartimata = list(self.parartimata(results).order_by("parno"))
+        if len(parartimata) <= 1:
+            return [("CSL01", parartimata[0] if parartimata else None)]
+        return [(f"{parartima.parno}/CSL01", parartima) for parartima in parartimata]
+
+    def apd_members(self, results=None, totals=None):
+        """Τα αρχεία του zip της ΑΠΔ (apd_branches) ως [(όνομα, γραμμές)]
+
+        results και totals (totals_by_parartima) αν τα έχει ήδη ο καλών.
+        """
+        if results is None:
+            results = self.results()
+        if totals is None:
+            totals = self.totals_by_parartima(results)
+        return [
+            (
+                name,
+                self.apd_lines(
+                    parartima,
+                    None if parartima is None else totals[parartima.pk],
+                    results,
+                ),
+            )
+            for name, parartima in self.apd_branches(results)
+        ]
+
+    def apd2text(self):
+        return "\n".join(self.apd_lines())
 
     def apd2file(self, filename):
         with open(filename, "w", encoding="WINDOWS-1253") as fil:
             fil.write(self.apd2text())
         print(f"File {filename} created !!!")
 
-    def apd2stream(self):
-        # from io import StringIO
-        txt_data = self.apd2text()
-        if txt_data is None:
-            return None, None
-        filename = f"apd-{self.etos}{self.minas.code}-{self.apdtype.code()}.zip"
-        return create_zip_stream(txt_data, "CSL01"), filename
+    def apd_filename(self):
+        return f"apd-{self.etos}{self.minas.code}-{self.apdtype.code()}.zip"
 
     def calc_print(self):
         res = self.calc_apd()
@@ -1258,17 +1916,20 @@ class ApdDetails(models.Model):
         return f"{self.apd}{self.mis}"
 
 
-class Fmy(models.Model):
+class Fmy(PeriodModel, models.Model):
     etos = models.IntegerField("Έτος", default=2021)
     minas = models.ForeignKey(Minas, verbose_name="Περίοδος", on_delete=models.PROTECT)
     cdate = models.DateField("Ημερομηνία έκδοσης")
+    period = models.IntegerField("Περίοδος", editable=False, db_index=True)
+
+    objects = PeriodQuerySet.as_manager()
 
     def cdate_yyymmdd(self):
         return self.cdate.isoformat().replace("-", "")
 
     class Meta:
         unique_together = ("etos", "minas")
-        ordering = ["-etos", "-minas"]
+        ordering = ["-period"]
         verbose_name = "ΜΙΣΘΟΔΟΣΙΕΣ ΦΜΥ"
         verbose_name_plural = "ΜΙΣΘΟΔΟΣΙΕΣ ΦΜΥ"
 
@@ -1277,110 +1938,114 @@ class Fmy(models.Model):
 
     def periodos(self):
         """ReturnsYYYYMM as integer"""
-        return int(str(self.etos) + self.minas.code)
+        return self.period
 
-    def join_mis(self):
+    def results(self):
+        """Τα αποτελέσματα (MisthodosiaResult) των μισθοδοσιών του ΦΜΥ με
+        πληρωτέο
         """
-        Ενώνει τις μισθοδοσίες των περιόδων με κλειδί τον εργαζόμενο ...
-        """
-        fin = {}
+        results = []
+        for fmydet in self.fmydetails_set.select_related("mis"):
+            result = fmydet.mis.snapshot()
+            if result.pliroteo > 0:
+                results.append(result)
+        return results
+
+    def calc_totals(self, results=None):
+        """Τα σύνολα του ΦΜΥ από τα σύνολα των μισθοδοσιών"""
+        if results is None:
+            results = self.results()
         tot = {"apo": 0, "kra": 0, "kath": 0, "foros": 0, "eea": 0}
-        for fmydet in self.fmydetails_set.all():
-            _, mis, totals = fmydet.mis.calc_misthodosia_foroi()
-            if totals["pliroteo"] <= 0:
-                continue
-            tot["apo"] += totals["apodoxes"]
-            tot["kra"] += totals["kr_enos"]
-            tot["foros"] += totals["foros"]
-            tot["eea"] += totals["eea"]
-            for lin in mis:
-                afm = lin["pro"].erg.afm
-                fin[afm] = fin.get(
-                    afm,
-                    {
-                        "pro": lin["pro"],
-                        "apo": 0,
-                        "kra": 0,
-                        "kath": 0,
-                        "foros": 0,
-                        "eea": 0,
-                    },
-                )
-                # epo = lin['pro'].erg.epo
-                # ono = lin['pro'].erg.ono
-                # pat = lin['pro'].erg.pat
-                # amka = lin['pro'].erg.amka
-                # paidia = lin['pro'].erg.paidia(self.periodos())
-                fin[afm]["apo"] += lin["apodoxes"]
-                fin[afm]["kra"] += lin["kr_enos"]
-                fin[afm]["kath"] += lin["forologiteo"]
-                fin[afm]["foros"] += lin["foros"]
-                fin[afm]["eea"] += lin["eea"]
+        for result in results:
+            tot["apo"] += result.apodoxes
+            tot["kra"] += result.kr_enos
+            tot["foros"] += result.foros
+            tot["eea"] += result.eea
         tot["kath"] = tot["apo"] - tot["kra"]
-        return fin, tot
+        return tot
 
-    def fmy2text(self):
-        fin, totals = self.join_mis()
+    def join_mis(self, results=None):
+        """
+        Ενώνει τις μισθοδοσίες των περιόδων με κλειδί τον εργαζόμενο ...
+
+        Γεννήτρια (ΑΦΜ, σύνολα) σε σειρά ΑΦΜ με k-way merge των γραμμών των
+        μισθοδοσιών (MisthodosiaResult.iter_foroi).
+        """
+        if results is None:
+            results = self.results()
+        for afm, lines in merge_sorted([result.iter_foroi() for result in results]):
+            vals = {
+                "pro": lines[0]["pro"],
+                "paidia": lines[0]["paidia"],
+                "apo": 0,
+                "kra": 0,
+                "kath": 0,
+                "foros": 0,
+                "eea": 0,
+            }
+            for lin in lines:
+                vals["apo"] += lin["apodoxes"]
+                vals["kra"] += lin["kr_enos"]
+                vals["kath"] += lin["forologiteo"]
+                vals["foros"] += lin["foros"]
+                vals["eea"] += lin["eea"]
+            yield afm, vals
+
+    def fmy_lines(self):
+        """Οι γραμμές του αρχείου ΦΜΥ μία-μία ή None αν δεν υπάρχουν
+        αποδοχές
+        """
+        results = self.results()
+        totals = self.calc_totals(results)
         if totals["apo"] == 0:
             return None
-        lines = []
-        li0 = f"0JL10    {self.cdate_yyymmdd()}{self.etos}{' '*127}"
-        assert len(li0) == 148
-        lines.append(li0)
-        li1 = f"1{self.etos}"
+        return self._fmy_records(self.join_mis(results), totals)
+
+    def _fmy_records(self, fin, totals):
+        yield layouts.FMY_HEADER.format(cdate=self.cdate_yyymmdd(), etos=self.etos)
         company = Company.objects.get(pk=1)
-        li1 += fill_spaces_cut(company.epon, 18)
-        li1 += fill_spaces_cut(company.name, 9)
-        li1 += fill_spaces_cut(company.patr, 3)
-        li1 += f"{company.ctyp.fmytype}"
-        li1 += fill_spaces_cut(company.afm, 9)
-        li1 += fill_spaces_cut(company.dra, 16)
         parartima = company.companyparartima_set.get(pk=1)
-        li1 += fill_spaces_cut(parartima.adpol, 10)
-        li1 += fill_spaces_cut(parartima.adodo, 16)
-        li1 += fill_spaces_cut(parartima.adnum, 5)
-        li1 += fill_spaces_cut(parartima.adtk, 5)
-        li1 += fill_spaces(self.minas.code, 2)
-        li1 += fill_spaces("", 49)
-        assert len(li1) == 148
-        lines.append(li1)
-        li2 = "2"
-        li2 += decimal2flat(totals["apo"], 16)
-        li2 += decimal2flat(totals["kra"], 16)
-        li2 += decimal2flat(totals["kath"], 16)
-        li2 += decimal2flat(0, 15)
-        li2 += decimal2flat(totals["foros"], 15)
-        li2 += decimal2flat(totals["eea"], 15)
-        li2 += decimal2flat(0, 14)
-        li2 += decimal2flat(0, 13)
-        li2 += fill_spaces("", 27)
-        assert len(li2) == 148
-        lines.append(li2)
-        for afm, vls in fin.items():
+        yield layouts.FMY_ERGODOTIS.format(
+            etos=self.etos,
+            epon=company.epon,
+            name=company.name,
+            patr=company.patr,
+            fmytype=company.ctyp.fmytype,
+            afm=company.afm,
+            dra=company.dra,
+            adpol=parartima.adpol,
+            adodo=parartima.adodo,
+            adnum=parartima.adnum,
+            adtk=parartima.adtk,
+            minas=self.minas.code,
+        )
+        yield layouts.FMY_SYNOLA.format(
+            apo=totals["apo"],
+            kra=totals["kra"],
+            kath=totals["kath"],
+            foros=totals["foros"],
+            eea=totals["eea"],
+        )
+        for afm, vls in fin:
             erg = vls["pro"].erg
-            li3 = f"3{afm} "
-            li3 += fill_spaces_cut(erg.epo, 18)
-            li3 += fill_spaces_cut(erg.ono, 9)
-            li3 += fill_spaces_cut(erg.pat, 3)
-            li3 += fill_spaces(erg.amka, 11)
-            paidia = erg.paidia(self.periodos())
-            li3 += leading_zeroes(paidia, 2)
-            li3 += "01"
-            li3 += decimal2flat(vls["apo"], 11)
-            li3 += decimal2flat(vls["kra"], 10)
-            li3 += decimal2flat(vls["kath"], 11)
-            li3 += "0"
-            li3 += fill_spaces("", 2)
-            li3 += leading_zeroes(0, 2)
-            li3 += leading_zeroes(0, 5)
-            li3 += decimal2flat(vls["foros"], 10)
-            li3 += decimal2flat(vls["eea"], 10)
-            li3 += decimal2flat(0, 9)
-            li3 += decimal2flat(0, 8)
-            li3 += leading_zeroes(0, 4)
-            li3 += fill_spaces("", 9)
-            assert len(li3) == 148
-            lines.append(li3)
+            yield layouts.FMY_DIKAIOUXOS.format(
+                afm=afm,
+                epo=erg.epo,
+                ono=erg.ono,
+                pat=erg.pat,
+                amka=erg.amka,
+                paidia=vls["paidia"],
+                apo=vls["apo"],
+                kra=vls["kra"],
+                kath=vls["kath"],
+                foros=vls["foros"],
+                eea=vls["eea"],
+            )
+
+    def fmy2text(self):
+        lines = self.fmy_lines()
+        if lines is None:
+            return None
         return "\n".join(lines)
 
     # def fmy2file(self):
@@ -1392,13 +2057,8 @@ class Fmy(models.Model):
     #     create_zip(txt_data, filename)
     #     print(f'file {filename} created !!!')
 
-    def fmy2stream(self):
-        # from io import StringIO
-        txt_data = self.fmy2text()
-        if txt_data is None:
-            return None, None
-        filename = f"fmy-{self.etos}{self.minas.code}.zip"
-        return create_zip_stream(txt_data), filename
+    def fmy_filename(self):
+        return f"fmy-{self.etos}{self.minas.code}.zip"
 
 
 class FmyDetails(models.Model):
@@ -1414,3 +2074,134 @@ class FmyDetails(models.Model):
 
     def __str__(self):
         return f"{self.fmy} {self.mis}"
+
+
+class ExportJob(models.Model):
+    """Δημιουργία αρχείου στο παρασκήνιο (βλ. mis/jobs.py)
+
+    Το αρχείο ΑΠΔ ή ΦΜΥ (kind export) γράφεται στο cache των αρχείων
+    (mis/exports.py) με κλειδί το key. Τα υπόλοιπα είδη (π.χ. πακέτο
+    αρχείων με params {"items": [[είδος, id], ...]} ή αποδείξεις πληρωμής
+    με params {"misthodosia": id}) γράφουν το filename
+    στο path() της εργασίας. Το progress ενημερώνεται όσο γράφονται οι
+    εγγραφές, ενώ το total είναι το αναμενόμενο πλήθος τους. Το owner
+    (host:pid) είναι η διεργασία που τρέχει την εργασία και το heartbeat η
+    τελευταία φορά που ενημέρωσε την εγγραφή.
+    """
+
+    EXPORT = "export"
+    BUNDLE = "bundle"
+    PAYSLIPS = "payslips"
+    KIND_CHOICES = [
+        (EXPORT, "Αρχείο δήλωσης"),
+        (BUNDLE, "Πακέτο αρχείων"),
+        (PAYSLIPS, "Αποδείξεις πληρωμής"),
+    ]
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    EMPTY = "empty"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Σε αναμονή"),
+        (RUNNING, "Σε εξέλιξη"),
+        (DONE, "Ολοκληρώθηκε"),
+        (EMPTY, "Χωρίς δεδομένα"),
+        (FAILED, "Απέτυχε"),
+    ]
+    FINISHED = (DONE, EMPTY, FAILED)
+
+    kind = models.CharField(
+        "Είδος", max_length=10, choices=KIND_CHOICES, default=EXPORT
+    )
+    params = models.JSONField("Παράμετροι", default=dict, blank=True)
+    apd = models.ForeignKey(
+        Apd, verbose_name="ΑΠΔ", null=True, blank=True, on_delete=models.CASCADE
+    )
+    fmy = models.ForeignKey(
+        Fmy, verbose_name="ΦΜΥ", null=True, blank=True, on_delete=models.CASCADE
+    )
+    status = models.CharField(
+        "Κατάσταση", max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    progress = models.IntegerField("Εγγραφές", default=0)
+    total = models.IntegerField("Εγγραφές συνολικά", default=0)
+    key = models.CharField("Κλειδί αρχείου", max_length=64, blank=True)
+    filename = models.CharField("Αρχείο", max_length=100, blank=True)
+    error = models.TextField("Λάθος", blank=True)
+    created = models.DateTimeField("Δημιουργήθηκε", auto_now_add=True)
+    finished = models.DateTimeField("Ολοκληρώθηκε", null=True, blank=True)
+    owner = models.CharField("Διεργασία", max_length=100, blank=True)
+    heartbeat = models.DateTimeField("Τελευταία ενημέρωση", null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created"]
+        verbose_name = "ΕΡΓΑΣΙΑ ΑΡΧΕΙΟΥ"
+        verbose_name_plural = "ΕΡΓΑΣΙΕΣ ΑΡΧΕΙΩΝ"
+
+    def __str__(self):
+        target = self.apd or self.fmy or self.get_kind_display()
+        return f"{target} ({self.get_status_display()})"
+
+    def export(self):
+        """Το mis.exports.Export της δήλωσης"""
+        from . import exports
+
+        if self.apd_id:
+            return exports.apd_export(self.apd)
+        return exports.fmy_export(self.fmy)
+
+    def path(self):
+        """Το αρχείο εργασίας που δεν είναι δήλωση ή None αν το cache των
+        αρχείων είναι κλειστό
+        """
+        folder = getattr(settings, "MIS_EXPORT_CACHE_DIR", None)
+        if not folder or not self.filename:
+            return None
+        return os.path.join(folder, "jobs", str(self.pk), self.filename)
+
+    def percent(self):
+        if self.status == self.DONE:
+            return 100
+        if not self.total:
+            return 0
+        return min(99, self.progress * 100 // self.total)
+
+    def is_finished(self):
+        return self.status in self.FINISHED
+
+
+class ReferenceVersion(models.Model):
+    """Η έκδοση ενός πίνακα αναφοράς που κρατιέται στη μνήμη των διεργασιών
+    (mis/registry.py). Αλλάζει σε κάθε αλλαγή του πίνακα (signals,
+    ReferenceQuerySet), οπότε κάθε διεργασία ξέρει πότε να τον ξαναφορτώσει.
+    """
+
+    name = models.CharField("Πίνακας", max_length=30, unique=True)
+    version = models.PositiveBigIntegerField("Έκδοση", default=0)
+
+    class Meta:
+        verbose_name = "ΕΚΔΟΣΗ ΠΙΝΑΚΑ ΑΝΑΦΟΡΑΣ"
+        verbose_name_plural = "ΕΚΔΟΣΕΙΣ ΠΙΝΑΚΩΝ ΑΝΑΦΟΡΑΣ"
+
+    def __str__(self):
+        return f"{self.name} {self.version}"
+
+    @classmethod
+    def current(cls, name):
+        """Η έκδοση του πίνακα name (0 αν δεν έχει αλλάξει ποτέ)"""
+        return (
+            cls.objects.filter(name=name).values_list("version", flat=True).first()
+            or 0
+        )
+
+    @classmethod
+    def bump(cls, name):
+        """Νέα έκδοση του πίνακα name"""
+        if not cls.objects.filter(name=name).update(version=F("version") + 1):
+            version, created = cls.objects.get_or_create(
+                name=name, defaults={"version": 1}
+            )
+            if not created:
+                cls.objects.filter(pk=version.pk).update(version=F("version") + 1)
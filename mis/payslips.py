@@ -0,0 +1,156 @@
+"""
+Αποδείξεις πληρωμής εργαζομένων μιας μισθοδοσίας σε PDF
+
+Τα στοιχεία όλων των εργαζομένων διαβάζονται μαζί στην κύρια διεργασία
+(δύο queries στο αποτέλεσμα της μισθοδοσίας) και γίνονται κείμενο. Τα PDF
+φτιάχνονται σε ProcessPoolExecutor χωρίς πρόσβαση στη βάση: ένα ανά
+εργαζόμενο και ένα με όλες τις αποδείξεις. Κάθε διεργασία αναλύει τα fonts
+μία φορά (mispdf.txt2pdf.load_fonts). Τα αρχεία γράφονται σε φάκελο ή σε
+zip (π.χ. από εργασία στο παρασκήνιο, mis/jobs.py).
+"""
+import os
+import time
+import zipfile
+from collections import defaultdict
+from contextlib import contextmanager
+from mispdf.txt2pdf import PDF, load_fonts
+from .compute import process_imap
+
+TITLE = "ΑΠΟΔΕΙΞΗ ΠΛΗΡΩΜΗΣ ΑΠΟΔΟΧΩΝ"
+COMBINED = "apodeixeis.pdf"
+WIDTH = 80
+
+# Οι γραμμές συνόλων της απόδειξης (πεδίο MisthodosiaResultLine, περιγραφή)
+SUMS = (
+    ("apodoxes", "Σύνολο αποδοχών"),
+    ("kr_enos", "Κρατήσεις ΕΦΚΑ εργαζομένου"),
+    ("foros", "Φ.Μ.Υ."),
+    ("eea", "Ε.Ε.Α."),
+)
+
+
+def _row(label, *values):
+    values = "".join(f"{value:>14}" for value in values)
+    return f"{label[:WIDTH - len(values)]:<{WIDTH - len(values)}}{values}"
+
+
+def slip_text(misthodosia, line, apodoxes):
+    """Το κείμενο της απόδειξης ενός εργαζομένου
+
+    line    : MisthodosiaResultLine (με pro__erg, pro__eid, pro__parartima__company)
+    apodoxes: Οι MisthodosiaResultApodoxes του εργαζομένου (με apodt)
+    """
+    pro, erg = line.pro, line.pro.erg
+    company = pro.parartima.company
+    rows = [
+        f"{company.eponymia}  ΑΦΜ: {company.afm}",
+        f"{misthodosia}",
+        "",
+        f"Εργαζόμενος : {erg.onomatep}",
+        f"ΑΦΜ: {erg.afm}  ΑΜΚΑ: {erg.amka}  ΑΜ ΙΚΑ: {erg.ama}",
+        f"Ειδικότητα  : {pro.eid.eid}",
+        f"Ημερομίσθιο : {line.imeromisthio}  Παιδιά: {line.paidia}",
+        "",
+        _row("ΑΠΟΔΟΧΕΣ", "ΜΕΡΕΣ", "ΠΟΣΟ"),
+        "-" * WIDTH,
+    ]
+    for apod in apodoxes:
+        rows.append(_row(apod.apodt.per, apod.meres, apod.apod))
+    rows.append("-" * WIDTH)
+    for field, label in SUMS:
+        rows.append(_row(label, getattr(line, field)))
+    rows.append("=" * WIDTH)
+    rows.append(_row("ΠΛΗΡΩΤΕΟ", line.pliroteo))
+    rows += ["", "", _row("Ο εργοδότης", "Ο εργαζόμενος")]
+    return "\n".join(rows)
+
+
+def slips(misthodosia):
+    """[(όνομα αρχείου, κείμενο)] για κάθε εργαζόμενο κατά ονοματεπώνυμο"""
+    result = misthodosia.snapshot()
+    apodoxes = defaultdict(list)
+    for apod in result.apodoxes_lines.select_related("apodt").order_by(
+        "pro_id", "seq"
+    ):
+        apodoxes[apod.pro_id].append(apod)
+    lines = sorted(
+        result.lines.select_related(
+            "pro__erg", "pro__eid", "pro__parartima__company"
+        ),
+        key=lambda line: (line.pro.erg.onomatep, line.pro_id),
+    )
+    return [
+        (
+            f"{line.pro.erg.afm}-{line.pro_id}.pdf",
+            slip_text(misthodosia, line, apodoxes[line.pro_id]),
+        )
+        for line in lines
+    ]
+
+
+def render(item):
+    """(όνομα, PDF, σελίδες) για μία ή περισσότερες αποδείξεις (τρέχει και σε
+    διεργασία)
+    """
+    filename, footer, texts, cached = item
+    pdf = PDF(TITLE, footer, cached=cached, orientation="P")
+    pdf.alias_nb_pages()
+    for text in texts:
+        pdf.add_text(text)
+    return filename, bytes(pdf.output()), pdf.pages_count
+
+
+@contextmanager
+def _writer(output):
+    """Συνάρτηση write(όνομα, bytes) που γράφει στο φάκελο ή στο zip output"""
+    if isinstance(output, (str, os.PathLike)):
+        os.makedirs(output, exist_ok=True)
+
+        def write(filename, content):
+            with open(os.path.join(output, filename), "wb") as fil:
+                fil.write(content)
+
+        yield write
+    else:
+        # Τα PDF είναι ήδη συμπιεσμένα
+        with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as archive:
+            yield archive.writestr
+
+
+def build(
+    misthodosia, output, workers=None, cached=True, progress=None, mp_context=None
+):
+    """Γράφει τις αποδείξεις της misthodosia και επιστρέφει μετρήσεις
+
+    Κάθε PDF γράφεται μόλις γίνει, οπότε στη μνήμη δεν μένουν όλα μαζί.
+    output    : Φάκελος ή αρχείο (fileobj) όπου γράφεται zip
+    workers   : Αριθμός διεργασιών. Με None ή 1 τα PDF φτιάχνονται σειριακά.
+    cached    : Με False τα fonts αναλύονται σε κάθε PDF (για σύγκριση)
+    progress  : Καλείται με το πλήθος των PDF που έχουν γίνει
+    mp_context: Το multiprocessing context (βλ. compute.process_imap)
+    """
+    start = time.perf_counter()
+    texts = slips(misthodosia)
+    footer = f"Ημ/νία έκδοσης: {misthodosia.ekdosidate:%d/%m/%Y}"
+    # Το συνολικό αρχείο είναι το μεγαλύτερο και ξεκινά πρώτο
+    items = [(COMBINED, footer, [text for _, text in texts], cached)]
+    items += [(filename, footer, [text], cached) for filename, text in texts]
+    files = process_imap(render, items, workers, load_fonts, mp_context)
+    count = pages = 0
+    with _writer(output) as write:
+        for filename, content, page_count in files:
+            write(filename, content)
+            count += 1
+            pages += page_count
+            if progress is not None:
+                progress(count)
+    elapsed = time.perf_counter() - start
+    return {
+        "employees": len(texts),
+        "files": count,
+        "pages": pages,
+        "workers": workers or 1,
+        "cached": cached,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 1) if elapsed else 0,
+    }
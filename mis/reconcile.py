@@ -0,0 +1,263 @@
+"""
+Έλεγχος αρχείων ΑΠΔ (CSL01) και ΦΜΥ (JL10) που έχουν υποβληθεί και
+σύγκρισή τους με το αρχείο που φτιάχνει τώρα η εφαρμογή
+
+Οι γραμμές έρχονται ως bytes από το utils.ziputil.read_lines (απλό αρχείο
+ή zip) ή ως str από τα Apd.apd_lines και Fmy.fmy_lines. Κάθε εγγραφή
+διαβάζεται με το Layout του τύπου της (mis/layouts.py) και από τα bytes
+αποκωδικοποιούνται (CP1253) μόνο τα πεδία κειμένου.
+
+Ο έλεγχος (validate) βρίσκει εγγραφές με λάθος μήκος ή τιμές, λάθος σειρά
+εγγραφών και σύνολα της δήλωσης που δεν συμφωνούν με τις εγγραφές των
+εργαζομένων. Η σύγκριση (diff) δίνει τις διαφορές ανά εργαζόμενο και ποσό.
+"""
+from collections import namedtuple
+from . import layouts
+
+# Ένα είδος αρχείου
+#
+# name     : Όνομα για τα μηνύματα
+# layouts  : Οι εγγραφές του αρχείου με τη σειρά που πρέπει να έχουν
+# eof      : Η τελευταία γραμμή του αρχείου (ή None)
+# header   : Η εγγραφή με τα σύνολα της δήλωσης
+# totals   : Τα πεδία συνόλων της header
+# employee : (εγγραφή, πεδίο) που ξεκινά εργαζόμενο και το κλειδί του
+# item     : Η εγγραφή με τα ποσά του εργαζομένου
+# item_key : Τα πεδία που ξεχωρίζουν τις εγγραφές item του εργαζομένου
+# amounts  : Τα πεδία της item που συγκρίνονται
+FileType = namedtuple(
+    "FileType",
+    "name layouts eof header totals employee item item_key amounts",
+)
+
+APD = FileType(
+    "ΑΠΔ",
+    (layouts.APD_HEADER, layouts.APD_ERGAZOMENOS, layouts.APD_EISFORES),
+    "EOF",
+    layouts.APD_HEADER,
+    ("meres", "apodoxes", "eisfores"),
+    (layouts.APD_ERGAZOMENOS, "ama"),
+    layouts.APD_EISFORES,
+    ("parno", "apodtypeefka", "kpk", "apo", "eos"),
+    (
+        "meres",
+        "imeromisthio",
+        "apodoxes",
+        "enos",
+        "etis",
+        "total",
+        "katavlitees",
+    ),
+)
+
+FMY = FileType(
+    "ΦΜΥ",
+    (
+        layouts.FMY_HEADER,
+        layouts.FMY_ERGODOTIS,
+        layouts.FMY_SYNOLA,
+        layouts.FMY_DIKAIOUXOS,
+    ),
+    None,
+    layouts.FMY_SYNOLA,
+    ("apo", "kra", "kath", "foros", "eea"),
+    (layouts.FMY_DIKAIOUXOS, "afm"),
+    layouts.FMY_DIKAIOUXOS,
+    (),
+    ("paidia", "apo", "kra", "kath", "foros", "eea"),
+)
+
+# Διαφορά ανάμεσα στο αρχείο που υποβλήθηκε και στο τωρινό. Το item είναι
+# None για τα σύνολα της δήλωσης και τους εργαζόμενους που λείπουν.
+Difference = namedtuple("Difference", "employee item field submitted generated")
+
+
+def detect(line):
+    """Το είδος αρχείου (APD ή FMY) από την πρώτη γραμμή ή None"""
+    if isinstance(line, bytes):
+        line = line[:13].decode("ascii", "replace")
+    if line[5:13] == "CSL01   ":
+        return APD
+    if line[1:9] == "JL10    ":
+        return FMY
+    return None
+
+
+def records(lines, filetype, errors=None):
+    """(αριθμός γραμμής, Layout, εγγραφή) για κάθε εγγραφή του αρχείου
+
+    errors: Λίστα όπου μπαίνουν τα λάθη και η εγγραφή παραλείπεται. Χωρίς
+            αυτή το πρώτο λάθος δίνει ValueError.
+    """
+    kinds = {}
+    for layout in filetype.layouts:
+        code = layout.fields[0].value
+        kinds[code] = kinds[code.encode("ascii")] = layout
+    eof = filetype.eof
+    eof_bytes = eof.encode("ascii") if eof else None
+    ended = False
+    for lineno, line in enumerate(lines, 1):
+        try:
+            if ended:
+                raise ValueError(f"Εγγραφή μετά το {eof}")
+            if eof is not None and (line == eof or line == eof_bytes):
+                ended = True
+                continue
+            layout = kinds.get(line[:1])
+            if layout is None:
+                raise ValueError(f"Άγνωστος τύπος εγγραφής {line[:1]!r}")
+            record = layout.parse(line)
+        except ValueError as err:
+            if errors is None:
+                raise ValueError(f"Γραμμή {lineno}: {err}") from None
+            errors.append(f"Γραμμή {lineno}: {err}")
+            continue
+        yield lineno, layout, record
+    if eof is not None and not ended:
+        message = f"Λείπει το {eof} στο τέλος του αρχείου"
+        if errors is None:
+            raise ValueError(message)
+        errors.append(message)
+
+
+class Declaration:
+    """Οι εγγραφές ενός αρχείου ομαδοποιημένες ανά εργαζόμενο
+
+    header   : Η εγγραφή συνόλων (ή None)
+    employees: {κλειδί εργαζομένου: {κλειδί item: εγγραφή item}}
+    errors   : Τα λάθη του αρχείου
+    count    : Πλήθος εγγραφών
+    """
+
+    def __init__(self, lines, filetype):
+        self.filetype = filetype
+        self.header = None
+        self.employees = {}
+        self.errors = []
+        self.count = 0
+        employee_layout, key_field = filetype.employee
+        order = {layout: idx for idx, layout in enumerate(filetype.layouts)}
+        last = -1
+        items = None
+        counts = {}
+        for lineno, layout, record in records(lines, filetype, self.errors):
+            self.count += 1
+            # Οι εγγραφές πάνε με τη σειρά των layouts και από την εγγραφή
+            # εργαζομένου και μετά επαναλαμβάνονται
+            if order[layout] < min(last, order[employee_layout]):
+                self.errors.append(
+                    f"Γραμμή {lineno}: Η εγγραφή {layout.name} είναι εκτός σειράς"
+                )
+            last = order[layout]
+            if layout is filetype.header:
+                if self.header is not None:
+                    self.errors.append(f"Γραμμή {lineno}: Δεύτερη εγγραφή συνόλων")
+                self.header = record
+            if layout is employee_layout:
+                key = getattr(record, key_field)
+                if key in self.employees:
+                    self.errors.append(
+                        f"Γραμμή {lineno}: Ο εργαζόμενος {key} υπάρχει δύο φορές"
+                    )
+                items = self.employees.setdefault(key, {})
+                counts = {}
+            if layout is filetype.item:
+                if items is None:
+                    self.errors.append(f"Γραμμή {lineno}: Εγγραφή χωρίς εργαζόμενο")
+                    continue
+                item = tuple(getattr(record, name) for name in filetype.item_key)
+                # Ίδιο κλειδί (π.χ. δύο κρατήσεις του ίδιου τύπου αποδοχών)
+                num = counts[item] = counts.get(item, 0) + 1
+                items[item + (num,)] = record
+        if self.header is None:
+            self.errors.append(f"Λείπει η εγγραφή {filetype.header.name}")
+        else:
+            self._check_totals()
+
+    def totals(self):
+        """Τα σύνολα της δήλωσης από τις εγγραφές των εργαζομένων"""
+        if self.filetype is APD:
+            return _apd_totals(self.employees)
+        totals = dict.fromkeys(self.filetype.totals, 0)
+        for items in self.employees.values():
+            for record in items.values():
+                for name in totals:
+                    totals[name] = getattr(record, name) + totals[name]
+        return totals
+
+    def _check_totals(self):
+        for name, value in self.totals().items():
+            declared = getattr(self.header, name)
+            if declared != value:
+                self.errors.append(
+                    f"{self.filetype.header.name}.{name}: {declared} ενώ οι "
+                    f"εγγραφές των εργαζομένων δίνουν {value}"
+                )
+
+
+def _apd_totals(employees):
+    # Μέρες και αποδοχές μετράνε μία φορά ανά τύπο αποδοχών, οι εισφορές
+    # σε κάθε εγγραφή (μία ανά κράτηση)
+    meres = apodoxes = eisfores = 0
+    for items in employees.values():
+        for key, record in items.items():
+            if key[-1] == 1:
+                meres += record.meres
+                apodoxes = record.apodoxes + apodoxes
+            eisfores = record.total + eisfores
+    return {"meres": meres, "apodoxes": apodoxes, "eisfores": eisfores}
+
+
+def validate(lines, filetype=None):
+    """Η Declaration των γραμμών (με το errors)"""
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        raise ValueError("Κενό αρχείο")
+    filetype = filetype or detect(first)
+    if filetype is None:
+        raise ValueError("Άγνωστο είδος αρχείου")
+    return Declaration(_chain(first, lines), filetype)
+
+
+def _chain(first, lines):
+    yield first
+    yield from lines
+
+
+def diff(submitted, generated):
+    """Οι διαφορές (Difference) ανάμεσα σε δύο Declaration ίδιου είδους"""
+    filetype = submitted.filetype
+    if generated.filetype is not filetype:
+        raise ValueError("Τα αρχεία δεν είναι του ίδιου είδους")
+    differences = []
+    for name in filetype.totals:
+        old = getattr(submitted.header, name, None)
+        new = getattr(generated.header, name, None)
+        if old != new:
+            differences.append(Difference(None, None, name, old, new))
+    for employee in sorted(submitted.employees.keys() | generated.employees.keys()):
+        old_items = submitted.employees.get(employee)
+        new_items = generated.employees.get(employee)
+        if old_items is None or new_items is None:
+            differences.append(
+                Difference(
+                    employee,
+                    None,
+                    None,
+                    old_items is not None,
+                    new_items is not None,
+                )
+            )
+            continue
+        for item in sorted(old_items.keys() | new_items.keys(), key=str):
+            old = old_items.get(item)
+            new = new_items.get(item)
+            for name in filetype.amounts:
+                old_value = None if old is None else getattr(old, name)
+                new_value = None if new is None else getattr(new, name)
+                if old_value != new_value:
+                    differences.append(
+                        Difference(employee, item, name, old_value, new_value)
+                    )
+    return differences
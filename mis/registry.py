@@ -0,0 +1,101 @@
+"""
+Πίνακες αναφοράς της μισθοδοσίας που κρατιούνται στη μνήμη της διεργασίας.
+
+Φορτώνονται με ένα query την πρώτη φορά που χρειάζονται και ξαναφορτώνονται
+όταν αλλάξει η έκδοσή τους στη βάση (ReferenceVersion). Η έκδοση αλλάζει
+σε κάθε αλλαγή του πίνακα από οποιαδήποτε διεργασία (signals στο
+mis/signals.py, ReferenceQuerySet για update και bulk_create) και
+ελέγχεται μία φορά ανά αίτηση ή payroll_memo.scope() (εκτός scope σε κάθε
+χρήση).
+"""
+from collections import defaultdict, namedtuple
+from utils.timeline import Timeline
+from . import models as md
+from .memo import payroll_memo
+
+
+class MissingFormula(namedtuple("MissingFormula", "pro ptyp ergt mist")):
+    """Συνδυασμός παρουσίας-τύπου εργαζομένου-μισθοδοσίας χωρίς Formula"""
+
+    __slots__ = ()
+
+    def __str__(self):
+        return f"{self.pro}: {self.ptyp}, {self.ergt}, {self.mist}"
+
+
+class ReferenceTable:
+    """Πίνακας αναφοράς στη μνήμη με την έκδοσή του (ReferenceVersion)
+
+    Οι υποκλάσεις ορίζουν το model και το load() που φτιάχνει τα δεδομένα.
+    """
+
+    model = None
+
+    def __init__(self):
+        # (έκδοση, δεδομένα)
+        self._loaded = None
+
+    def version(self):
+        name = self.model.REFERENCE
+        return payroll_memo.local(
+            ("reference", name), lambda: md.ReferenceVersion.current(name)
+        )
+
+    def data(self):
+        """Τα δεδομένα, φορτωμένα ξανά αν άλλαξε η έκδοση στη βάση"""
+        # Η έκδοση διαβάζεται πριν το load, οπότε μια αλλαγή στο μεταξύ
+        # φορτώνει ξανά τον πίνακα στην επόμενη χρήση
+        version = self.version()
+        loaded = self._loaded
+        if loaded is None or loaded[0] != version:
+            loaded = (version, self.load())
+            self._loaded = loaded
+        return loaded[1]
+
+    def load(self):
+        raise NotImplementedError
+
+    def invalidate(self):
+        self._loaded = None
+
+
+class FormulaRegistry(ReferenceTable):
+    """Τύποι υπολογισμού με κλειδί (part_id, ergt_id, mist_id)"""
+
+    model = md.Formula
+
+    def load(self):
+        return {
+            (frm.part_id, frm.ergt_id, frm.mist_id): frm
+            for frm in md.Formula.objects.select_related("apodt")
+        }
+
+    def get(self, part_id, ergt_id, mist_id):
+        return self.data().get((part_id, ergt_id, mist_id))
+
+    def items(self):
+        """((part_id, ergt_id, mist_id), Formula) για όλους τους τύπους"""
+        return self.data().items()
+
+
+class KpkRateTable(ReferenceTable):
+    """Ποσοστά ΚΠΚ (KpkApo) ανά ΚΠΚ ταξινομημένα κατά περίοδο έναρξης"""
+
+    model = md.KpkApo
+
+    def load(self):
+        rows = defaultdict(list)
+        for kpkapo in md.KpkApo.objects.all():
+            rows[kpkapo.kpk_id].append((kpkapo.apo, kpkapo))
+        return {kpk_id: Timeline(items) for kpk_id, items in rows.items()}
+
+    def rate(self, kpk_id, period):
+        """Το KpkApo που ισχύει για την περίοδο (YYYYMM) ή None"""
+        timeline = self.data().get(kpk_id)
+        if timeline is None:
+            return None
+        return timeline.at(period)
+
+
+formula_registry = FormulaRegistry()
+kpk_rates = KpkRateTable()
@@ -0,0 +1,168 @@
+"""
+Ενημέρωση των cache της μισθοδοσίας όταν αλλάζουν τα δεδομένα τους
+και σήμανση των αποθηκευμένων αποτελεσμάτων (MisthodosiaResult) ως stale
+"""
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from utils.formula import formulas, ergtype_formulas
+from . import models as md
+from .memo import payroll_memo
+from .registry import formula_registry, kpk_rates
+
+
+@receiver([post_save, post_delete], sender=md.Formula)
+def formula_changed(sender, instance, **kwargs):
+    formulas.invalidate(instance.pk)
+    md.ReferenceVersion.bump(md.Formula.REFERENCE)
+    formula_registry.invalidate()
+
+
+@receiver([post_save, post_delete], sender=md.ErgazomenosType)
+def ergazomenostype_changed(sender, instance, **kwargs):
+    for field in md.ErgazomenosType.FORMULA_FIELDS:
+        ergtype_formulas.invalidate((instance.pk, field))
+
+
+@receiver([post_save, post_delete], sender=md.KpkApo)
+def kpkapo_changed(sender, instance, **kwargs):
+    md.ReferenceVersion.bump(md.KpkApo.REFERENCE)
+    kpk_rates.invalidate()
+
+
+def mark_stale(**filters):
+    """Τα αποτελέσματα μισθοδοσίας που ταιριάζουν θα υπολογιστούν ξανά"""
+    md.MisthodosiaResult.objects.filter(stale=False, **filters).update(stale=True)
+    payroll_memo.invalidate()
+
+
+def mark_period_stale(period):
+    mark_stale(misthodosia__apoperiod__lte=period, misthodosia__period__gte=period)
+
+
+def mark_dirty(pairs):
+    """pairs: (result_id, pro_id) των εργαζομένων που θα υπολογιστούν ξανά"""
+    md.MisthodosiaResultDirty.objects.bulk_create(
+        [
+            md.MisthodosiaResultDirty(result_id=result_id, pro_id=pro_id)
+            for result_id, pro_id in set(pairs)
+        ],
+        ignore_conflicts=True,
+    )
+    payroll_memo.invalidate()
+
+
+def invalidate_memo(**filters):
+    """Σβήνει από το mis.memo τις μισθοδοσίες με αποτελέσματα που ταιριάζουν
+    (αλλαγές που δεν αλλάζουν τα ποσά, π.χ. ονοματεπώνυμο)
+    """
+    if payroll_memo.cache() is None:
+        payroll_memo.invalidate()
+        return
+    for mis_id in (
+        md.MisthodosiaResult.objects.filter(**filters)
+        .values_list("misthodosia_id", flat=True)
+        .distinct()
+    ):
+        payroll_memo.invalidate(mis_id)
+
+
+def mark_lines_dirty(**filters):
+    """Οι εργαζόμενοι των αποτελεσμάτων με γραμμές που ταιριάζουν"""
+    mark_dirty(
+        md.MisthodosiaResultLine.objects.filter(
+            result__stale=False, **filters
+        ).values_list("result_id", "pro_id")
+    )
+
+
+def mark_period_dirty(period, pro_id):
+    """Ο εργαζόμενος στα αποτελέσματα που καλύπτουν την περίοδο"""
+    results = md.MisthodosiaResult.objects.filter(
+        stale=False,
+        misthodosia__apoperiod__lte=period,
+        misthodosia__period__gte=period,
+    ).values_list("pk", flat=True)
+    mark_dirty((result_id, pro_id) for result_id in results)
+
+
+@receiver(pre_save, sender=md.Parousia)
+def parousia_moving(sender, instance, **kwargs):
+    # Αν αλλάξει η περίοδος, αλλάζει και η παλιά μισθοδοσία
+    if instance.pk:
+        for period in sender.objects.filter(pk=instance.pk).values_list(
+            "period", flat=True
+        ):
+            if period != instance.period:
+                mark_period_stale(period)
+
+
+@receiver([post_save, post_delete], sender=md.Parousia)
+def parousia_changed(sender, instance, **kwargs):
+    mark_period_stale(instance.period)
+
+
+@receiver(pre_save, sender=md.ParousiaDetails)
+def parousiadetails_moving(sender, instance, **kwargs):
+    # Η γραμμή μπορεί να αλλάξει εργαζόμενο ή περίοδο
+    if instance.pk:
+        for pro_id, period in sender.objects.filter(pk=instance.pk).values_list(
+            "pro_id", "parousia__period"
+        ):
+            mark_period_dirty(period, pro_id)
+
+
+@receiver([post_save, post_delete], sender=md.ParousiaDetails)
+def parousiadetails_changed(sender, instance, **kwargs):
+    mark_period_dirty(instance.parousia.period, instance.pro_id)
+
+
+@receiver(post_save, sender=md.Misthodosia)
+def misthodosia_changed(sender, instance, **kwargs):
+    mark_stale(misthodosia=instance)
+    payroll_memo.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=md.Ergazomenos)
+def ergazomenos_changed(sender, instance, **kwargs):
+    invalidate_memo(lines__pro__erg=instance.pk)
+
+
+@receiver(post_save, sender=md.Eidikotita)
+def eidikotita_changed(sender, instance, **kwargs):
+    invalidate_memo(lines__pro__eid=instance.pk)
+
+
+@receiver(post_save, sender=md.Proslipsi)
+def proslipsi_changed(sender, instance, **kwargs):
+    mark_lines_dirty(pro=instance.pk)
+
+
+@receiver(pre_delete, sender=md.Proslipsi)
+def proslipsi_deleting(sender, instance, **kwargs):
+    # Οι γραμμές της διαγράφονται (CASCADE), άρα και τα σύνολα αλλάζουν
+    mark_stale(lines__pro=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=md.ProslipsiApodoxes)
+def proslipsiapodoxes_changed(sender, instance, **kwargs):
+    mark_lines_dirty(pro=instance.proslipsi_id)
+
+
+@receiver([post_save, post_delete], sender=md.ErgOikKat)
+def ergoikkat_changed(sender, instance, **kwargs):
+    mark_lines_dirty(pro__erg=instance.ergazomenos_id)
+
+
+@receiver([post_save, post_delete], sender=md.KpkApo)
+def kpkapo_lines_changed(sender, instance, **kwargs):
+    mark_lines_dirty(pro__eid__eidikotitakek__kpk=instance.kpk_id)
+
+
+@receiver([post_save, post_delete], sender=md.Formula)
+@receiver([post_save, post_delete], sender=md.ErgazomenosType)
+@receiver([post_save, post_delete], sender=md.EidikotitaKek)
+@receiver([post_save, post_delete], sender=md.ApodoxesTypeEfka)
+@receiver([post_save, post_delete], sender=md.MisthodosiaType)
+def reference_changed(sender, instance, **kwargs):
+    # Αλλαγή σε πίνακα αναφοράς: Όλα τα αποτελέσματα θα υπολογιστούν ξανά
+    mark_stale()
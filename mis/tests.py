@@ -1,6 +1,36 @@
-from django.test import TestCase
+import datetime
+import json
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+from decimal import Decimal
+from io import BytesIO, StringIO
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.http import FileResponse, StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from unittest import skipIf
+from mispdf import txt2pdf
+from utils.money import Money
+from utils.ziputil import read_lines
+from . import bundle
+from . import exports
+from . import jobs
 from . import models as md
+from . import payslips
+from . import reconcile
+from . import vectorized
+from .compute import EmployeeData, FormulaData, PayrollData, calc_chunk
+from .loaders import load_payroll_graph
+from .memo import payroll_memo
+from .registry import formula_registry, kpk_rates
 
 
 class MisTest(TestCase):
@@ -133,3 +163,883 @@ class MisTest(TestCase):
     def test_03(self):
         pro = md.Proslipsi.objects.get(id=1)
         print(pro.erg.epo)
+
+
+class MisthodosiaQueriesTest(TestCase):
+    """Ο αριθμός των queries της μισθοδοσίας δεν εξαρτάται από τους εργαζόμενους"""
+
+    def setUp(self):
+        company = md.Company.objects.create(
+            epon='Δοκιμή ΕΠΕ',
+            afm='123123123',
+            ame='1234512345',
+            doy='Α Αθηνών',
+            dra='Εστιατόριο',
+            ctyp=md.CompanyType.objects.create(companytype='Εταιρεία', fmytype=1)
+        )
+        self.parartima = md.CompanyParartima.objects.create(
+            company=company,
+            efkayp=md.EfkaYpok.objects.create(ypno=1242, ypnam='ΑΦΚΑ Αθηνών'),
+            parp='Κεντρικό',
+            parno=1,
+            adodo='ΑΓΑΘΗΜΕΡΟΥ',
+            adnum='23B',
+            adtk='33212',
+            adpol='ΑΘΗΝΑ'
+        )
+        self.xora = md.Xora.objects.create(xora='ΕΛΛΑΔΑ')
+        self.taft = md.TaftotitaType.objects.create(tat='ΔΑΤ')
+        self.oikkat = md.OikKatType.objects.create(oik='Έγγαμος')
+        self.eid = md.Eidikotita.objects.create(eid='Ταμίας')
+        kpk101 = md.Kpk.objects.create(kpk='101', per='IKA MIKTA')
+        md.KpkApo.objects.create(
+            kpk=kpk101, apo=201606, perg=16, peti=25.06, ptot=41.06)
+        md.KpkApo.objects.create(
+            kpk=kpk101, apo=201906, perg=15.75, peti=24.81, ptot=40.56)
+        md.EidikotitaKek.objects.create(
+            eid=self.eid, kad='5540', eidefka='421110', kpk=kpk101)
+        self.aptyp = md.ApasxolisiType.objects.create(aptyp='Αορίστου χρόνου')
+        self.apeid = md.ApasxolisiEidos.objects.create(apeid='Πλήρης')
+        self.imeromisthios = md.ErgazomenosType.objects.create(
+            ergtype='Ημερομίσθιος',
+            evalmisthos='0',
+            evalimeromisthio='self.apodoxes',
+            evaloromisthio="self.apodoxes * Decimal('6') / Decimal('40')"
+        )
+        self.ian = md.Minas.objects.create(code='01', minas='Ιανουάριος')
+        self.parousia = md.Parousia.objects.create(etos=2020, minas=self.ian)
+        self.ergasimes = md.ParousiaType.objects.create(parousiatype='Εργάσιμες')
+        self.argies = md.ParousiaType.objects.create(parousiatype='Αργίες')
+        taktikes = md.MisthodosiaType.objects.create(mistype='Τακτικές αποδοχές')
+        apodt = md.ApodoxesTypeEfka.objects.create(
+            apodtypeefka='01', per='Τακτικές αποδοχές')
+        md.Formula.objects.create(
+            part=self.ergasimes, ergt=self.imeromisthios, mist=taktikes,
+            apodt=apodt, meresefka=True, evalu='val * imeromisthio')
+        md.Formula.objects.create(
+            part=self.argies, ergt=self.imeromisthios, mist=taktikes,
+            apodt=apodt, argiaefka=True,
+            evalu="val * imeromisthio * Decimal('0.75')")
+        self.misthodosia = md.Misthodosia.objects.create(
+            etos=2020, mistype=taktikes, apomina=self.ian, eosmina=self.ian,
+            ekdosidate='2020-01-31')
+
+    def add_ergazomenos(self, num):
+        erg = md.Ergazomenos.objects.create(
+            epo=f'ΕΠΩΝΥΜΟ{num}', ono='ΟΝΟΜΑ', pat='ΠΑΤΕΡΑΣ', mit='ΜΗΤΕΡΑ',
+            afm=f'{num:09d}', amka=f'{num:011d}', ama=num, gen='1980-01-01',
+            xor=self.xora, taft=self.taft, taf=f'ΑΒ{num}', adodo='ΟΔΟΣ',
+            adnum='1', adpol='ΑΘΗΝΑ', adtk='11111', mobile='6900000000'
+        )
+        md.ErgOikKat.objects.create(
+            ergazomenos=erg, apoetos=2019, apomina=self.ian,
+            oikkattype=self.oikkat, paidia=num % 3)
+        pro = md.Proslipsi.objects.create(
+            proslipsidate='2019-01-01', parartima=self.parartima, erg=erg,
+            eid=self.eid, aptyp=self.aptyp, apeid=self.apeid,
+            ergazomenostype=self.imeromisthios, apodoxes=30 + num
+        )
+        md.ParousiaDetails.objects.create(
+            parousia=self.parousia, pro=pro, ptyp=self.ergasimes, value=20)
+        md.ParousiaDetails.objects.create(
+            parousia=self.parousia, pro=pro, ptyp=self.argies, value=2)
+        return pro
+
+    def count_queries(self, func):
+        formula_registry.invalidate()
+        kpk_rates.invalidate()
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            func(misthodosia)
+        return len(ctx.captured_queries)
+
+    def test_calc_misthodosia_queries(self):
+        self.add_ergazomenos(1)
+        queries_1 = self.count_queries(lambda mis: mis.calc_misthodosia())
+        for num in range(2, 12):
+            self.add_ergazomenos(num)
+        queries_11 = self.count_queries(lambda mis: mis.calc_misthodosia())
+        self.assertEqual(queries_1, queries_11)
+
+    def test_calc_misthodosia_foroi_queries(self):
+        self.add_ergazomenos(1)
+        queries_1 = self.count_queries(lambda mis: mis.calc_misthodosia_foroi())
+        for num in range(2, 12):
+            self.add_ergazomenos(num)
+        queries_11 = self.count_queries(
+            lambda mis: mis.calc_misthodosia_foroi())
+        self.assertEqual(queries_1, queries_11)
+
+    def test_calc_misthodosia_values(self):
+        pro = self.add_ergazomenos(1)
+        res = md.Misthodosia.objects.get(
+            pk=self.misthodosia.pk).calc_misthodosia()
+        vals = list(res[pro].values())[0]
+        # 20 * 31 + 2 * 31 * 0.75
+        self.assertEqual(vals['apod'], Decimal('666.50'))
+        self.assertEqual(vals['meres'], 20)
+        self.assertEqual(vals['argia'], 2)
+        krat = list(vals['kratiseis'].values())[0]
+        self.assertEqual(krat['enos'], Decimal('104.97'))
+        self.assertEqual(krat['total'], Decimal('270.33'))
+
+    def test_formula_cache_invalidation(self):
+        pro = self.add_ergazomenos(1)
+        self.assertEqual(pro.imeromisthio(), Decimal('31.00'))
+        self.imeromisthios.evalimeromisthio = 'self.apodoxes * 2'
+        self.imeromisthios.save()
+        pro = md.Proslipsi.objects.get(pk=pro.pk)
+        self.assertEqual(pro.imeromisthio(), Decimal('62.00'))
+
+    def test_formula_clean(self):
+        frm = md.Formula.objects.first()
+        frm.evalu = "__import__('os').getcwd()"
+        self.assertRaises(ValidationError, frm.clean)
+
+    def test_formula_registry_version(self):
+        frm = md.Formula.objects.first()
+        key = (frm.part_id, frm.ergt_id, frm.mist_id)
+        self.assertEqual(formula_registry.get(*key).evalu, frm.evalu)
+        # Αλλαγή σε άλλη διεργασία: Εδώ αλλάζει μόνο η έκδοση στη βάση
+        md.Formula._base_manager.filter(pk=frm.pk).update(evalu='val * 2')
+        self.assertEqual(formula_registry.get(*key).evalu, frm.evalu)
+        md.ReferenceVersion.bump(md.Formula.REFERENCE)
+        self.assertEqual(formula_registry.get(*key).evalu, 'val * 2')
+        # Αλλαγή με update (χωρίς signals)
+        md.Formula.objects.filter(pk=frm.pk).update(evalu='val * 3')
+        self.assertEqual(formula_registry.get(*key).evalu, 'val * 3')
+        # Με save αλλάζει και μέσα στο ίδιο scope
+        with payroll_memo.scope():
+            self.assertEqual(formula_registry.get(*key).evalu, 'val * 3')
+            frm.refresh_from_db()
+            frm.evalu = 'val * 4'
+            frm.save()
+            self.assertEqual(formula_registry.get(*key).evalu, 'val * 4')
+
+    def test_missing_formula_diagnostics(self):
+        pro = self.add_ergazomenos(1)
+        md.ParousiaDetails.objects.create(
+            parousia=self.parousia, pro=pro, value=1,
+            ptyp=md.ParousiaType.objects.create(parousiatype='Ασθένεια'))
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        misthodosia.calc_misthodosia()
+        self.assertEqual(len(misthodosia.diagnostics), 1)
+        self.assertEqual(misthodosia.diagnostics[0].pro, pro)
+        self.assertEqual(misthodosia.diagnostics[0].ptyp.parousiatype, 'Ασθένεια')
+
+    def test_kpk_periodou(self):
+        kpk = md.Kpk.objects.get(kpk='101')
+        self.assertIsNone(kpk.kpk_periodou(201605))
+        self.assertEqual(kpk.kpk_periodou(201606).perg, Decimal('16'))
+        self.assertEqual(kpk.kpk_periodou(201905).perg, Decimal('16'))
+        self.assertEqual(kpk.kpk_periodou(202001).perg, Decimal('15.75'))
+        md.KpkApo.objects.create(
+            kpk=kpk, apo=202001, perg=15, peti=25, ptot=40)
+        self.assertEqual(kpk.kpk_periodou(202001).perg, Decimal('15'))
+        eidkek = md.EidikotitaKek.objects.get(kpk=kpk)
+        # Η έκδοση του πίνακα ελέγχεται μία φορά ανά scope
+        with payroll_memo.scope():
+            self.assertEqual(eidkek.kpk_periodou(201912).perg, Decimal('15.75'))
+            with self.assertNumQueries(0):
+                self.assertEqual(eidkek.kpk_periodou(202001).perg, Decimal('15'))
+        # Αλλαγή με update (χωρίς signals)
+        md.KpkApo.objects.filter(kpk=kpk, apo=202001).update(perg=14)
+        self.assertEqual(kpk.kpk_periodou(202001).perg, Decimal('14'))
+        # Αλλαγή σε άλλη διεργασία: Εδώ αλλάζει μόνο η έκδοση στη βάση
+        md.KpkApo._base_manager.filter(kpk=kpk, apo=202001).update(perg=13)
+        self.assertEqual(kpk.kpk_periodou(202001).perg, Decimal('14'))
+        md.ReferenceVersion.bump(md.KpkApo.REFERENCE)
+        self.assertEqual(kpk.kpk_periodou(202001).perg, Decimal('13'))
+
+    def test_employee_timelines(self):
+        pro = self.add_ergazomenos(1)
+        feb = md.Minas.objects.create(code='02', minas='Φεβρουάριος')
+        md.ProslipsiApodoxes.objects.create(
+            proslipsi=pro, apoetos=2020, apomina=self.ian,
+            ergtyp=self.imeromisthios, apodoxes=35)
+        md.ProslipsiApodoxes.objects.create(
+            proslipsi=pro, apoetos=2020, apomina=feb,
+            ergtyp=self.imeromisthios, apodoxes=36)
+        md.ErgOikKat.objects.create(
+            ergazomenos=pro.erg, apoetos=2020, apomina=feb,
+            oikkattype=self.oikkat, paidia=3)
+        self.assertEqual(pro.erg.paidia(202001), 1)
+        self.assertEqual(pro.erg.paidia(202002), 3)
+        self.assertEqual(pro.last_apodoxes(), Decimal('36'))
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        _, lines, _ = misthodosia.calc_misthodosia_foroi()
+        self.assertEqual(lines[0]['paidia'], 1)
+        self.assertEqual(lines[0]['imeromisthio'], Decimal('35.00'))
+        # 20 * 35 + 2 * 35 * 0.75
+        self.assertEqual(lines[0]['apodoxes'], Decimal('752.50'))
+
+    def test_period(self):
+        self.assertEqual(self.parousia.period, 202001)
+        self.assertEqual(self.misthodosia.apoperiod, 202001)
+        self.assertEqual(self.misthodosia.period, 202001)
+        pro = self.add_ergazomenos(1)
+        dek = md.Minas.objects.create(code='12', minas='Δεκέμβριος')
+        md.Parousia.objects.create(etos=2019, minas=dek)
+        self.assertEqual(
+            list(md.Parousia.objects.values_list('period', flat=True)),
+            [202001, 201912])
+        self.assertEqual(
+            md.Parousia.objects.filter(period__lt=202001).count(), 1)
+        self.assertEqual(pro.erg.ergoikkat_set.get().period, 201901)
+        # Μαζικές εγγραφές χωρίς save()
+        feb = md.Minas.objects.create(code='02', minas='Φεβρουάριος')
+        md.Fmy.objects.bulk_create([
+            md.Fmy(etos=2020, minas=feb, cdate=datetime.date(2020, 3, 1))])
+        fmy = md.Fmy.objects.get()
+        self.assertEqual(fmy.period, 202002)
+        fmy.minas = dek
+        md.Fmy.objects.bulk_update([fmy], ['minas'])
+        self.assertEqual(md.Fmy.objects.get().period, 202012)
+        with self.assertRaisesMessage(ValueError, 'minas'):
+            md.Fmy.objects.update(minas=feb)
+        fmy.etos = 2019
+        fmy.save(update_fields=['etos'])
+        self.assertEqual(md.Fmy.objects.get().period, 201912)
+
+    def test_parousies_aggregated(self):
+        pro = self.add_ergazomenos(1)
+        for day in (3, 10, 17):
+            md.ParousiaDetails.objects.create(
+                parousia=self.parousia, pro=pro, ptyp=self.argies, value=1,
+                apo=datetime.date(2020, 1, day),
+                eos=datetime.date(2020, 1, day + 1))
+        graph = load_payroll_graph(self.misthodosia)
+        self.assertEqual(graph.details, [
+            (pro.pk, self.ergasimes.pk, 20, None, None),
+            (pro.pk, self.argies.pk, 5,
+             datetime.date(2020, 1, 3), datetime.date(2020, 1, 18)),
+        ])
+        res = self.misthodosia.calc_misthodosia(graph)
+        apod = next(iter(res[pro].values()))
+        self.assertEqual(apod['meres'], 20)
+        self.assertEqual(apod['eos'], datetime.date(2020, 1, 18))
+
+    def test_snapshot(self):
+        self.add_ergazomenos(1)
+        self.add_ergazomenos(2)
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        head, lines, totals = misthodosia.calc_misthodosia_foroi()
+        res = misthodosia.calc_misthodosia()
+        result = misthodosia.snapshot()
+        self.assertEqual(result.version, md.MisthodosiaResult.VERSION)
+        self.assertEqual(result.as_foroi(), (head, lines, totals))
+        self.assertEqual(result.as_res(), res)
+        self.assertEqual(list(result.as_res()), list(res))
+        # Διαβάζεται από τη βάση χωρίς επανυπολογισμό
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(misthodosia.snapshot().pk, result.pk)
+        response = self.client.get(
+            reverse('mis_detail', args=[self.misthodosia.pk]))
+        self.assertContains(response, '<b>1.141,17</b>')
+
+    def test_snapshot_stale(self):
+        self.add_ergazomenos(1)
+        self.misthodosia.snapshot()
+        # Αλλαγή σε πίνακα αναφοράς
+        md.Formula.objects.filter(part=self.argies).get().save()
+        self.assertTrue(md.MisthodosiaResult.objects.get().stale)
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        self.assertFalse(misthodosia.snapshot().stale)
+        # Αλλαγή στον τρόπο υπολογισμού
+        md.MisthodosiaResult.objects.update(version=0)
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        self.assertEqual(
+            misthodosia.snapshot().version, md.MisthodosiaResult.VERSION)
+
+    def assert_snapshot_current(self):
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        result = misthodosia.snapshot()
+        self.assertFalse(result.dirty.exists())
+        self.assertEqual(
+            result.as_foroi(), misthodosia.calc_misthodosia_foroi())
+        res = misthodosia.calc_misthodosia()
+        self.assertEqual(result.as_res(), res)
+        self.assertEqual(list(result.as_res()), list(res))
+        return result
+
+    def test_snapshot_incremental(self):
+        pros = [self.add_ergazomenos(num) for num in range(1, 6)]
+        result = self.misthodosia.snapshot()
+        line = md.ParousiaDetails.objects.get(pro=pros[2], ptyp=self.ergasimes)
+        line.value = 21
+        line.save()
+        self.assertEqual(
+            list(result.dirty.values_list('pro', flat=True)), [pros[2].pk])
+        self.assertEqual(
+            self.assert_snapshot_current().apodoxes,
+            result.apodoxes + pros[2].apodoxes)
+        md.ErgOikKat.objects.filter(ergazomenos=pros[0].erg).update(paidia=2)
+        md.ErgOikKat.objects.get(ergazomenos=pros[0].erg).save()
+        md.ProslipsiApodoxes.objects.create(
+            proslipsi=pros[1], apoetos=2020, apomina=self.ian,
+            ergtyp=self.imeromisthios, apodoxes=40)
+        md.KpkApo.objects.filter(apo=201906).update(perg=15)
+        md.KpkApo.objects.get(apo=201906).save()
+        self.assertEqual(result.dirty.count(), 5)
+        self.assert_snapshot_current()
+        # Νέος εργαζόμενος και εργαζόμενος χωρίς παρουσίες
+        self.add_ergazomenos(6)
+        md.ParousiaDetails.objects.filter(pro=pros[4]).delete()
+        result = self.assert_snapshot_current()
+        self.assertEqual(result.lines.count(), 5)
+        self.assertFalse(md.MisthodosiaResult.objects.get().stale)
+
+    def test_snapshot_incremental_queries(self):
+        def update_one(pro):
+            line = md.ParousiaDetails.objects.get(pro=pro, ptyp=self.argies)
+            line.value += 1
+            line.save()
+            return self.count_queries(lambda mis: mis.snapshot())
+
+        pro = self.add_ergazomenos(1)
+        self.misthodosia.snapshot()
+        queries_1 = update_one(pro)
+        for num in range(2, 12):
+            self.add_ergazomenos(num)
+        md.Misthodosia.objects.get(pk=self.misthodosia.pk).snapshot()
+        self.assertEqual(update_one(pro), queries_1)
+
+    def test_parallel(self):
+        for num in range(1, 8):
+            self.add_ergazomenos(num)
+        md.ParousiaDetails.objects.create(
+            parousia=self.parousia, pro=self.add_ergazomenos(8),
+            ptyp=md.ParousiaType.objects.create(parousiatype='Άδεια'), value=1)
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        res = misthodosia.calc_misthodosia()
+        diagnostics = misthodosia.diagnostics
+        graph = load_payroll_graph(misthodosia)
+        self.assertEqual(misthodosia.calc_misthodosia(graph, workers=2), res)
+        self.assertEqual(list(misthodosia.calc_misthodosia(graph)), list(res))
+        self.assertEqual(misthodosia.diagnostics, diagnostics)
+        self.assertEqual(
+            misthodosia.calc_misthodosia_foroi(workers=2),
+            misthodosia.calc_misthodosia_foroi())
+
+    def test_active_in(self):
+        pro1 = self.add_ergazomenos(1)
+        pro2 = self.add_ergazomenos(2)
+        pro3 = self.add_ergazomenos(3)
+        md.Proslipsi.objects.filter(pk=pro3.pk).update(
+            proslipsidate='2020-03-01')
+        md.Apoxorisi.objects.create(
+            proslipsi=pro2, apoxorisidate='2020-02-15',
+            aptyp=md.ApoxorisiType.objects.create(aptyp='Οικειοθελής'))
+        with self.assertNumQueries(1):
+            active = {
+                pro.pk: pro.active
+                for pro in md.Proslipsi.objects.active_in(202002).with_active()}
+        self.assertEqual(active, {pro1.pk: True, pro2.pk: False})
+        # Η μέθοδος is_active μένει μέθοδος και με το annotation
+        pro = md.Proslipsi.objects.with_active().get(pk=pro2.pk)
+        self.assertEqual((pro.active, pro.is_active()), (False, False))
+        self.assertNotIn('active', vars(md.Proslipsi.objects.active_in(202002)[0]))
+        self.assertEqual(
+            set(md.Proslipsi.objects.active_in(202003)), {pro1, pro3})
+        with self.assertNumQueries(1):
+            active = {
+                erg.pk: erg.active
+                for erg in md.Ergazomenos.objects.active_in(202002).with_active()}
+        self.assertEqual(active, {pro1.erg_id: True, pro2.erg_id: False})
+        self.assertTrue(pro2.erg.active_for_period(202002))
+        self.assertFalse(pro2.erg.active_for_period(202003))
+        self.assertFalse(pro2.erg.is_active())
+        erg = md.Ergazomenos.objects.with_active().get(pk=pro2.erg_id)
+        self.assertEqual((erg.active, erg.is_active()), (False, False))
+        self.assertEqual(
+            md.Ergazomenos.objects.with_active().active_in(202003).count(), 2)
+        response = self.client.get(reverse('erg'), {'period': '202003'})
+        self.assertEqual(len(response.context['ergazomenoi_list']), 2)
+        # Λάθος μήνας: Χωρίς φίλτρο
+        with self.assertRaisesMessage(ValueError, 'Λάθος μήνας'):
+            md.Proslipsi.objects.active_in(202013)
+        for period in ('202013', '202000'):
+            response = self.client.get(reverse('erg'), {'period': period})
+            self.assertEqual(len(response.context['ergazomenoi_list']), 3)
+        self.client.force_login(get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'pass'))
+        for url, params, count in (
+            ('admin:mis_proslipsi_changelist', {'active': '202002'}, 2),
+            ('admin:mis_proslipsi_changelist', {'active': '1'}, 2),
+            ('admin:mis_ergazomenos_changelist', {'active': '0'}, 1),
+            ('admin:mis_proslipsi_changelist', {'active': '202013'}, 3),
+        ):
+            response = self.client.get(reverse(url), params)
+            self.assertEqual(response.context['cl'].result_count, count)
+
+    def test_memo(self):
+        self.add_ergazomenos(1)
+        self.add_ergazomenos(2)
+        with payroll_memo.scope():
+            foroi = self.misthodosia.snapshot().as_foroi()
+            queries = self.count_queries(lambda mis: mis.snapshot().as_foroi())
+            self.assertEqual(queries, 1)
+            misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+            self.assertIs(misthodosia.snapshot().as_foroi(), foroi)
+            self.add_ergazomenos(3)
+            misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+            self.assertEqual(len(misthodosia.snapshot().as_foroi()[1]), 3)
+            self.assertEqual(misthodosia.snapshot().revision, 1)
+
+    @override_settings(
+        MIS_PAYROLL_CACHE='default',
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_memo_cache(self):
+        pro = self.add_ergazomenos(1)
+        self.misthodosia.snapshot().as_res()
+        self.misthodosia.snapshot().as_foroi()
+        queries = self.count_queries(
+            lambda mis: (mis.snapshot().as_res(), mis.snapshot().as_foroi()))
+        self.assertEqual(queries, 1)
+        pro.erg.epo = 'ΑΛΛΟ'
+        pro.erg.save()
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        _, lines, _ = misthodosia.snapshot().as_foroi()
+        self.assertTrue(lines[0]['onomatep'].startswith('ΑΛΛΟ'))
+
+    @skipIf(vectorized.np is None, "Χωρίς numpy")
+    def test_vectorized(self):
+        for num in range(1, 8):
+            self.add_ergazomenos(num)
+        md.ParousiaDetails.objects.create(
+            parousia=self.parousia, pro=self.add_ergazomenos(8),
+            ptyp=md.ParousiaType.objects.create(parousiatype='Άδεια'), value=1)
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        res = misthodosia.calc_misthodosia()
+        diagnostics = misthodosia.diagnostics
+        graph = load_payroll_graph(misthodosia)
+        self.assertEqual(misthodosia.calc_misthodosia(graph, vectorized=True), res)
+        self.assertEqual(list(misthodosia.calc_misthodosia(graph)), list(res))
+        self.assertEqual(misthodosia.diagnostics, diagnostics)
+        self.assertEqual(
+            misthodosia.calc_misthodosia_foroi(vectorized=True),
+            misthodosia.calc_misthodosia_foroi())
+
+    @skipIf(vectorized.np is None, "Χωρίς numpy")
+    def test_vectorized_rounding(self):
+        formulas = {
+            (1, 2): FormulaData(
+                1, "val * imeromisthio / Decimal(8)", 1, True, False),
+            (2, 2): FormulaData(
+                2, "val * oromisthio if val > 1 else -val", 2, False, True),
+            (3, 2): FormulaData(3, "val * imeromisthio // 3", 1, False, False),
+        }
+        payroll = PayrollData(2021, Decimal('14'), formulas, frozenset({1}))
+        employees = [
+            EmployeeData(
+                pro_id, 2, Decimal(0), Decimal(imeromisthio),
+                Decimal(imeromisthio) / 8, paidia,
+                ((1, 1, '2021-01-01', '2021-01-31'), (2, val, '', ''),
+                 (9, 1, '', ''), (1, 2, '2021-01-02', '2021-01-30')),
+                ((10, Decimal('15.75'), Decimal('40.56')),
+                 (11, Decimal('0.5'), Decimal('1.5'))),
+            )
+            for pro_id, imeromisthio, paidia, val in (
+                (1, '0.2', 0, 1), (2, '0.6', 1, 3), (3, '1000.04', 2, 26),
+                (4, '33.33', 5, 0), (5, '45', 3, 2), (6, '90000.07', 1, 2),
+                (7, '1900', 0, 3),
+            )
+        ]
+        expected = calc_chunk(payroll, employees)
+        self.assertEqual(vectorized.kernel(payroll, employees), expected)
+        # Ο τύπος με // υπολογίζεται με Decimal
+        employees[0] = employees[0]._replace(
+            parousies=employees[0].parousies + ((3, 1, '', ''),))
+        with self.assertRaises(vectorized.Unsupported):
+            vectorized.kernel(payroll, employees)
+        self.assertEqual(
+            vectorized.calc_employees(payroll, employees),
+            calc_chunk(payroll, employees))
+
+    def test_misthodosia_command(self):
+        self.add_ergazomenos(1)
+        self.add_ergazomenos(2)
+        out = StringIO()
+        call_command('misthodosia', '--workers=2', stdout=out)
+        self.assertIn('πληρωτέο 1141.17', out.getvalue())
+        self.assertFalse(md.MisthodosiaResult.objects.get().stale)
+        call_command(
+            'misthodosia', self.misthodosia.pk, '--benchmark',
+            '--workers=2', '--replicate=3', stdout=out)
+        self.assertIn('6 εργαζόμενοι', out.getvalue())
+
+    def add_apd_fmy(self):
+        for num in range(1, 4):
+            self.add_ergazomenos(num)
+        # Ο κωδικός υποκαταστήματος στην ΑΠΔ είναι τριψήφιος
+        md.EfkaYpok.objects.update(ypno=124)
+        apd = md.Apd.objects.create(
+            etos=2020, minas=self.ian, ekdosi=datetime.date(2020, 2, 10),
+            apdtype=md.ApdDilosiType.objects.create(apddiltyp='Κανονική'))
+        md.ApdDetails.objects.create(apd=apd, mis=self.misthodosia)
+        fmy = md.Fmy.objects.create(
+            etos=2020, minas=self.ian, cdate=datetime.date(2020, 2, 10))
+        md.FmyDetails.objects.create(fmy=fmy, mis=self.misthodosia)
+        return apd, fmy
+
+    def test_join_mis_merge(self):
+        apd, fmy = self.add_apd_fmy()
+        result = self.misthodosia.snapshot()
+        joined = list(apd.join_mis())
+        amas = [pro.erg.ama for pro, _ in joined]
+        self.assertEqual(amas, sorted(amas))
+        self.assertEqual(dict(joined), result.as_res())
+        self.assertEqual(
+            [afm for afm, _ in fmy.join_mis()],
+            sorted(pro.erg.afm for pro, _ in joined))
+        # Ο ίδιος τύπος αποδοχών σε δύο μισθοδοσίες
+        with self.assertRaisesMessage(ValueError, 'υπάρχει σε δύο μισθοδοσίες'):
+            list(apd.join_mis([result, result]))
+
+    def test_apd_lines_queries(self):
+        def apd_queries():
+            md.Misthodosia.objects.get(pk=self.misthodosia.pk).snapshot()
+            apd = md.Apd.objects.get(pk=apd_pk)
+            with CaptureQueriesContext(connection) as ctx:
+                lines = list(apd.apd_lines())
+            return len(ctx.captured_queries), lines
+
+        apd_pk = self.add_apd_fmy()[0].pk
+        queries_3, lines = apd_queries()
+        self.assertIn('5540', lines[2])
+        self.assertIn('421110', lines[2])
+        for num in range(4, 1001):
+            self.add_ergazomenos(num)
+        queries_1000, lines = apd_queries()
+        # Εγγραφές 1, EOF και 1000 εργαζόμενοι με μία κράτηση
+        self.assertEqual(len(lines), 2 + 2 * 1000)
+        self.assertEqual(queries_1000, queries_3)
+
+    @override_settings(MIS_EXPORT_CACHE_DIR=None)
+    def test_apd_fmy_stream(self):
+        apd, fmy = self.add_apd_fmy()
+        lines = list(apd.apd_lines())
+        self.assertEqual([len(line) for line in lines[:3]], [414, 178, 138])
+        self.assertEqual(lines[-1], 'EOF')
+        for url, name, text in (
+            (reverse('apd2zip', args=[apd.pk]), 'CSL01', apd.apd2text()),
+            (reverse('fmy2zip', args=[fmy.pk]), 'JL10', fmy.fmy2text()),
+        ):
+            response = self.client.get(url)
+            self.assertTrue(response.streaming)
+            data = b''.join(response.streaming_content)
+            with zipfile.ZipFile(BytesIO(data)) as fil:
+                self.assertEqual(fil.read(name), text.encode('CP1253'))
+
+    def test_export_cache(self):
+        apd, fmy = self.add_apd_fmy()
+        url = reverse('apd2zip', args=[apd.pk])
+        with tempfile.TemporaryDirectory() as folder:
+            with override_settings(MIS_EXPORT_CACHE_DIR=folder):
+                response = self.client.get(url)
+                self.assertIsInstance(response, StreamingHttpResponse)
+                data = b''.join(response.streaming_content)
+                etag = response['ETag']
+                path = exports.apd_export(apd).cached()
+                self.assertIsNotNone(path)
+                # Από το cache
+                response = self.client.get(url)
+                self.assertIsInstance(response, FileResponse)
+                self.assertEqual(b''.join(response.streaming_content), data)
+                self.assertEqual(response['ETag'], etag)
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                # Τα ίδια δεδομένα δίνουν τα ίδια bytes
+                os.remove(path)
+                self.assertEqual(exports.apd_export(apd).content(), data)
+                # Αλλαγή στοιχείων εργαζομένου
+                md.Ergazomenos.objects.filter(ama=1).update(epo='ΑΛΛΟ')
+                export = exports.apd_export(apd)
+                self.assertNotEqual(export.etag, etag)
+                self.assertIsNone(export.cached())
+                self.assertIn('ΑΛΛΟ'.encode('CP1253'), zipfile.ZipFile(
+                    BytesIO(export.content())).read('CSL01'))
+                fmy_export = exports.fmy_export(fmy)
+                self.assertIsNotNone(fmy_export.content())
+                self.assertIsNotNone(fmy_export.cached())
+
+    def test_layouts_command(self):
+        out = StringIO()
+        call_command('layouts', '--number=10', stdout=out)
+        self.assertIn('APD_EISFORES     138', out.getvalue())
+
+    @override_settings(MIS_EXPORT_WORKERS=0)
+    def test_export_job(self):
+        apd, fmy = self.add_apd_fmy()
+        with tempfile.TemporaryDirectory() as folder:
+            with override_settings(MIS_EXPORT_CACHE_DIR=folder):
+                self.assertEqual(
+                    self.client.get(reverse('apd_job', args=[apd.pk])).status_code, 405)
+                response = self.client.post(reverse('apd_job', args=[apd.pk]))
+                self.assertEqual(response.status_code, 202)
+                data = response.json()
+                self.assertEqual(data['status'], 'done')
+                job = md.ExportJob.objects.get(pk=data['id'])
+                # Εγγραφές 1, EOF, 3 εργαζόμενοι και 3 κρατήσεις
+                self.assertEqual((job.progress, job.total), (8, 8))
+                self.assertEqual(self.client.get(data['url']).json()['percent'], 100)
+                response = self.client.get(data['download_url'])
+                self.assertIsInstance(response, FileResponse)
+                self.assertEqual(
+                    b''.join(response.streaming_content),
+                    exports.apd_export(apd).content())
+                data = self.client.post(reverse('fmy_job', args=[fmy.pk])).json()
+                self.assertEqual(data['status'], 'done')
+                # Χωρίς cache η εργασία αποτυγχάνει
+                with override_settings(MIS_EXPORT_CACHE_DIR=None):
+                    with self.assertLogs('mis.jobs', 'ERROR'):
+                        job = jobs.submit(fmy=fmy)
+                self.assertEqual(job.status, md.ExportJob.FAILED)
+                # Εργασία άλλης διεργασίας που ενημερώνεται: Δεν ξεκινά νέα
+                running = md.ExportJob.objects.create(
+                    apd=apd, status=md.ExportJob.RUNNING, owner='other:1',
+                    heartbeat=timezone.now())
+                self.assertEqual(jobs.submit(apd=apd).pk, running.pk)
+                # Χωρίς ενημέρωση για MIS_EXPORT_JOB_TIMEOUT είναι χαμένη
+                with override_settings(MIS_EXPORT_JOB_TIMEOUT=0):
+                    job = jobs.submit(apd=apd)
+                self.assertNotEqual(job.pk, running.pk)
+                running.refresh_from_db()
+                self.assertEqual(running.status, md.ExportJob.FAILED)
+                # Εργασία αυτής της διεργασίας που δεν τρέχει πια
+                lost = md.ExportJob.objects.create(
+                    apd=apd, status=md.ExportJob.RUNNING, owner=jobs.owner(),
+                    heartbeat=timezone.now())
+                self.assertTrue(jobs.is_lost(lost))
+                self.assertNotEqual(jobs.submit(apd=apd).pk, lost.pk)
+        response = self.client.get(reverse('apd'))
+        self.assertContains(response, reverse('apd_job', args=[apd.pk]))
+
+    def test_apd_branches(self):
+        apd, _ = self.add_apd_fmy()
+        parartima = md.CompanyParartima.objects.create(
+            company=self.parartima.company,
+            efkayp=md.EfkaYpok.objects.create(ypno=125, ypnam='ΑΦΚΑ Πειραιά'),
+            parp='Πειραιάς', parno=2, adodo='ΑΚΤΗ', adnum='1', adtk='18531',
+            adpol='ΠΕΙΡΑΙΑΣ')
+        md.Proslipsi.objects.filter(erg__ama=3).update(parartima=parartima)
+        results = apd.results()
+        totals = apd.totals_by_parartima(results)
+        self.assertEqual(set(totals), {self.parartima.pk, parartima.pk})
+        self.assertEqual(
+            [sum(values) for values in zip(*totals.values())],
+            list(apd.calc_totals(results)))
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, 'apd.zip')
+            out = StringIO()
+            call_command('apd_branches', apd.pk, '--workers=1', f'--output={output}', stdout=out)
+            self.assertIn('2 παραρτήματα', out.getvalue())
+            with zipfile.ZipFile(output) as fil:
+                manifest = json.loads(fil.read('manifest.json'))
+                self.assertEqual(
+                    [item['filename'] for item in manifest['files']],
+                    ['1/CSL01', '2/CSL01'])
+                branch = fil.read('2/CSL01').decode('CP1253').split('\n')
+        self.assertEqual(
+            branch, list(apd.apd_lines(parartima, totals[parartima.pk])))
+        # Εγγραφή 1 με τα στοιχεία του παραρτήματος, ένας εργαζόμενος
+        self.assertEqual(branch[0][17:20], '125')
+        self.assertIn('ΑΚΤΗ', branch[0])
+        self.assertEqual([line[0] for line in branch], ['1', '2', '3', 'E'])
+        self.assertEqual(branch[2][1:5], '0002')
+        # Χωρίς παράρτημα όλοι οι εργαζόμενοι με το παράρτημα 1
+        self.assertEqual(len(list(apd.apd_lines())), 2 + 2 * 3)
+        # Το κανονικό αρχείο της ΑΠΔ έχει κι αυτό ένα CSL01 ανά παράρτημα
+        export = exports.apd_export(apd)
+        with zipfile.ZipFile(BytesIO(export.content())) as fil:
+            self.assertEqual(fil.namelist(), ['1/CSL01', '2/CSL01'])
+            self.assertEqual(fil.read('2/CSL01').decode('CP1253').split('\n'), branch)
+        self.assertEqual(export.records(), 2 * 2 + 3 + 3)
+        # Με ένα παράρτημα και τα δύο zip έχουν σκέτο CSL01
+        md.Proslipsi.objects.filter(erg__ama=3).update(parartima=self.parartima)
+        archive = BytesIO()
+        manifest = bundle.build_branches(apd, archive, workers=1)
+        self.assertEqual([item['filename'] for item in manifest['files']], ['CSL01'])
+        with zipfile.ZipFile(archive) as fil:
+            self.assertEqual(fil.namelist(), ['CSL01', 'manifest.json'])
+            self.assertEqual(
+                fil.read('CSL01').decode('CP1253').split('\n'), list(apd.apd_lines()))
+        md.Proslipsi.objects.filter(erg__ama=3).update(parartima=parartima)
+        # Το κλειδί αλλάζει με τα στοιχεία κάθε παραρτήματος
+        parartima.adnum = '2'
+        parartima.save()
+        self.assertNotEqual(exports.apd_export(apd).key, export.key)
+        out = StringIO()
+        with tempfile.TemporaryDirectory() as folder:
+            zipped = os.path.join(folder, 'apd.zip')
+            with open(zipped, 'wb') as fil:
+                fil.write(exports.apd_export(apd).content())
+            call_command(
+                'reconcile', zipped, '--member=2/CSL01', f'--apd={apd.pk}', stdout=out)
+        self.assertIn('0 διαφορές', out.getvalue())
+
+    def test_reconcile(self):
+        apd, fmy = self.add_apd_fmy()
+        generated = reconcile.validate(apd.apd_lines())
+        self.assertEqual(generated.errors, [])
+        self.assertEqual(
+            generated.totals(), dict(zip(reconcile.APD.totals, apd.calc_totals())))
+        with tempfile.TemporaryDirectory() as folder:
+            zipped = os.path.join(folder, 'apd.zip')
+            with open(zipped, 'wb') as fil:
+                fil.write(exports.apd_export(apd).content())
+            out = StringIO()
+            call_command('reconcile', zipped, f'--apd={apd.pk}', stdout=out)
+            self.assertIn('3 εργαζόμενοι', out.getvalue())
+            self.assertIn('0 διαφορές', out.getvalue())
+            with self.assertRaisesMessage(CommandError, 'υπάρχουν: CSL01'):
+                call_command(
+                    'reconcile', zipped, '--member=2/CSL01', f'--apd={apd.pk}',
+                    stdout=StringIO())
+            # Εγγραφή μετά το EOF
+            lines = apd.apd2text().split('\n')
+            raw = os.path.join(folder, 'CSL01')
+            with open(raw, 'w', encoding='CP1253') as fil:
+                fil.write('\n'.join(lines[:2] + ['EOF'] + lines[2:]))
+            self.assertEqual(
+                reconcile.validate(read_lines(raw)).errors[0],
+                'Γραμμή 4: Εγγραφή μετά το EOF')
+            # Αλλαγή ποσού και εργαζόμενος που λείπει
+            lines[2] = lines[2][:-11] + '00000099999'
+            del lines[5:7]
+            with open(raw, 'w', encoding='CP1253') as fil:
+                fil.write('\n'.join(lines))
+            submitted = reconcile.validate(read_lines(raw))
+            self.assertEqual(len(submitted.errors), 3)
+            self.assertIn('APD_HEADER.meres', submitted.errors[0])
+            differences = reconcile.diff(submitted, generated)
+            self.assertEqual(
+                [(dif.employee, dif.field, dif.submitted) for dif in differences],
+                [(1, 'katavlitees', Money(99999)), (3, None, False)])
+            with self.assertRaisesMessage(CommandError, 'αρχεία με λάθη'):
+                call_command('reconcile', raw, zipped, stdout=StringIO())
+            with self.assertRaisesMessage(CommandError, 'ίδιου είδους'):
+                call_command('reconcile', zipped, f'--fmy={fmy.pk}', stdout=StringIO())
+
+    def test_payslips(self):
+        for num in range(1, 4):
+            self.add_ergazomenos(num)
+        misthodosia = md.Misthodosia.objects.get(pk=self.misthodosia.pk)
+        texts = payslips.slips(misthodosia)
+        self.assertEqual(
+            [filename for filename, _ in texts],
+            [f'{num:09d}-{pro.pk}.pdf' for num, pro in enumerate(
+                md.Proslipsi.objects.order_by('erg__ama'), 1)])
+        line = misthodosia.snapshot().lines.get(pro__erg__ama=1)
+        self.assertIn('ΕΠΩΝΥΜΟ1 ΟΝΟΜΑ', texts[0][1])
+        self.assertIn(str(line.pliroteo), texts[0][1].split('\n')[-4])
+        url = reverse('payslips_job', args=[self.misthodosia.pk])
+        with tempfile.TemporaryDirectory() as folder:
+            with override_settings(
+                    MIS_EXPORT_CACHE_DIR=folder, MIS_EXPORT_WORKERS=0, MIS_BUNDLE_WORKERS=1):
+                self.assertEqual(self.client.get(url).status_code, 405)
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 202)
+                data = response.json()
+                self.assertEqual(data['status'], 'done')
+                job = md.ExportJob.objects.get(pk=data['id'])
+                self.assertEqual(
+                    (job.kind, job.progress, job.total, job.filename),
+                    (md.ExportJob.PAYSLIPS, 4, 4, f'apodeixeis-{self.misthodosia.pk}.zip'))
+                response = self.client.get(data['download_url'])
+                content = b''.join(response.streaming_content)
+        with zipfile.ZipFile(BytesIO(content)) as fil:
+            self.assertEqual(
+                fil.namelist(),
+                [payslips.COMBINED] + [filename for filename, _ in texts])
+            self.assertTrue(fil.read(payslips.COMBINED).startswith(b'%PDF'))
+        response = self.client.get(
+            reverse('mis_detail', args=[self.misthodosia.pk]))
+        self.assertContains(response, url)
+        # Τα fonts του cache δίνουν το ίδιο PDF
+        item = ('test.pdf', 'footer', [texts[0][1]], True)
+        _, cached, pages = payslips.render(item)
+        _, uncached, _ = payslips.render(item[:3] + (False,))
+        self.assertEqual(pages, 1)
+        # Η ημερομηνία και το /ID (hash με την ημερομηνία) αλλάζουν ανά δευτερόλεπτο
+        strip = re.compile(rb'/CreationDate \(.*?\)|/ID \[.*?\]')
+        self.assertEqual(strip.sub(b'', cached), strip.sub(b'', uncached))
+        # Με άλλο PDF από το cache (π.χ. άλλη έκδοση του fpdf2) τα fonts
+        # αναλύονται σε κάθε PDF
+        self.assertTrue(txt2pdf.cache_ok())
+        template = txt2pdf._font_cache[''][0]
+        self.assertIs(txt2pdf.PDF('t', 'f').fonts['fnormal'].cw, template.cw)
+        txt2pdf._cache_ok = False
+        try:
+            self.assertIsNot(txt2pdf.PDF('t', 'f').fonts['fnormal'].cw, template.cw)
+        finally:
+            txt2pdf._cache_ok = None
+        with tempfile.TemporaryDirectory() as folder:
+            out = StringIO()
+            call_command(
+                'payslips', self.misthodosia.pk, '--workers=1',
+                f'--output={folder}', stdout=out)
+            self.assertIn('3 εργαζόμενοι, 6 σελίδες', out.getvalue())
+            self.assertEqual(len(os.listdir(folder)), 4)
+        # Διεργασίες με spawn (όπως στις εργασίες): Κάθε PDF γράφεται μόλις γίνει
+        counts = []
+        stream = BytesIO()
+        report = payslips.build(
+            misthodosia, stream, 2, progress=counts.append,
+            mp_context=multiprocessing.get_context('spawn'))
+        self.assertEqual((report['pages'], counts), (6, [1, 2, 3, 4]))
+        with zipfile.ZipFile(stream) as fil:
+            self.assertEqual(len(fil.namelist()), 4)
+
+    def test_bundle(self):
+        apd, fmy = self.add_apd_fmy()
+        self.assertEqual(bundle.period_range(2020), (202001, 202012))
+        self.assertEqual(bundle.declarations(202001, 202001), [('apd', apd.pk), ('fmy', fmy.pk)])
+        self.assertEqual(bundle.declarations(202002, 202012), [])
+        with tempfile.TemporaryDirectory() as folder:
+            output = os.path.join(folder, 'bundle.zip')
+            out = StringIO()
+            with override_settings(MIS_EXPORT_CACHE_DIR=folder, MIS_BUNDLE_WORKERS=1):
+                call_command('bundle', '2020', '--workers=1', f'--output={output}', stdout=out)
+                self.assertIn('2 αρχεία', out.getvalue())
+                with zipfile.ZipFile(output) as fil:
+                    manifest = json.loads(fil.read('manifest.json'))
+                    apd_file = manifest['files'][0]
+                    self.assertEqual(apd_file['filename'], 'apd/apd-202001-01.zip')
+                    self.assertEqual(
+                        fil.read(apd_file['filename']), exports.apd_export(apd).content())
+                    self.assertEqual(apd_file['totals']['meres'], '60')
+                # Ενέργεια του admin: Εργασία στο παρασκήνιο
+                user = get_user_model().objects.create_superuser('admin', 'a@a.gr', 'pass')
+                self.client.force_login(user)
+                with override_settings(MIS_EXPORT_WORKERS=0):
+                    response = self.client.post(reverse('admin:mis_fmy_changelist'), {
+                        'action': 'make_bundle', '_selected_action': [fmy.pk]})
+                self.assertEqual(response.status_code, 302)
+                job = md.ExportJob.objects.get(kind=md.ExportJob.BUNDLE)
+                self.assertEqual(
+                    (job.status, job.progress, job.total, job.filename),
+                    (md.ExportJob.DONE, 1, 1, 'fmy-bundle.zip'))
+                self.assertEqual(job.params, {'items': [['fmy', fmy.pk]]})
+                response = self.client.get(reverse('admin:mis_exportjob_change', args=[job.pk]))
+                download = reverse('export_job_download', args=[job.pk])
+                self.assertContains(response, download)
+                response = self.client.get(download)
+                self.assertIsInstance(response, FileResponse)
+                content = b''.join(response.streaming_content)
+                with zipfile.ZipFile(BytesIO(content)) as fil:
+                    self.assertIn('fmy/fmy-202001.zip', fil.namelist())
+                # Η ίδια εργασία σε εξέλιξη δεν ξεκινά δεύτερη φορά
+                md.ExportJob.objects.filter(pk=job.pk).update(
+                    status=md.ExportJob.RUNNING, owner='other:1', heartbeat=timezone.now())
+                self.assertEqual(jobs.submit_bundle([('fmy', fmy.pk)]).pk, job.pk)
+        # Χωρίς cache τα αρχεία περνούν από προσωρινά αρχεία (όχι bytes στη μνήμη)
+        stream = BytesIO()
+        with override_settings(MIS_EXPORT_CACHE_DIR=None):
+            manifest = bundle.build([('fmy', fmy.pk)], stream)
+        self.assertNotIn('path', manifest['files'][0])
+        with zipfile.ZipFile(stream) as fil:
+            self.assertEqual(
+                fil.read('fmy/fmy-202001.zip'), exports.fmy_export(fmy).content())
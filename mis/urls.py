@@ -11,11 +11,18 @@ urlpatterns = [
     path('ergazomenoi/<int:pk>/', views.ErgUpdateView.as_view(), name='erg_detail'),
     path('ergazomenoi/', views.ErgListView.as_view(), name='erg'),
     path('misthodosies/<int:pk>/', views.MisDetailView.as_view(), name='mis_detail'),
+    path('misthodosies/<int:pk>/payslips/job/', views.payslips_job,
+         name='payslips_job'),
     path('misthodosies/', views.MisListView.as_view(), name='mis'),
     path('apd/<int:apd_id>/', views.apd2zip, name='apd2zip'),
+    path('apd/<int:apd_id>/job/', views.apd_job, name='apd_job'),
     path('apd/', views.ApdListView.as_view(), name='apd'),
     path('fmy/', views.FmyListView.as_view(), name='fmy'),
     path('fmy/<int:fmy_id>/', views.fmy2zip, name='fmy2zip'),
+    path('fmy/<int:fmy_id>/job/', views.fmy_job, name='fmy_job'),
+    path('jobs/<int:job_id>/', views.export_job, name='export_job'),
+    path('jobs/<int:job_id>/download/', views.export_job_download,
+         name='export_job_download'),
     path('', views.HomePageView.as_view(), name='home'),
     path("graphql", GraphQLView.as_view(graphiql=True), name='graphql'),
 ]
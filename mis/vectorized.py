@@ -0,0 +1,430 @@
+"""
+Υπολογισμός της μισθοδοσίας με πίνακες NumPy (προαιρετικό, χρειάζεται numpy)
+
+Όλα τα ποσά κρατιούνται ως ακέραια λεπτά ή ως ακριβή κλάσματα (αριθμητής,
+παρονομαστής) σε πίνακες int64 και οι αποδοχές, οι κρατήσεις, ο φόρος, η
+εισφορά αλληλεγγύης και το πληρωτέο υπολογίζονται για όλους τους
+εργαζόμενους μαζί. Κάθε στρογγυλοποίηση σε 2 δεκαδικά γίνεται στο ίδιο
+σημείο και με τον ίδιο τρόπο (ROUND_HALF_UP, όπως το utils.money.Money) με
+τον υπολογισμό του compute.calc_employee, οπότε το αποτέλεσμα είναι ίδιο.
+
+Αν ένας τύπος υπολογισμού δεν μπορεί να υπολογιστεί με ακέραιους (π.χ.
+σταθερά float, //, %) ή τα νούμερα ξεπερνούν τα όρια του int64, ο
+υπολογισμός γίνεται με το compute.calc_chunk.
+"""
+import ast
+from decimal import Decimal
+from utils.forologia import forologiko_etos
+from utils.formula import parse_formula, formulas
+from utils.money import Money
+from .compute import EmployeeResult, FOROI_FIELDS, calc_chunk
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# Όριο για τα γινόμενα ώστε να μη γίνει υπερχείλιση του int64
+LIMIT = 2.0**62
+
+
+class Unsupported(Exception):
+    """Ο υπολογισμός δεν γίνεται με ακέραιους πίνακες"""
+
+
+def available():
+    return np is not None
+
+
+def check(*arrays):
+    """Unsupported αν το γινόμενο των πινάκων μπορεί να υπερχειλίσει"""
+    bound = 1.0
+    for arr in arrays:
+        bound *= float(np.abs(arr).max(initial=0))
+    if bound >= LIMIT:
+        raise Unsupported("Υπερχείλιση int64")
+
+
+def mul(left, right):
+    check(left, right)
+    return left * right
+
+
+def round_div(num, den):
+    """num / den σε ακέραιο με ROUND_HALF_UP (den > 0), όπως η
+    utils.money.round_half_up
+    """
+    check(num, 2)
+    quot = (2 * np.abs(num) + den) // (2 * den)
+    return np.where(num < 0, -quot, quot)
+
+
+def ratio(value):
+    """(αριθμητής, παρονομαστής) ενός ακέραιου ή Decimal"""
+    if isinstance(value, bool) or not isinstance(value, (int, Decimal)):
+        raise Unsupported(f"Μη ακριβής αριθμός: {value!r}")
+    return value.as_integer_ratio()
+
+
+class Fraction:
+    """Πίνακας ακριβών κλασμάτων num / den με den > 0"""
+
+    __slots__ = ("num", "den")
+
+    def __init__(self, num, den):
+        num, den = np.broadcast_arrays(
+            np.asarray(num, dtype=np.int64), np.asarray(den, dtype=np.int64)
+        )
+        gcd = np.gcd(num, den)
+        gcd = np.where(gcd == 0, 1, gcd)
+        self.num = num // gcd
+        self.den = den // gcd
+
+    def __add__(self, other):
+        return Fraction(
+            mul(self.num, other.den) + mul(other.num, self.den),
+            mul(self.den, other.den),
+        )
+
+    def __sub__(self, other):
+        return self + Fraction(-other.num, other.den)
+
+    def __mul__(self, other):
+        return Fraction(mul(self.num, other.num), mul(self.den, other.den))
+
+    def __truediv__(self, other):
+        if (other.num == 0).any():
+            raise Unsupported("Διαίρεση με το μηδέν")
+        sign = np.sign(other.num)
+        return Fraction(mul(self.num, other.den) * sign, mul(self.den, other.num) * sign)
+
+    def compare(self, other):
+        """Πίνακας με το πρόσημο του self - other"""
+        return np.sign(mul(self.num, other.den) - mul(other.num, self.den))
+
+    def cents(self):
+        """Στρογγυλοποίηση σε λεπτά (Money.of)"""
+        return round_div(mul(self.num, 100), self.den)
+
+
+COMPARE = {
+    ast.Lt: lambda sign: sign < 0,
+    ast.LtE: lambda sign: sign <= 0,
+    ast.Gt: lambda sign: sign > 0,
+    ast.GtE: lambda sign: sign >= 0,
+    ast.Eq: lambda sign: sign == 0,
+    ast.NotEq: lambda sign: sign != 0,
+}
+
+
+class FormulaEvaluator:
+    """Υπολογίζει το AST ενός τύπου (utils.formula.parse_formula) για
+    πίνακες Fraction
+    """
+
+    def __init__(self, source, names):
+        self.tree, consts = parse_formula(source, names)
+        self.consts = {
+            name: Fraction(*ratio(value)) for name, value in consts.items()
+        }
+
+    def __call__(self, **names):
+        self.names = names
+        return self.value(self.tree.body)
+
+    def value(self, node):
+        result = self.visit(node)
+        if not isinstance(result, Fraction):
+            raise Unsupported("Ο τύπος δεν δίνει αριθμό")
+        return result
+
+    def test(self, node):
+        result = self.visit(node)
+        if isinstance(result, Fraction):
+            return result.num != 0
+        return result
+
+    def visit(self, node):
+        if isinstance(node, ast.Name):
+            if node.id in self.consts:
+                return self.consts[node.id]
+            return self.names[node.id]
+        if isinstance(node, ast.Constant):
+            return Fraction(*ratio(node.value))
+        if isinstance(node, ast.BinOp):
+            left = self.value(node.left)
+            right = self.value(node.right)
+            if isinstance(node.op, ast.Add):
+                return left + right
+            if isinstance(node.op, ast.Sub):
+                return left - right
+            if isinstance(node.op, ast.Mult):
+                return left * right
+            if isinstance(node.op, ast.Div):
+                return left / right
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return ~self.test(node.operand)
+            operand = self.value(node.operand)
+            if isinstance(node.op, ast.USub):
+                return Fraction(-operand.num, operand.den)
+            return operand
+        if isinstance(node, ast.Call):
+            # Decimal(μεταβλητή): Τα κλάσματα είναι ήδη ακριβή
+            return self.value(node.args[0])
+        if isinstance(node, ast.Compare):
+            result = True
+            left = self.value(node.left)
+            for oper, comp in zip(node.ops, node.comparators):
+                right = self.value(comp)
+                result = result & COMPARE[type(oper)](left.compare(right))
+                left = right
+            return result
+        if isinstance(node, ast.BoolOp):
+            tests = [self.test(val) for val in node.values]
+            if isinstance(node.op, ast.And):
+                return np.logical_and.reduce(tests)
+            return np.logical_or.reduce(tests)
+        if isinstance(node, ast.IfExp):
+            test = self.test(node.test)
+            body = self.value(node.body)
+            orelse = self.value(node.orelse)
+            return Fraction(
+                np.where(test, body.num, orelse.num),
+                np.where(test, body.den, orelse.den),
+            )
+        raise Unsupported(f"Δεν υποστηρίζεται: {type(node).__name__}")
+
+
+def evaluator(frm):
+    """FormulaEvaluator για το FormulaData με cache ανά pk και κείμενο"""
+    key = (frm.pk, frm.evalu)
+    if key not in EVALUATORS:
+        EVALUATORS[key] = FormulaEvaluator(frm.evalu, formulas.names)
+    return EVALUATORS[key]
+
+
+EVALUATORS = {}
+
+
+def ratios(values):
+    """Πίνακες αριθμητών και παρονομαστών των values"""
+    cache = {}
+    pairs = []
+    for value in values:
+        pair = cache.get(value)
+        if pair is None:
+            pair = cache[value] = ratio(value)
+        pairs.append(pair)
+    nums = np.array([num for num, _ in pairs], dtype=np.int64)
+    dens = np.array([den for _, den in pairs], dtype=np.int64)
+    return nums, dens
+
+
+def moneys(cents):
+    """Λίστα Money από πίνακα λεπτών"""
+    return [Money(value) for value in cents.tolist()]
+
+
+def klimaka_cents(klimaka, poso, scale):
+    """utils.forologia.Klimaka.cents για πίνακα ποσών"""
+    oria = np.array(klimaka.oria, dtype=np.int64)
+    idx = np.maximum(np.searchsorted(oria * scale, poso, side="right") - 1, 0)
+    amount = (
+        np.array(klimaka.sorefta, dtype=np.int64)[idx] * scale
+        + np.array(klimaka.syntelestes, dtype=np.int64)[idx]
+        * (poso - oria[idx] * scale)
+    )
+    return round_div(amount * 100, klimaka.divisor * scale)
+
+
+def calc_foros_eea(etos, forologiteo, paidia, barytis):
+    """utils.forologia.calc_foros_eea_periodou για πίνακες (ποσά σε λεπτά)"""
+    klimakes = forologiko_etos(etos)
+    bnum, bden = ratio(barytis)
+    if bnum <= 0:
+        raise Unsupported("Μη θετική βαρύτητα")
+    # Ετήσιο ποσό = poso / scale ευρώ
+    scale = 100 * bden
+    poso = mul(forologiteo, bnum)
+    check(poso, scale * 1000 * max(klimakes.foros.divisor, klimakes.eea.divisor))
+    foros = klimaka_cents(klimakes.foros, poso, scale)
+    # Μείωση για τα παιδιά (ForologikoEtos.meiosi_paidia)
+    last = len(klimakes.meiosi) - 1
+    meiosi = np.where(
+        paidia <= last,
+        np.array(klimakes.meiosi, dtype=np.int64)[np.minimum(paidia, last)],
+        klimakes.meiosi[last] + klimakes.meiosi_extra * (paidia - last),
+    )
+    orio = klimakes.meiosi_orio * scale
+    vimata = np.where(
+        poso > orio, (poso - orio) // (klimakes.meiosi_vima * scale), 0
+    )
+    meiosi = np.where(
+        paidia >= klimakes.meiosi_plires,
+        meiosi,
+        np.maximum(meiosi - vimata * klimakes.meiosi_poso, 0),
+    )
+    foros = np.where(meiosi * 100 >= foros, 0, foros - meiosi * 100)
+    eea = klimaka_cents(klimakes.eea, poso, scale)
+    # Ανά περίοδο
+    return (
+        round_div(foros * bden, bnum),
+        round_div(eea * bden, bnum),
+    )
+
+
+def kernel(payroll, employees):
+    nemp = len(employees)
+    missing = [[] for _ in range(nemp)]
+    # Οι παρουσίες με τύπο υπολογισμού, ομαδοποιημένες ανά τύπο
+    rows_emp, rows_val, rows_frm, rows_dates = [], [], [], []
+    for idx, emp in enumerate(employees):
+        for ptyp_id, val, apo, eos in emp.parousies:
+            frm = payroll.formulas.get((ptyp_id, emp.ergt_id))
+            if frm is None:
+                missing[idx].append(ptyp_id)
+                continue
+            rows_emp.append(idx)
+            rows_val.append(val)
+            rows_frm.append(frm)
+            rows_dates.append((apo, eos))
+    amounts = {}
+    for name in ("misthos", "imeromisthio", "oromisthio"):
+        amounts[name] = ratios(getattr(emp, name) for emp in employees)
+    rows_emp = np.array(rows_emp, dtype=np.int64)
+    rows_val = np.array(rows_val, dtype=np.int64)
+    nrows = len(rows_frm)
+    apod = np.zeros(nrows, dtype=np.int64)
+    meresefka = np.zeros(nrows, dtype=bool)
+    argiaefka = np.zeros(nrows, dtype=bool)
+    apodt_ids = sorted({frm.apodt_id for frm in rows_frm})
+    apodt_index = {apodt_id: idx for idx, apodt_id in enumerate(apodt_ids)}
+    rows_apodt = np.array(
+        [apodt_index[frm.apodt_id] for frm in rows_frm], dtype=np.int64
+    )
+    by_formula = {}
+    for idx, frm in enumerate(rows_frm):
+        by_formula.setdefault(frm, []).append(idx)
+    for frm, idxs in by_formula.items():
+        idxs = np.array(idxs, dtype=np.int64)
+        emps = rows_emp[idxs]
+        names = {"val": Fraction(rows_val[idxs], 1)}
+        for name, (nums, dens) in amounts.items():
+            names[name] = Fraction(nums[emps], dens[emps])
+        result = evaluator(frm)(**names)
+        apod[idxs] = np.broadcast_to(result.cents(), idxs.shape)
+        meresefka[idxs] = frm.meresefka
+        argiaefka[idxs] = frm.argiaefka
+    # Άθροιση ανά εργαζόμενο-τύπο αποδοχών με τη σειρά της πρώτης παρουσίας
+    keep = np.flatnonzero(apod != 0)
+    codes = rows_emp[keep] * max(len(apodt_ids), 1) + rows_apodt[keep]
+    _, first, inverse = np.unique(codes, return_index=True, return_inverse=True)
+    order = np.argsort(first, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    key = rank[inverse.reshape(-1)]
+    nkeys = len(order)
+    key_emp = rows_emp[keep][first[order]]
+    key_apodt = rows_apodt[keep][first[order]]
+    key_apod = np.zeros(nkeys, dtype=np.int64)
+    key_meres = np.zeros(nkeys, dtype=np.int64)
+    key_argia = np.zeros(nkeys, dtype=np.int64)
+    key_last = np.full(nkeys, -1, dtype=np.int64)
+    np.add.at(key_apod, key, apod[keep])
+    np.add.at(key_meres, key, np.where(meresefka[keep], rows_val[keep], 0))
+    np.add.at(key_argia, key, np.where(argiaefka[keep], rows_val[keep], 0))
+    np.maximum.at(key_last, key, keep)
+    # Κρατήσεις ανά εργαζόμενο-τύπο αποδοχών-ΚΑΔ-ΕΙΔ-ΚΠΚ
+    kpk_count = np.array([len(emp.kpks) for emp in employees], dtype=np.int64)
+    kpk_start = np.cumsum(kpk_count) - kpk_count
+    kpk_rows = [kpk for emp in employees for kpk in emp.kpks]
+    kr_count = kpk_count[key_emp]
+    kr_key = np.repeat(np.arange(nkeys), kr_count)
+    kr_pos = np.repeat(kpk_start[key_emp] - (np.cumsum(kr_count) - kr_count), kr_count)
+    kr_pos = kr_pos + np.arange(len(kr_key))
+    kr_apod = key_apod[kr_key]
+    perg_num, perg_den = ratios(perg for _, perg, _ in kpk_rows)
+    ptot_num, ptot_den = ratios(ptot for _, _, ptot in kpk_rows)
+    kr_enos = round_div(
+        mul(perg_num[kr_pos], kr_apod), mul(perg_den[kr_pos], 100)
+    )
+    kr_total = round_div(
+        mul(ptot_num[kr_pos], kr_apod), mul(ptot_den[kr_pos], 100)
+    )
+    # Μισθοδοτική κατάσταση: Μόνο οι τύποι αποδοχών που πληρώνονται
+    plirotees = np.array(
+        [apodt_id in payroll.plirotees for apodt_id in apodt_ids], dtype=bool
+    )[key_apodt]
+    sums = {name: np.zeros(nemp, dtype=np.int64) for name in FOROI_FIELDS}
+    np.add.at(sums["meres"], key_emp[plirotees], key_meres[plirotees])
+    np.add.at(sums["apodoxes"], key_emp[plirotees], key_apod[plirotees])
+    kr_plir = plirotees[kr_key]
+    kr_emp = key_emp[kr_key][kr_plir]
+    np.add.at(sums["kr_enos"], kr_emp, kr_enos[kr_plir])
+    np.add.at(sums["kr_etis"], kr_emp, (kr_total - kr_enos)[kr_plir])
+    np.add.at(sums["kr_total"], kr_emp, kr_total[kr_plir])
+    sums["forologiteo"] = sums["apodoxes"] - sums["kr_enos"]
+    paidia = np.array([emp.paidia for emp in employees], dtype=np.int64)
+    sums["foros"], sums["eea"] = calc_foros_eea(
+        payroll.etos, sums["forologiteo"], paidia, payroll.barytis
+    )
+    sums["pliroteo"] = sums["forologiteo"] - sums["foros"] - sums["eea"]
+    # Αποτέλεσμα με τη δομή του compute.calc_employee
+    emp_keys = [[] for _ in range(nemp)]
+    for idx, emp_idx in enumerate(key_emp.tolist()):
+        emp_keys[emp_idx].append(idx)
+    key_kr = [[] for _ in range(nkeys)]
+    for idx, key_idx in enumerate(kr_key.tolist()):
+        key_kr[key_idx].append(idx)
+    key_apod = moneys(key_apod)
+    key_meres = key_meres.tolist()
+    key_argia = key_argia.tolist()
+    key_last = key_last.tolist()
+    key_apodt = key_apodt.tolist()
+    kr_etis = moneys(kr_total - kr_enos)
+    kr_enos = moneys(kr_enos)
+    kr_total = moneys(kr_total)
+    kr_eidkek = [kpk_rows[pos][0] for pos in kr_pos.tolist()]
+    foroi_cols = [
+        sums[name].tolist() if name == "meres" else moneys(sums[name])
+        for name in FOROI_FIELDS
+    ]
+    results = []
+    for idx, emp in enumerate(employees):
+        imeromisthio_apd = emp.imeromisthio if emp.ergt_id == 2 else 0
+        apodoxes = {}
+        for key_idx in emp_keys[idx]:
+            apo, eos = rows_dates[key_last[key_idx]]
+            apodoxes[apodt_ids[key_apodt[key_idx]]] = {
+                "apod": key_apod[key_idx],
+                "meres": key_meres[key_idx],
+                "argia": key_argia[key_idx],
+                "apo": apo,
+                "eos": eos,
+                "imeromisthio": imeromisthio_apd,
+                "kratiseis": {
+                    kr_eidkek[kr]: {
+                        "enos": kr_enos[kr],
+                        "etis": kr_etis[kr],
+                        "total": kr_total[kr],
+                    }
+                    for kr in key_kr[key_idx]
+                },
+            }
+        foroi = {name: col[idx] for name, col in zip(FOROI_FIELDS, foroi_cols)}
+        results.append(EmployeeResult(emp.pro_id, apodoxes, missing[idx], foroi))
+    return results
+
+
+def calc_employees(payroll, employees):
+    """Ίδιο αποτέλεσμα με το compute.calc_chunk. Χωρίς numpy ή αν κάτι δεν
+    υπολογίζεται με ακέραιους, ο υπολογισμός γίνεται με Decimal.
+    """
+    employees = list(employees)
+    if np is None or not employees:
+        return calc_chunk(payroll, employees)
+    try:
+        return kernel(payroll, employees)
+    except Unsupported:
+        return calc_chunk(payroll, employees)
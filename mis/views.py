@@ -1,10 +1,14 @@
 # from wsgiref.util import FileWrapper
-from django.http import HttpResponse
+import os
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.views import generic
 from django.views.generic.edit import CreateView, UpdateView
 from django.contrib import messages
-from django.shortcuts import redirect
-from . import models
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_POST
+from . import exports, jobs, models
 
 # app_name = 'mis'
 
@@ -22,6 +26,16 @@ class ErgListView(generic.ListView):
     context_object_name = 'ergazomenoi_list'
     template_name = 'mis/ergazomenoi.html'
 
+    def get_queryset(self):
+        """Με ?period=YYYYMM μόνο οι ενεργοί της περιόδου"""
+        period = self.request.GET.get('period', '')
+        if period.isdigit() and len(period) == 6:
+            try:
+                return models.Ergazomenos.objects.active_in(int(period)).with_active()
+            except ValueError:
+                pass
+        return models.Ergazomenos.objects.with_active()
+
 
 class ErgDetailView(generic.DetailView):
     model = models.Ergazomenos
@@ -79,29 +93,101 @@ class FmyListView(generic.ListView):
     template_name = 'mis/fmy.html'
 
 
+def export_response(request, export):
+    """Το zip από το cache ή σε κομμάτια, με ETag. None αν δεν υπάρχει."""
+    not_modified = get_conditional_response(request, etag=export.etag)
+    if not_modified is not None:
+        return not_modified
+    path = export.cached()
+    if path is not None:
+        response = FileResponse(open(path, 'rb'), content_type='application/zip')
+    else:
+        chunks = export.stream()
+        if chunks is None:
+            return None
+        response = StreamingHttpResponse(chunks, content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename={export.filename}'
+    response['ETag'] = export.etag
+    return response
+
+
 def fmy2zip(request, fmy_id):
     """Δημιουργία αρχείου ΦΜΥ"""
     fmy_period = models.Fmy.objects.get(pk=fmy_id)
-    mfi, fname = fmy_period.fmy2stream()
-    if mfi is None:
+    export = exports.fmy_export(fmy_period)
+    response = export_response(request, export)
+    if response is None:
         messages.warning(
             request, f'Δεν υπάρχει ΦΜΥ για την περίοδο: {fmy_period} (Μήπως λόγω κορωνοιού ?)')
         return redirect('/fmy/')
-    response = HttpResponse(
-        mfi.getvalue(), content_type='application/zip')
-    response['Content-Disposition'] = f'attachment; filename={fname}'
-    messages.info(request, f'Το αρχείο {fname} αποθηκεύτηκε ...')
+    messages.info(request, f'Το αρχείο {export.filename} αποθηκεύτηκε ...')
     return response
 
 
+def job_data(job):
+    data = {
+        'id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'total': job.total,
+        'percent': job.percent(),
+        'finished': job.is_finished(),
+        'error': job.error,
+        'url': reverse('export_job', args=[job.pk]),
+    }
+    if job.status == models.ExportJob.DONE:
+        data['download_url'] = reverse('export_job_download', args=[job.pk])
+    return data
+
+
+@require_POST
+def apd_job(request, apd_id):
+    """Δημιουργία αρχείου ΑΠΔ στο παρασκήνιο"""
+    job = jobs.submit(apd=get_object_or_404(models.Apd, pk=apd_id))
+    return JsonResponse(job_data(job), status=202)
+
+
+@require_POST
+def fmy_job(request, fmy_id):
+    """Δημιουργία αρχείου ΦΜΥ στο παρασκήνιο"""
+    job = jobs.submit(fmy=get_object_or_404(models.Fmy, pk=fmy_id))
+    return JsonResponse(job_data(job), status=202)
+
+
+def export_job(request, job_id):
+    """Η κατάσταση της εργασίας"""
+    return JsonResponse(job_data(get_object_or_404(models.ExportJob, pk=job_id)))
+
+
+def export_job_download(request, job_id):
+    """Το αρχείο της εργασίας που ολοκληρώθηκε"""
+    job = get_object_or_404(models.ExportJob, pk=job_id, status=models.ExportJob.DONE)
+    if job.kind != models.ExportJob.EXPORT:
+        path = job.path()
+        if path is None or not os.path.exists(path):
+            raise Http404('Το αρχείο δεν υπάρχει πια')
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=job.filename)
+    export = job.export()
+    if export.key != job.key or export.cached() is None:
+        # Άλλαξαν τα δεδομένα μετά την εργασία
+        raise Http404('Το αρχείο δεν ισχύει πια')
+    return export_response(request, export)
+
+
+@require_POST
+def payslips_job(request, pk):
+    """Οι αποδείξεις πληρωμής των εργαζομένων (zip με PDF) στο παρασκήνιο"""
+    job = jobs.submit_payslips(get_object_or_404(models.Misthodosia, pk=pk))
+    return JsonResponse(job_data(job), status=202)
+
+
 def apd2zip(request, apd_id):
     """Δημιουργία αρχείου ΑΠΔ"""
     apd_period = models.Apd.objects.get(pk=apd_id)
-    mfi, fname = apd_period.apd2stream()
-    if mfi is None:
+    response = export_response(request, exports.apd_export(apd_period))
+    if response is None:
         messages.error(
             request, f'Δεν υπάρχει ΑΠΔ για την περίοδο: {apd_period}')
         return redirect('/apd/')
-    response = HttpResponse(mfi.getvalue(), content_type='application/zip')
-    response['Content-Disposition'] = f'attachment; filename={fname}'
     return response
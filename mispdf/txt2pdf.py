@@ -1,22 +1,114 @@
+import copy
+import logging
 import os
+from datetime import datetime, timezone
+from io import BytesIO
 import fpdf
+from fontTools import ttLib
+from fpdf.enums import XPos, YPos
+from fpdf.fonts import SubsetMap
 dir_path = os.path.dirname(os.path.realpath(__file__))
 font_dir = os.path.join(dir_path, 'fonts')
 fnormal = os.path.join(font_dir, 'DejaVuSansMono.ttf')
 fbold = os.path.join(font_dir, 'DejaVuSansMono-Bold.ttf')
+FONTS = (('', fnormal), ('B', fbold))
+
+logger = logging.getLogger(__name__)
+
+# Τα fonts αναλύονται μία φορά ανά διεργασία: {style: (font, bytes του ttf)}
+_font_cache = {}
+# Το add_cached_fonts δίνει ίδιο PDF με το add_font (βλ. cache_ok)
+_cache_ok = None
+
+
+def load_fonts():
+    """Αναλύει τα fonts στο cache της διεργασίας (και ως initializer του
+    ProcessPoolExecutor)
+    """
+    for style, fname in FONTS:
+        if style not in _font_cache:
+            pdf = fpdf.FPDF()
+            pdf.add_font('fnormal', style=style, fname=fname)
+            with open(fname, 'rb') as fil:
+                data = fil.read()
+            _font_cache[style] = (pdf.fonts[f'fnormal{style}'], data)
+
+
+def add_cached_fonts(pdf):
+    """Τα fonts του cache στο pdf χωρίς νέα ανάλυση των ttf
+
+    Το subset των fonts γράφεται στο output και αλλάζει το TTFont, γι' αυτό
+    κάθε έγγραφο παίρνει δικό του (lazy) TTFont και δικό του SubsetMap.
+    """
+    load_fonts()
+    for style, _ in FONTS:
+        template, data = _font_cache[style]
+        font = copy.copy(template)
+        font.i = len(pdf.fonts) + 1
+        font.ttfont = ttLib.TTFont(BytesIO(data), recalcTimestamp=False, lazy=True)
+        font.missing_glyphs = []
+        font.biggest_size_pt = 0
+        font.subset = SubsetMap(font)
+        pdf.fonts[font.fontkey] = font
+
+
+def _probe(cached):
+    pdf = fpdf.FPDF()
+    # Σταθερή ημερομηνία ώστε να είναι ίδιο και το /ID
+    pdf.set_creation_date(datetime(2020, 1, 1, tzinfo=timezone.utc))
+    if cached:
+        add_cached_fonts(pdf)
+    else:
+        for style, fname in FONTS:
+            pdf.add_font('fnormal', style=style, fname=fname)
+    pdf.add_page()
+    for style, _ in FONTS:
+        pdf.set_font('fnormal', style, 10)
+        pdf.cell(
+            0, 4, 'Σελίδα 1/2 ΑΠΟΔΟΧΕΣ 1.234,56',
+            new_x=XPos.LMARGIN, new_y=YPos.NEXT,
+        )
+    return bytes(pdf.output())
+
+
+def cache_ok():
+    """Το cache των fonts δίνει ίδιο PDF με το add_font
+
+    Το add_cached_fonts αλλάζει εσωτερικά πεδία των fonts του fpdf2 (η έκδοση
+    είναι καρφωμένη στο requirements.txt). Ελέγχεται μία φορά ανά διεργασία
+    και αν διαφέρει (π.χ. άλλη έκδοση του fpdf2) τα fonts αναλύονται σε κάθε
+    PDF όπως χωρίς cache.
+    """
+    global _cache_ok
+    if _cache_ok is None:
+        try:
+            _cache_ok = _probe(True) == _probe(False)
+            if not _cache_ok:
+                logger.warning(
+                    'Font cache disabled: output differs with fpdf2 %s',
+                    fpdf.FPDF_VERSION)
+        except Exception:
+            logger.exception('Font cache disabled: check failed')
+            _cache_ok = False
+    return _cache_ok
 
 
 class PDF(fpdf.FPDF):
-    def __init__(self, head1, footdata):
-        super().__init__(orientation='L')
+    def __init__(self, head1, footdata, cached=True, orientation='L'):
+        super().__init__(orientation=orientation)
         self.head1 = head1
         self.footdata = footdata
-        self.add_font("fnormal", style="", fname=fnormal, uni=True)
-        self.add_font("fnormal", style="b", fname=fbold, uni=True)
+        if cached and cache_ok():
+            add_cached_fonts(self)
+        else:
+            for style, fname in FONTS:
+                self.add_font("fnormal", style=style, fname=fname)
 
     def header(self):
         self.set_font('fnormal', 'b', 12)
-        self.cell(0, 5, self.head1, 0, 1, 'C')
+        self.cell(
+            0, 5, self.head1, align='C', new_x=XPos.LMARGIN, new_y=YPos.NEXT
+        )
         self.ln(7)
 
     def footer(self):
@@ -28,19 +120,21 @@ class PDF(fpdf.FPDF):
             0,
             10,
             f'{self.footdata}    Σελίδα: {self.page_no()} ' + '/ {nb}',
-            0,
-            0,
-            'C'
+            align='C',
         )
 
+    def add_text(self, text, size=10):
+        """Οι γραμμές του text σε νέα σελίδα"""
+        self.add_page()
+        self.set_font('fnormal', '', size)
+        for lin in text.split('\n'):
+            self.cell(
+                0, 4, lin.rstrip(), new_x=XPos.LMARGIN, new_y=YPos.NEXT
+            )
+
 
 def txt2pdf(title, footer, text, outfile):
-    lines = text.split('\n')
     pdf = PDF(title, footer)
     pdf.alias_nb_pages()
-    pdf.add_page()
-    pdf.set_font('fnormal', '', 10)
-    # print('---->', pdf.head1)
-    for lin in lines:
-        pdf.cell(0, 4, f'{lin.rstrip()}', 0, 1)
-    pdf.output(outfile, 'F')
+    pdf.add_text(text)
+    pdf.output(outfile)
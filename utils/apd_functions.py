@@ -1,4 +1,5 @@
 from datetime import date
+from .money import Money
 
 
 def fill_spaces(txtval: str, size: int) -> str:
@@ -21,12 +22,9 @@ def fill_spaces_cut(txtval: str, size: int) -> str:
 def decimal2flat(number, size):
     """
     Transforms a number 123.456,78 to string 00012345678
+    number may be Money, Decimal or int (rounded half up to cents)
     """
-    txtval = f'{round(number, 2)}'.replace(',', '').replace('.', '')
-    len_txtval = len(txtval)
-    if len_txtval > size:
-        raise ValueError('Value is bigger than size')
-    return '0' * (size - len_txtval) + txtval
+    return Money.of(number).flat(size)
 
 
 def leading_zeroes(val, size):
@@ -0,0 +1,209 @@
+"""
+Μεταγλώττιση των τύπων υπολογισμού (Formula.evalu, ErgazomenosType.eval*)
+
+Κάθε τύπος διαβάζεται μία φορά, ελέγχεται ότι περιέχει μόνο αριθμητικές
+πράξεις, συγκρίσεις, if/else και κλήσεις Decimal(...) και μετατρέπεται σε
+έτοιμο code object. Οι σταθερές (π.χ. Decimal(6.5)) υπολογίζονται κατά τη
+μεταγλώττιση.
+"""
+import ast
+import operator
+from decimal import Decimal
+
+BINOPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+UNARYOPS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+    ast.Not: operator.not_,
+}
+COMPARE_OPS = (ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+
+class FormulaError(ValueError):
+    """Μη αποδεκτός τύπος υπολογισμού"""
+
+
+class FormulaCompiler(ast.NodeTransformer):
+    """Ελέγχει και απλοποιεί το AST ενός τύπου
+
+    names: Τα ονόματα μεταβλητών που επιτρέπονται στον τύπο
+    """
+
+    def __init__(self, names):
+        self.names = frozenset(names)
+        self.consts = {}
+
+    def constant(self, value):
+        name = f"_k{len(self.consts)}"
+        self.consts[name] = value
+        return ast.Name(id=name, ctx=ast.Load())
+
+    def value_of(self, node):
+        """Επιστρέφει (True, τιμή) αν ο κόμβος είναι σταθερά"""
+        if isinstance(node, ast.Name) and node.id in self.consts:
+            return True, self.consts[node.id]
+        if isinstance(node, ast.Constant) and is_number(node.value):
+            return True, node.value
+        return False, None
+
+    def generic_visit(self, node):
+        raise FormulaError(f"Δεν επιτρέπεται: {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if is_number(node.value) or isinstance(node.value, str):
+            return node
+        raise FormulaError(f"Δεν επιτρέπεται η σταθερά {node.value!r}")
+
+    def visit_Name(self, node):
+        if node.id not in self.names:
+            raise FormulaError(f"Άγνωστη μεταβλητή: {node.id}")
+        return node
+
+    def visit_Attribute(self, node):
+        if (
+            not isinstance(node.value, ast.Name)
+            or node.value.id != "self"
+            or "self" not in self.names
+            or node.attr.startswith("_")
+        ):
+            raise FormulaError(f"Δεν επιτρέπεται το πεδίο {node.attr}")
+        return node
+
+    def visit_Call(self, node):
+        if not (isinstance(node.func, ast.Name) and node.func.id == "Decimal"):
+            raise FormulaError("Επιτρέπεται μόνο η κλήση Decimal(...)")
+        if node.keywords or len(node.args) != 1:
+            raise FormulaError("Η Decimal(...) δέχεται ένα μόνο όρισμα")
+        arg = self.visit(node.args[0])
+        if isinstance(arg, ast.Constant):
+            try:
+                return self.constant(Decimal(arg.value))
+            except ArithmeticError as err:
+                raise FormulaError(f"Λάθος αριθμός: {arg.value!r}") from err
+        node.args = [arg]
+        return node
+
+    def visit_BinOp(self, node):
+        if type(node.op) not in BINOPS:
+            raise FormulaError(f"Δεν επιτρέπεται: {type(node.op).__name__}")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        lconst, lval = self.value_of(node.left)
+        rconst, rval = self.value_of(node.right)
+        if lconst and rconst:
+            try:
+                return self.constant(BINOPS[type(node.op)](lval, rval))
+            except (ArithmeticError, TypeError):
+                pass
+        return node
+
+    def visit_UnaryOp(self, node):
+        if type(node.op) not in UNARYOPS:
+            raise FormulaError(f"Δεν επιτρέπεται: {type(node.op).__name__}")
+        node.operand = self.visit(node.operand)
+        const, val = self.value_of(node.operand)
+        if const:
+            return self.constant(UNARYOPS[type(node.op)](val))
+        return node
+
+    def visit_Compare(self, node):
+        if not all(isinstance(oper, COMPARE_OPS) for oper in node.ops):
+            raise FormulaError("Επιτρέπονται μόνο οι συγκρίσεις < <= > >= == !=")
+        node.left = self.visit(node.left)
+        node.comparators = [self.visit(comp) for comp in node.comparators]
+        return node
+
+    def visit_BoolOp(self, node):
+        node.values = [self.visit(val) for val in node.values]
+        return node
+
+    def visit_IfExp(self, node):
+        node.test = self.visit(node.test)
+        node.body = self.visit(node.body)
+        node.orelse = self.visit(node.orelse)
+        return node
+
+
+def is_number(value):
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+
+class CompiledFormula:
+    """Μεταγλωττισμένος τύπος. Καλείται με τις μεταβλητές ως keywords"""
+
+    __slots__ = ("source", "code", "globals")
+
+    def __init__(self, source, code, consts):
+        self.source = source
+        self.code = code
+        self.globals = {"__builtins__": {}, "Decimal": Decimal, **consts}
+
+    def __call__(self, /, **names):
+        return eval(self.code, self.globals, names)
+
+    def __repr__(self):
+        return f"CompiledFormula({self.source!r})"
+
+
+def parse_formula(source, names):
+    """Ελεγμένο και απλοποιημένο AST του τύπου και οι σταθερές του
+    ({όνομα: τιμή})
+    """
+    try:
+        tree = ast.parse(source.strip(), mode="eval")
+    except SyntaxError as err:
+        raise FormulaError(f"Συντακτικό λάθος: {err.msg}") from err
+    compiler = FormulaCompiler(names)
+    tree = ast.fix_missing_locations(compiler.visit(tree))
+    return tree, compiler.consts
+
+
+def compile_formula(source, names):
+    """Μεταγλωττίζει τον τύπο source επιτρέποντας μόνο τις μεταβλητές names"""
+    tree, consts = parse_formula(source, names)
+    return CompiledFormula(source, compile(tree, "<formula>", "eval"), consts)
+
+
+class FormulaCache:
+    """Cache μεταγλωττισμένων τύπων με κλειδί τη γραμμή (π.χ. pk) και
+    το hash του κειμένου, ώστε μια αλλαγή στον τύπο να μεταγλωττίζεται
+    ξανά ακόμη και αν δεν έχει γίνει invalidate.
+    """
+
+    def __init__(self, names):
+        self.names = frozenset(names)
+        self._compiled = {}
+
+    def get(self, key, source):
+        digest = hash(source)
+        entry = self._compiled.get(key)
+        if entry is None or entry[0] != digest:
+            entry = (digest, compile_formula(source, self.names))
+            self._compiled[key] = entry
+        return entry[1]
+
+    def invalidate(self, key):
+        self._compiled.pop(key, None)
+
+    def clear(self):
+        self._compiled.clear()
+
+    def __len__(self):
+        return len(self._compiled)
+
+
+# Formula.evalu: Τιμή παρουσίας και αποδοχές της πρόσληψης
+formulas = FormulaCache(("val", "misthos", "imeromisthio", "oromisthio"))
+# ErgazomenosType.evalmisthos/evalimeromisthio/evaloromisthio: Η πρόσληψη
+ergtype_formulas = FormulaCache(("self",))
@@ -0,0 +1,232 @@
+"""
+Φόρος μισθωτών υπηρεσιών και εισφορά αλληλεγγύης από πίνακες ανά έτος
+
+Οι κλίμακες (φόρου, μείωσης για παιδιά, εισφοράς αλληλεγγύης) κρατιούνται
+ανά φορολογικό έτος σε ένα ForologikoEtos με προϋπολογισμένα τα σωρευτικά
+ποσά στην αρχή κάθε κλιμακίου, οπότε ο φόρος ενός ποσού είναι η εύρεση του
+κλιμακίου και ένας πολλαπλασιασμός. Ένα νέο έτος με αλλαγές
+προστίθεται στο FOROLOGIKA_ETI και ισχύει μέχρι το επόμενο.
+
+Οι υπολογισμοί γίνονται με ακέραιους και δίνουν τα ίδια ποσά (Money) με τις
+utils.foros.calc_foros, calc_eea και calc_foros_eea_periodou.
+"""
+from functools import lru_cache
+from .money import Money, ratio, round_half_up
+from .timeline import Timeline
+
+
+class Klimaka:
+    """Κλίμακα με όρια (αρχή κάθε κλιμακίου) και συντελεστές
+
+    oria       : Η αρχή κάθε κλιμακίου σε ευρώ, αύξουσα, με πρώτο το 0
+    syntelestes: Ο συντελεστής κάθε κλιμακίου (ανά divisor)
+    divisor    : 100 για ποσοστά, 1000 για τοις χιλίοις
+    sorefta    : Το ποσό (σε ευρώ επί divisor) μέχρι την αρχή κάθε κλιμακίου
+    """
+
+    __slots__ = ("oria", "syntelestes", "divisor", "sorefta")
+
+    def __init__(self, oria, syntelestes, divisor=100):
+        assert len(oria) == len(syntelestes) and oria[0] == 0
+        self.oria = tuple(oria)
+        self.syntelestes = tuple(syntelestes)
+        self.divisor = divisor
+        sorefta = [0]
+        for idx in range(1, len(oria)):
+            sorefta.append(
+                sorefta[-1] + syntelestes[idx - 1] * (oria[idx] - oria[idx - 1])
+            )
+        self.sorefta = tuple(sorefta)
+
+    def cents(self, poso, scale):
+        """Το ποσό της κλίμακας σε λεπτά για ετήσιο poso / scale ευρώ"""
+        idx = 0
+        last = len(self.oria) - 1
+        while idx < last and poso >= self.oria[idx + 1] * scale:
+            idx += 1
+        amount = (
+            self.sorefta[idx] * scale
+            + self.syntelestes[idx] * (poso - self.oria[idx] * scale)
+        )
+        return round_half_up(amount * 100, self.divisor * scale)
+
+    def cents_many(self, posa, scale):
+        """Όπως η cents για πολλά ποσά με ένα πέρασμα των κλιμακίων: Τα ποσά
+        παίρνονται ταξινομημένα και το κλιμάκιο μόνο προχωράει
+        """
+        result = [0] * len(posa)
+        oria = [orio * scale for orio in self.oria]
+        divisor = self.divisor * scale
+        idx = 0
+        last = len(oria) - 1
+        for pos in sorted(range(len(posa)), key=posa.__getitem__):
+            poso = posa[pos]
+            while idx < last and poso >= oria[idx + 1]:
+                idx += 1
+            amount = self.sorefta[idx] * scale + self.syntelestes[idx] * (
+                poso - oria[idx]
+            )
+            result[pos] = round_half_up(amount * 100, divisor)
+        return result
+
+
+class ForologikoEtos:
+    """Οι κλίμακες ενός φορολογικού έτους
+
+    foros        : Klimaka φόρου
+    meiosi       : Μείωση φόρου για 0, 1, 2... παιδιά (ευρώ)
+    meiosi_extra : Μείωση για κάθε παιδί πέρα από όσα έχει το meiosi
+    meiosi_orio  : Πάνω από αυτό το ετήσιο ποσό η μείωση μειώνεται κατά
+                   meiosi_poso για κάθε ολόκληρο meiosi_vima
+    meiosi_plires: Από αυτό τον αριθμό παιδιών η μείωση δεν μειώνεται
+    eea          : Klimaka εισφοράς αλληλεγγύης
+    """
+
+    __slots__ = (
+        "foros",
+        "meiosi",
+        "meiosi_extra",
+        "meiosi_orio",
+        "meiosi_vima",
+        "meiosi_poso",
+        "meiosi_plires",
+        "eea",
+    )
+
+    def __init__(
+        self,
+        foros,
+        meiosi,
+        meiosi_extra,
+        meiosi_orio,
+        meiosi_vima,
+        meiosi_poso,
+        meiosi_plires,
+        eea,
+    ):
+        self.foros = foros
+        self.meiosi = tuple(meiosi)
+        self.meiosi_extra = meiosi_extra
+        self.meiosi_orio = meiosi_orio
+        self.meiosi_vima = meiosi_vima
+        self.meiosi_poso = meiosi_poso
+        self.meiosi_plires = meiosi_plires
+        self.eea = eea
+
+    def meiosi_paidia(self, paidia, poso, scale):
+        """Μείωση φόρου σε ευρώ για ετήσιο poso / scale ευρώ"""
+        last = len(self.meiosi) - 1
+        if paidia <= last:
+            meiosi = self.meiosi[paidia]
+        else:
+            meiosi = self.meiosi[last] + self.meiosi_extra * (paidia - last)
+        if paidia >= self.meiosi_plires:
+            return meiosi
+        if poso > self.meiosi_orio * scale:
+            vimata = (poso - self.meiosi_orio * scale) // (self.meiosi_vima * scale)
+            meiosi -= vimata * self.meiosi_poso
+        return max(meiosi, 0)
+
+    def foros_cents(self, poso, paidia, scale=1):
+        """Φόρος σε λεπτά για ετήσιο poso / scale ευρώ"""
+        foros = self.foros.cents(poso, scale)
+        meiosi = self.meiosi_paidia(paidia, poso, scale) * 100
+        if meiosi >= foros:
+            return 0
+        return foros - meiosi
+
+    def foros_eea_many(self, posa, paidia, scale=1):
+        """[(φόρος, εισφορά αλληλεγγύης)] σε λεπτά για ετήσια posa / scale
+        ευρώ, με τα κλιμάκια κάθε κλίμακας σε ένα πέρασμα (Klimaka.cents_many)
+        """
+        foroi = self.foros.cents_many(posa, scale)
+        eeas = self.eea.cents_many(posa, scale)
+        result = []
+        for poso, num, foros, eea in zip(posa, paidia, foroi, eeas):
+            meiosi = self.meiosi_paidia(num, poso, scale) * 100
+            result.append((max(foros - meiosi, 0), eea))
+        return result
+
+    def eea_cents(self, poso, scale=1):
+        """Εισφορά αλληλεγγύης σε λεπτά για ετήσιο poso / scale ευρώ"""
+        return self.eea.cents(poso, scale)
+
+
+FOROLOGIKA_ETI = Timeline(
+    [
+        (
+            2020,
+            ForologikoEtos(
+                foros=Klimaka((0, 10000, 20000, 30000, 40000), (9, 22, 28, 36, 44)),
+                meiosi=(777, 810, 900),
+                meiosi_extra=220,
+                meiosi_orio=12000,
+                meiosi_vima=1000,
+                meiosi_poso=20,
+                meiosi_plires=5,
+                eea=Klimaka(
+                    (0, 12000, 20000, 30000, 40000, 65000, 220000),
+                    (0, 22, 50, 65, 75, 90, 100),
+                    1000,
+                ),
+            ),
+        ),
+    ]
+)
+
+
+def forologiko_etos(etos):
+    """Το ForologikoEtos που ισχύει για το έτος"""
+    klimakes = FOROLOGIKA_ETI.at(etos)
+    if klimakes is None:
+        raise ValueError(f"Δεν υπάρχει φορολογική κλίμακα για το έτος {etos}")
+    return klimakes
+
+
+@lru_cache(maxsize=4096)
+def foros_eea_cents(etos, forologiteo, paidia, barytis):
+    """Φόρος και εισφορά αλληλεγγύης περιόδου σε λεπτά
+
+    forologiteo: Φορολογητέο περιόδου σε λεπτά (int)
+    barytis    : Περίοδοι ανά έτος (int ή Decimal)
+    """
+    klimakes = forologiko_etos(etos)
+    num, den = ratio(barytis)
+    # Ετήσιο ποσό = poso / scale ευρώ
+    poso = forologiteo * num
+    scale = 100 * den
+    foros = klimakes.foros_cents(poso, paidia, scale)
+    eea = klimakes.eea_cents(poso, scale)
+    return round_half_up(foros * den, num), round_half_up(eea * den, num)
+
+
+def calc_foros_eea_periodou(etos, forologiteo, paidia, barytis):
+    """Όπως η utils.foros.calc_foros_eea_periodou με cache ανά
+    (έτος, φορολογητέο, παιδιά, βαρύτητα)
+    """
+    foros, eea = foros_eea_cents(
+        etos, Money.of(forologiteo).cents, paidia, barytis
+    )
+    return Money(foros), Money(eea)
+
+
+def calc_many(etos, posa, paidia, barytis=1):
+    """Φόρος και εισφορά αλληλεγγύης (Money) για πολλά ποσά μαζί
+
+    Τα ποσά ταξινομούνται μία φορά και κάθε κλίμακα εφαρμόζεται σε ένα
+    πέρασμα (ForologikoEtos.foros_eea_many), χωρίς το cache της
+    calc_foros_eea_periodou.
+
+    posa  : Φορολογητέα ποσά περιόδου (ετήσια με barytis=1)
+    paidia: Ο αριθμός παιδιών για κάθε ποσό
+    """
+    if len(posa) != len(paidia):
+        raise ValueError("Διαφορετικό πλήθος ποσών και παιδιών")
+    klimakes = forologiko_etos(etos)
+    num, den = ratio(barytis)
+    # Ετήσια ποσά = poso / scale ευρώ, όπως στην foros_eea_cents
+    annual = [Money.of(poso).cents * num for poso in posa]
+    return [
+        (Money(round_half_up(foros * den, num)), Money(round_half_up(eea * den, num)))
+        for foros, eea in klimakes.foros_eea_many(annual, paidia, 100 * den)
+    ]
@@ -1,4 +1,12 @@
 from decimal import Decimal
+from .money import Money
+
+
+def as_decimal(poso):
+    """Decimal από Money, Decimal ή int"""
+    if isinstance(poso, Money):
+        return poso.decimal()
+    return Decimal(poso)
 
 
 def split_poso(poso, klimaka):
@@ -26,14 +34,14 @@ def meiosi_paidia(paidia, etisio):
     else:
         meiosi = 900 + 220 * (paidia - 2)
     if paidia >= 5:
-        return round(Decimal(meiosi), 2)
+        return Money.of(meiosi)
     meiosi_meiosis = 0
     if etisio > 12000:
         meiosi_meiosis = (etisio - 12000) // 1000 * 20
     final_meiosi = meiosi - meiosi_meiosis
     if final_meiosi <= 0:
-        return 0
-    return round(Decimal(final_meiosi), 2)
+        return Money()
+    return Money.of(final_meiosi)
 
 
 def calc_foros(etos, etisio, paidia):
@@ -48,13 +56,13 @@ def calc_foros(etos, etisio, paidia):
     lpososta = len(pososta)
     assert len(klimaka) + 1 == lpososta
 
+    etisio = as_decimal(etisio)
     kat = split_poso(etisio, klimaka)
-    foros = round(
-        Decimal(sum([dpos[i] * kat[i] / d100 for i in range(lpososta)])), 2)
+    foros = Money.of(sum([dpos[i] * kat[i] / d100 for i in range(lpososta)]))
     meiosi = meiosi_paidia(paidia, etisio)
     # print("foros:55>Foros-Meiosi", foros, meiosi)
     if meiosi >= foros:
-        return 0
+        return Money()
     return foros - meiosi
 
 
@@ -62,8 +70,10 @@ def calc_eea(poso):
     '''
     Εισφορά Αλληλεγγύης
     '''
+    poso = as_decimal(poso)
     foros = 0
-    p20 = 8000 * 2.2 / 100.0
+    d100 = Decimal(100)
+    p20 = 8000 * Decimal('2.2') / d100
     p30 = p20 + 500  # (10000 * 5.0 / 100.0)
     p40 = p30 + 650  # (10000 * 6.5 / 100.0)
     p65 = p40 + 1875  # (25000 * 7.5 / 100.0)
@@ -71,18 +81,18 @@ def calc_eea(poso):
     if poso <= 12000:
         foros = 0
     elif poso <= 20000:
-        foros = (poso - 12000) * 2.2 / 100.0
+        foros = (poso - 12000) * Decimal('2.2') / d100
     elif poso <= 30000:
-        foros = p20 + (poso - 20000) * 5.0 / 100.0
+        foros = p20 + (poso - 20000) * 5 / d100
     elif poso <= 40000:
-        foros = p30 + (poso - 30000) * 6.5 / 100.0
+        foros = p30 + (poso - 30000) * Decimal('6.5') / d100
     elif poso <= 65000:
-        foros = p40 + (poso - 40000) * 7.5 / 100.0
+        foros = p40 + (poso - 40000) * Decimal('7.5') / d100
     elif poso <= 220000:
-        foros = p65 + (poso - 65000) * 9.0 / 100.0
+        foros = p65 + (poso - 65000) * 9 / d100
     else:
-        foros = p22 + (poso - 220000) * 10.0 / 100.0
-    return round(Decimal(foros), 2)
+        foros = p22 + (poso - 220000) * 10 / d100
+    return Money.of(foros)
 
 
 def calc_foros_eea(etos, etisio, paidia):
@@ -92,8 +102,9 @@ def calc_foros_eea(etos, etisio, paidia):
 
 
 def calc_foros_eea_periodou(etos, forologiteo, paidia, barytis):
-    etisio = forologiteo * barytis
+    """Φόρος και εισφορά αλληλεγγύης (Money) της περιόδου για φορολογητέο
+    ποσό περιόδου forologiteo που αναγόμενο σε έτος είναι forologiteo * barytis
+    """
+    etisio = as_decimal(forologiteo) * barytis
     foros, eea, _ = calc_foros_eea(etos, etisio, paidia)
-    foros_periodou = round(Decimal(foros / barytis), 2)
-    eea_periodou = round(Decimal(eea / barytis), 2)
-    return foros_periodou, eea_periodou
+    return foros / barytis, eea / barytis
@@ -0,0 +1,233 @@
+"""
+Εγγραφές σταθερού μήκους (ΑΠΔ ΕΦΚΑ, ΦΜΥ ΑΑΔΕ) από δηλωτική περιγραφή
+
+Μια εγγραφή περιγράφεται ως λίστα από Field (όνομα, πλάτος, είδος) και
+μεταγλωττίζεται μία φορά σε Layout: ελέγχεται ότι το άθροισμα των πλατών
+είναι το μήκος της εγγραφής και φτιάχνεται ένα format string με τα
+σταθερά πεδία (value) έτοιμα και ένα format spec (στοίχιση, πλάτος) για
+κάθε μεταβλητό πεδίο. Κάθε πεδίο συμπληρώνεται τουλάχιστον στο πλάτος του,
+οπότε ανά εγγραφή αρκεί ένας έλεγχος μήκους για τιμές που δεν χωράνε.
+
+Είδη πεδίων (ίδια αποτελέσματα με τις συναρτήσεις του apd_functions):
+
+text : Κείμενο με κενά δεξιά (fill_spaces), λάθος αν είναι μεγαλύτερο
+cut  : Κείμενο κομμένο στο πλάτος με κενά δεξιά (fill_spaces_cut)
+exact: Κείμενο που πρέπει να έχει ακριβώς το πλάτος (ΑΦΜ, ΑΜΚΑ, κωδικοί)
+zeros: Ακέραιος με μηδενικά αριστερά (leading_zeroes)
+money: Ποσό σε λεπτά με μηδενικά αριστερά (decimal2flat)
+date : Ημερομηνία ως ddmmyyyy ή κενά (isodate2flat)
+
+Το Layout.parse κάνει το αντίστροφο: από μια εγγραφή (str ή bytes) δίνει
+τις τιμές των μεταβλητών πεδίων ως namedtuple (Layout.record), με int για
+τα zeros, Money για τα money, date (ή None) για τα date και κείμενο χωρίς
+τα κενά δεξιά για τα text και cut.
+"""
+import codecs
+from collections import namedtuple
+from datetime import date
+from .money import Money
+from . import apd_functions as apdf
+
+
+class Field:
+    """Πεδίο εγγραφής. Με value το πεδίο είναι σταθερό."""
+
+    __slots__ = ("name", "width", "kind", "value")
+
+    def __init__(self, name, width, kind="text", value=None):
+        self.name = name
+        self.width = width
+        self.kind = kind
+        self.value = value
+
+    def __repr__(self):
+        return f"Field({self.name!r}, {self.width}, {self.kind!r})"
+
+
+def _isodate(value):
+    if value is None or value == "":
+        return " " * 8
+    if type(value) is date:
+        return f"{value.day:02d}{value.month:02d}{value.year:04d}"
+    return apdf.isodate2flat(value)
+
+
+def _cents(value):
+    return Money.of(value).cents
+
+
+def _exact(width):
+    def conv(value):
+        value = str(value)
+        if len(value) != width:
+            raise ValueError(f"{value!r} αντί για {width} χαρακτήρες")
+        return value
+
+    return conv
+
+
+def _spec(field):
+    """Το format spec και η μετατροπή (ή None) του πεδίου"""
+    width = field.width
+    if field.kind == "text":
+        return f"<{width}", None
+    if field.kind == "cut":
+        return f"<{width}.{width}", None
+    if field.kind == "zeros":
+        return f"0>{width}", None
+    if field.kind == "money":
+        return f"0{width}d", _cents
+    if field.kind == "date":
+        if width != 8:
+            raise ValueError(f"{field.name}: Η ημερομηνία έχει πλάτος 8")
+        return "", _isodate
+    if field.kind == "exact":
+        return "", _exact(width)
+    raise ValueError(f"{field.name}: Άγνωστο είδος πεδίου {field.kind}")
+
+
+def _parse_date(value):
+    if not value.strip():
+        return None
+    return date(int(value[4:8]), int(value[2:4]), int(value[:2]))
+
+
+def _parse_money(value):
+    return Money(int(value))
+
+
+def _parse_text(value):
+    return value.rstrip(" ")
+
+
+# Μετατροπή της τιμής κάθε είδους στο Layout.parse
+PARSERS = {
+    "text": _parse_text,
+    "cut": _parse_text,
+    "exact": str,
+    "zeros": int,
+    "money": _parse_money,
+    "date": _parse_date,
+}
+
+
+# Οι συναρτήσεις του apd_functions για κάθε είδος (Layout.format_slow)
+HELPERS = {
+    "text": lambda value, width: apdf.fill_spaces(
+        value if value is None else str(value), width
+    ),
+    "cut": lambda value, width: apdf.fill_spaces_cut(value or "", width),
+    "exact": lambda value, width: _exact(width)(value),
+    "zeros": apdf.leading_zeroes,
+    "money": apdf.decimal2flat,
+    "date": lambda value, width: apdf.isodate2flat(value),
+}
+
+
+class Layout:
+    """Μεταγλωττισμένη εγγραφή σταθερού μήκους
+
+    name  : Όνομα εγγραφής (για τα μηνύματα λάθους)
+    length: Το μήκος της εγγραφής
+    fields: Λίστα από Field με τη σειρά της εγγραφής
+    """
+
+    def __init__(self, name, length, fields):
+        self.name = name
+        self.length = length
+        self.fields = tuple(fields)
+        total = sum(field.width for field in self.fields)
+        if total != length:
+            raise ValueError(f"Η εγγραφή {name} έχει μήκος {total} αντί για {length}")
+        parts = []
+        converters = []
+        names = set()
+        parsers = []
+        consts = []
+        start = 0
+        for field in self.fields:
+            spec, conv = _spec(field)
+            end = start + field.width
+            if field.value is not None:
+                value = HELPERS[field.kind](field.value, field.width)
+                parts.append(value.replace("{", "{{").replace("}", "}}"))
+                consts.append((field.name, slice(start, end), value))
+                start = end
+                continue
+            parsers.append((field.name, slice(start, end), PARSERS[field.kind]))
+            start = end
+            if field.name in names or not field.name.isidentifier():
+                raise ValueError(f"{name}.{field.name}: Λάθος ή διπλό όνομα πεδίου")
+            names.add(field.name)
+            parts.append(f"{{{field.name}:{spec}}}")
+            if conv is not None:
+                converters.append((field.name, conv))
+        self.template = "".join(parts)
+        self.converters = tuple(converters)
+        self.names = frozenset(names)
+        self.parsers = tuple(parsers)
+        self.consts = tuple(consts)
+        self.record = namedtuple(
+            name, [field.name for field in self.fields if field.value is None]
+        )
+
+    def format(self, **values):
+        """Η εγγραφή για τις τιμές των μεταβλητών πεδίων"""
+        try:
+            args = dict(values)
+            for name, conv in self.converters:
+                args[name] = conv(args[name])
+            line = self.template.format_map(args)
+        except (KeyError, TypeError, ValueError):
+            line = None
+        if line is None or len(line) != self.length:
+            # Το format_slow δίνει το ίδιο αποτέλεσμα ή το λάθος με το πεδίο
+            return self.format_slow(**values)
+        return line
+
+    def format_slow(self, **values):
+        """Η εγγραφή πεδίο-πεδίο με τις συναρτήσεις του apd_functions"""
+        parts = []
+        for field in self.fields:
+            if field.value is not None:
+                value = field.value
+            elif field.name in values:
+                value = values[field.name]
+            else:
+                raise ValueError(f"{self.name}: Λείπει το πεδίο {field.name}")
+            try:
+                parts.append(HELPERS[field.kind](value, field.width))
+            except ValueError as err:
+                raise ValueError(f"{self.name}.{field.name}: {err}") from None
+        return "".join(parts)
+
+    def parse(self, line, encoding="CP1253"):
+        """Οι τιμές των μεταβλητών πεδίων της εγγραφής ως self.record
+
+        line: Η εγγραφή ως str ή bytes (χωρίς αλλαγή γραμμής). Τα bytes
+              αποκωδικοποιούνται εδώ, μόνο για τις εγγραφές που διαβάζονται
+              (η κωδικοποίηση πρέπει να είναι ενός byte, όπως η CP1253).
+        Λάθος μήκος ή σταθερό πεδίο και τιμές που δεν διαβάζονται δίνουν
+        ValueError με το όνομα του πεδίου.
+        """
+        if isinstance(line, bytes):
+            line = codecs.decode(line, encoding)
+        if len(line) != self.length:
+            raise ValueError(
+                f"{self.name}: Μήκος {len(line)} αντί για {self.length}"
+            )
+        for name, slc, value in self.consts:
+            if line[slc] != value:
+                raise ValueError(
+                    f"{self.name}.{name}: {line[slc]!r} αντί για {value!r}"
+                )
+        values = []
+        for name, slc, conv in self.parsers:
+            try:
+                values.append(conv(line[slc]))
+            except ValueError as err:
+                raise ValueError(f"{self.name}.{name}: {err}") from None
+        return self.record._make(values)
+
+    def __repr__(self):
+        return f"Layout({self.name!r}, {self.length})"
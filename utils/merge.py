@@ -0,0 +1,29 @@
+"""
+Συγχώνευση (k-way merge) ταξινομημένων ακολουθιών
+
+Κάθε ακολουθία δίνει ζεύγη (κλειδί, τιμή) σε αύξουσα σειρά κλειδιού. Η
+merge_sorted τις διαβάζει παράλληλα με heap (heapq.merge) και δίνει κάθε
+κλειδί μία φορά με τις τιμές του από όλες τις ακολουθίες. Στη μνήμη
+κρατιέται μόνο ένα στοιχείο ανά ακολουθία και οι τιμές του τρέχοντος
+κλειδιού.
+"""
+from heapq import merge
+from itertools import groupby
+from operator import itemgetter
+
+
+def _tagged(idx, iterable):
+    for key, value in iterable:
+        yield key, idx, value
+
+
+def merge_sorted(iterables):
+    """(κλειδί, [τιμές]) σε αύξουσα σειρά κλειδιού. Οι τιμές ενός κλειδιού
+    είναι με τη σειρά των iterables (και με τη σειρά τους μέσα σε κάθε ένα).
+    """
+    merged = merge(
+        *[_tagged(idx, iterable) for idx, iterable in enumerate(iterables)],
+        key=itemgetter(0, 1),
+    )
+    for key, group in groupby(merged, key=itemgetter(0)):
+        yield key, [value for _, _, value in group]
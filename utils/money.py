@@ -0,0 +1,178 @@
+"""
+Χρηματικά ποσά σε ακέραια λεπτά
+
+Τα ποσά της μισθοδοσίας κρατιούνται ως ακέραιος αριθμός λεπτών, οπότε η
+πρόσθεση και η αφαίρεση είναι ακριβείς και φθηνές. Στρογγυλοποίηση γίνεται
+μόνο όταν ένα ποσό προκύπτει από πολλαπλασιασμό ή διαίρεση (π.χ. ποσοστό
+κράτησης) ή από μετατροπή Decimal/int/str και είναι πάντα στα 2 δεκαδικά με
+ROUND_HALF_UP (το μισό λεπτό στρογγυλοποιείται μακριά από το μηδέν).
+
+Τα float δεν γίνονται δεκτά ώστε να μη μπαίνουν στους υπολογισμούς
+δυαδικά σφάλματα (π.χ. 2.2 / 100.0).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+
+
+def round_half_up(num, den):
+    """Ο ακέραιος num / den στρογγυλοποιημένος με ROUND_HALF_UP (den > 0)"""
+    if num >= 0:
+        return (2 * num + den) // (2 * den)
+    return -((-2 * num + den) // (2 * den))
+
+
+def ratio(value):
+    """(αριθμητής, παρονομαστής) ενός int, Decimal ή Money"""
+    if isinstance(value, Money):
+        return value.cents, 100
+    if isinstance(value, bool) or not isinstance(value, (int, Decimal)):
+        raise TypeError(f"Μη αποδεκτός αριθμός: {value!r}")
+    return value.as_integer_ratio()
+
+
+def round_decimal(value):
+    """Decimal στρογγυλοποιημένο στα 2 δεκαδικά με ROUND_HALF_UP"""
+    return Decimal(value).quantize(CENT, ROUND_HALF_UP)
+
+
+def decimals(values):
+    """Το dict values με τα Money ως Decimal"""
+    return {
+        key: value.decimal() if isinstance(value, Money) else value
+        for key, value in values.items()
+    }
+
+
+class Money:
+    """Ποσό σε ακέραια λεπτά (Money(12345) είναι 123,45)"""
+
+    __slots__ = ("cents",)
+
+    def __init__(self, cents=0):
+        self.cents = cents
+
+    @classmethod
+    def of(cls, value):
+        """Money από Decimal, int, str ή Money (στρογγυλοποίηση στο λεπτό)"""
+        if isinstance(value, Money):
+            return value
+        if isinstance(value, str):
+            value = Decimal(value)
+        num, den = ratio(value)
+        return cls(round_half_up(num * 100, den))
+
+    @classmethod
+    def sum(cls, values):
+        return cls(sum(value.cents for value in values))
+
+    def decimal(self):
+        """Decimal με 2 δεκαδικά (για τα DecimalField)"""
+        return Decimal(self.cents).scaleb(-2)
+
+    def percent(self, rate):
+        """rate% του ποσού (rate: int ή Decimal)"""
+        num, den = ratio(rate)
+        return Money(round_half_up(self.cents * num, den * 100))
+
+    def __mul__(self, other):
+        num, den = ratio(other)
+        return Money(round_half_up(self.cents * num, den))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        num, den = ratio(other)
+        if num == 0:
+            raise ZeroDivisionError("Διαίρεση ποσού με το μηδέν")
+        if num < 0:
+            num, den = -num, -den
+        return Money(round_half_up(self.cents * den, num))
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __rsub__(self, other):
+        if other == 0:
+            return -self
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def _cmp_value(self, other):
+        """Τα λεπτά του other επί 100 ή None αν δεν συγκρίνεται"""
+        if isinstance(other, Money):
+            return other.cents * 100, self.cents * 100
+        if isinstance(other, bool) or not isinstance(other, (int, Decimal)):
+            return None
+        num, den = other.as_integer_ratio()
+        return num * 100, self.cents * den
+
+    def __eq__(self, other):
+        values = self._cmp_value(other)
+        if values is None:
+            return NotImplemented
+        return values[1] == values[0]
+
+    def __lt__(self, other):
+        values = self._cmp_value(other)
+        if values is None:
+            return NotImplemented
+        return values[1] < values[0]
+
+    def __le__(self, other):
+        values = self._cmp_value(other)
+        if values is None:
+            return NotImplemented
+        return values[1] <= values[0]
+
+    def __gt__(self, other):
+        values = self._cmp_value(other)
+        if values is None:
+            return NotImplemented
+        return values[1] > values[0]
+
+    def __ge__(self, other):
+        values = self._cmp_value(other)
+        if values is None:
+            return NotImplemented
+        return values[1] >= values[0]
+
+    def __hash__(self):
+        return hash(self.decimal())
+
+    def __reduce__(self):
+        return (Money, (self.cents,))
+
+    def flat(self, size):
+        """Τα λεπτά με μηδενικά αριστερά σε size χαρακτήρες (ΑΠΔ, ΦΜΥ)"""
+        txtval = str(self.cents)
+        if len(txtval) > size:
+            raise ValueError("Value is bigger than size")
+        return txtval.zfill(size)
+
+    def __str__(self):
+        return str(self.decimal())
+
+    def __repr__(self):
+        return f"Money('{self.decimal()}')"
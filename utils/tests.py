@@ -1,5 +1,19 @@
+import os
+import tempfile
+import zipfile
+from datetime import date
+from decimal import Decimal
+from io import BytesIO
 from django.test import TestCase
 from . import apd_functions as apdf
+from . import foros
+from . import forologia
+from . import formula
+from . import layout
+from . import merge
+from . import ziputil
+from .money import Money
+from .timeline import Timeline
 
 
 class ApdfTest(TestCase):
@@ -11,3 +25,242 @@ class ApdfTest(TestCase):
 
     def test_03(self):
         self.assertEqual(apdf.fill_spaces('', 5), '     ')
+
+
+class FormulaTest(TestCase):
+    names = ('val', 'misthos', 'imeromisthio', 'oromisthio')
+
+    def test_01(self):
+        frm = formula.compile_formula(
+            'val / Decimal(6.5) * imeromisthio * Decimal(1.04167)', self.names)
+        val, imeromisthio = 13, Decimal('40.00')
+        self.assertEqual(
+            frm(val=val, imeromisthio=imeromisthio),
+            val / Decimal(6.5) * imeromisthio * Decimal(1.04167))
+
+    def test_02(self):
+        frm = formula.compile_formula(
+            '(val / Decimal(12.5) * imeromisthio) if (val /Decimal(12.5) <= 13)'
+            ' else (misthos / Decimal(2))', self.names)
+        self.assertEqual(
+            frm(val=25, imeromisthio=Decimal(40), misthos=Decimal(1000)),
+            Decimal(80))
+        self.assertEqual(
+            frm(val=200, imeromisthio=Decimal(40), misthos=Decimal(1000)),
+            Decimal(500))
+
+    def test_03(self):
+        frm = formula.compile_formula("Decimal('6') / Decimal('40')", self.names)
+        self.assertEqual(frm.code.co_names, ('_k2',))
+        self.assertEqual(frm(), Decimal('0.15'))
+
+    def test_04(self):
+        for source in (
+            "__import__('os').system('ls')",
+            'self.__class__',
+            'pro.erg',
+            'val.__class__',
+            '[val]',
+            'lambda: 1',
+            'val *',
+        ):
+            self.assertRaises(
+                formula.FormulaError, formula.compile_formula, source, self.names)
+
+    def test_05(self):
+        cache = formula.FormulaCache(('self', ))
+        frm1 = cache.get((1, 'evalmisthos'), 'self.apodoxes')
+        self.assertIs(cache.get((1, 'evalmisthos'), 'self.apodoxes'), frm1)
+        frm2 = cache.get((1, 'evalmisthos'), 'self.apodoxes * 2')
+        self.assertIsNot(frm1, frm2)
+        cache.invalidate((1, 'evalmisthos'))
+        self.assertEqual(len(cache), 0)
+
+
+class TimelineTest(TestCase):
+    def test_01(self):
+        tml = Timeline([(201906, 'c'), (201606, 'b'), (200201, 'a')])
+        self.assertIsNone(tml.at(200112))
+        self.assertEqual(tml.at(200201), 'a')
+        self.assertEqual(tml.at(201905), 'b')
+        self.assertEqual(tml.at(201906), 'c')
+        self.assertEqual(tml.at(999912), 'c')
+        self.assertEqual(Timeline().at(202001, 0), 0)
+
+
+class MoneyTest(TestCase):
+    def test_01(self):
+        self.assertEqual(Money.of(Decimal('5.985')), Money(599))
+        self.assertEqual(Money.of(Decimal('-5.985')), Money(-599))
+        self.assertEqual(Money.of('29.924'), Money(2992))
+        self.assertEqual(Money(3800).percent(Decimal('15.75')), Money(599))
+        self.assertEqual(Money(1001) / 2, Money(501))
+
+    def test_02(self):
+        self.assertEqual(Money(150) + Money(25) - Money(75), Money(100))
+        self.assertEqual(sum([Money(150), Money(25)]), Money(175))
+        self.assertEqual(Money(100), Decimal('1.00'))
+        self.assertEqual(Money(), 0)
+        self.assertTrue(Money(101) > 1)
+        self.assertEqual(Money(12345).decimal(), Decimal('123.45'))
+
+    def test_03(self):
+        self.assertRaises(TypeError, Money.of, 2.2)
+        self.assertEqual(Money(12345).flat(8), '00012345')
+        self.assertRaises(ValueError, Money(12345).flat, 4)
+        self.assertEqual(apdf.decimal2flat(Decimal('123.4'), 6), '012340')
+
+
+class ForosTest(TestCase):
+    def test_eea(self):
+        self.assertEqual(foros.calc_eea(Decimal(12000)), 0)
+        self.assertEqual(foros.calc_eea(Decimal(15000)), Money(6600))
+        self.assertEqual(foros.calc_eea(Money(2500000)), Money(42600))
+        self.assertEqual(foros.calc_eea(Decimal(230000)), Money(1815100))
+
+    def test_foros_periodou(self):
+        self.assertEqual(
+            foros.calc_foros_eea_periodou(2020, Money(200000), 0, Decimal(14)),
+            (Money(34879), Money(4114)),
+        )
+
+
+class ForologiaTest(TestCase):
+    def test_same_as_foros(self):
+        for orio in (0, 10000, 12000, 20000, 30000, 40000, 65000, 220000):
+            for diff in (-101, -1, 0, 1, 99, 150000):
+                for paidia in range(7):
+                    for barytis in (Decimal(1), Decimal(14), Decimal('1.5')):
+                        poso = Money(orio * 100 + diff)
+                        self.assertEqual(
+                            forologia.calc_foros_eea_periodou(
+                                2021, poso, paidia, barytis),
+                            foros.calc_foros_eea_periodou(
+                                2021, poso, paidia, barytis),
+                        )
+
+    def test_calc_many(self):
+        posa = [Money(1200000), Decimal(28000), 45000]
+        self.assertEqual(
+            forologia.calc_many(2022, posa, [0, 0, 3]),
+            [foros.calc_foros_eea_periodou(2022, poso, paidia, 1)
+             for poso, paidia in zip(posa, [0, 0, 3])],
+        )
+        self.assertEqual(
+            forologia.calc_many(2022, posa, [0, 0, 3])[1],
+            (Money(488300), Money(57600)))
+        self.assertRaises(ValueError, forologia.calc_many, 2019, posa, [0] * 3)
+        self.assertRaises(ValueError, forologia.calc_many, 2022, posa, [0])
+
+    def test_calc_many_brackets(self):
+        # Όρια κλιμακίων ±1 λεπτό, ανακατεμένα
+        posa = [Money(orio * 100 + diff)
+                for orio in (220000, 0, 40000, 12000, 65000, 20000, 30000)
+                for diff in (1, -1, 0)]
+        paidia = [num % 7 for num in range(len(posa))]
+        for barytis in (1, 14, Decimal('1.5')):
+            self.assertEqual(
+                forologia.calc_many(2021, posa, paidia, barytis),
+                [forologia.calc_foros_eea_periodou(2021, poso, num, barytis)
+                 for poso, num in zip(posa, paidia)])
+
+
+class ZipTest(TestCase):
+    def test_stream_zip(self):
+        lines = [f'{idx:05d}ΑΒΓ' for idx in range(5000)]
+        chunks = list(ziputil.stream_zip(iter(lines), chunk_size=1000))
+        self.assertGreater(len(chunks), 1)
+        with zipfile.ZipFile(BytesIO(b''.join(chunks))) as fil:
+            self.assertEqual(
+                fil.read('JL10'), '\n'.join(lines).encode('CP1253'))
+        data = b''.join(ziputil.stream_zip([], 'CSL01'))
+        with zipfile.ZipFile(BytesIO(data)) as fil:
+            self.assertEqual(fil.read('CSL01'), b'')
+        data = b''.join(ziputil.stream_zip_members(
+            [('1/CSL01', iter(lines)), ('2/CSL01', ['ΑΒΓ'])], chunk_size=1000))
+        with zipfile.ZipFile(BytesIO(data)) as fil:
+            self.assertEqual(fil.namelist(), ['1/CSL01', '2/CSL01'])
+            self.assertEqual(fil.read('1/CSL01'), '\n'.join(lines).encode('CP1253'))
+            self.assertEqual(fil.read('2/CSL01'), 'ΑΒΓ'.encode('CP1253'))
+
+    def test_read_lines(self):
+        lines = [f'{idx:05d}ΑΒΓ'.encode('CP1253') for idx in range(5000)]
+        with tempfile.TemporaryDirectory() as folder:
+            raw = os.path.join(folder, 'CSL01')
+            with open(raw, 'wb') as fil:
+                fil.write(b'\r\n'.join(lines) + b'\r\n')
+            self.assertEqual(list(ziputil.read_lines(raw)), lines)
+            zipped = os.path.join(folder, 'apd.zip')
+            with open(zipped, 'wb') as fil:
+                for chunk in ziputil.stream_zip(
+                        (line.decode('CP1253') for line in lines), 'CSL01'):
+                    fil.write(chunk)
+            self.assertEqual(
+                list(ziputil.read_lines(zipped, chunk_size=1000)), lines)
+            open(raw, 'wb').close()
+            self.assertEqual(list(ziputil.read_lines(raw)), [])
+
+
+class LayoutTest(TestCase):
+    def setUp(self):
+        self.layout = layout.Layout('TEST', 40, [
+            layout.Field('record', 1, value='3'),
+            layout.Field('afm', 9, 'exact'),
+            layout.Field('epo', 6, 'cut'),
+            layout.Field('ono', 5),
+            layout.Field('meres', 3, 'zeros'),
+            layout.Field('poso', 8, 'money'),
+            layout.Field('gen', 8, 'date'),
+        ])
+
+    def test_format(self):
+        values = dict(
+            afm='046949583', epo='ΛΑΖΑΡΟΥ', ono='ΘΕΟ', meres=25,
+            poso=Decimal('123.455'), gen=date(1963, 2, 15))
+        line = self.layout.format(**values)
+        self.assertEqual(line, '3046949583ΛΑΖΑΡΟΘΕΟ  0250001234615021963')
+        self.assertEqual(line, self.layout.format_slow(**values))
+        values.update(ono=None, gen='', poso=Money(-5))
+        self.assertEqual(
+            self.layout.format(**values), self.layout.format_slow(**values))
+
+    def test_parse(self):
+        line = '3046949583ΛΑΖΑΡΟΘΕΟ  0250001234615021963'
+        record = self.layout.parse(line)
+        self.assertEqual(record, (
+            '046949583', 'ΛΑΖΑΡΟ', 'ΘΕΟ', 25, Money(12346), date(1963, 2, 15)))
+        self.assertEqual(record.meres, 25)
+        self.assertEqual(self.layout.parse(line.encode('CP1253')), record)
+        self.assertIsNone(self.layout.parse(line[:32] + ' ' * 8).gen)
+        with self.assertRaisesMessage(ValueError, 'TEST: Μήκος 39'):
+            self.layout.parse(line[:-1])
+        with self.assertRaisesMessage(ValueError, 'TEST.record'):
+            self.layout.parse('2' + line[1:])
+        with self.assertRaisesMessage(ValueError, 'TEST.meres'):
+            self.layout.parse(line.replace('025', 'Α25'))
+
+    def test_errors(self):
+        values = dict(
+            afm='046949583', epo='', ono='ΘΕΟ', meres=25, poso=0, gen=None)
+        self.assertRaises(ValueError, self.layout.format, **dict(values, ono='ΘΕΟΔΩΡΟΣ'))
+        self.assertRaises(ValueError, self.layout.format, **dict(values, meres=1000))
+        self.assertRaises(ValueError, self.layout.format, **dict(values, afm='1234'))
+        self.assertRaises(ValueError, self.layout.format, epo='')
+        # Το μήκος ελέγχεται στη μεταγλώττιση
+        with self.assertRaises(ValueError):
+            layout.Layout('TEST', 10, [layout.Field('afm', 9, 'exact')])
+        with self.assertRaises(ValueError):
+            layout.Layout('TEST', 16, [
+                layout.Field('gen', 8, 'date'), layout.Field('gen', 8, 'date')])
+
+
+class MergeTest(TestCase):
+    def test_merge_sorted(self):
+        first = [(1, 'a'), (3, 'b'), (3, 'c')]
+        second = [(2, 'd'), (3, 'e')]
+        self.assertEqual(
+            list(merge.merge_sorted([iter(first), iter(second), iter([])])),
+            [(1, ['a']), (2, ['d']), (3, ['b', 'c', 'e'])])
+        # Οι τιμές δεν συγκρίνονται
+        self.assertEqual(
+            list(merge.merge_sorted([[(1, {})], [(1, {})]])), [(1, [{}, {}])])
@@ -0,0 +1,30 @@
+from bisect import bisect_right
+from operator import itemgetter
+
+
+class Timeline:
+    """Τιμές που ισχύουν από μια περίοδο (π.χ. YYYYMM) και μετά
+
+    Η τιμή για μια περίοδο είναι αυτή με τη μεγαλύτερη περίοδο έναρξης
+    που δεν την ξεπερνά (αναζήτηση με bisect σε O(log n)).
+    """
+
+    __slots__ = ("periods", "values")
+
+    def __init__(self, items=()):
+        """items: (περίοδος έναρξης, τιμή)"""
+        items = sorted(items, key=itemgetter(0))
+        self.periods = [period for period, _ in items]
+        self.values = [value for _, value in items]
+
+    def at(self, period, default=None):
+        idx = bisect_right(self.periods, period)
+        if idx == 0:
+            return default
+        return self.values[idx - 1]
+
+    def __len__(self):
+        return len(self.periods)
+
+    def __repr__(self):
+        return f"Timeline({list(zip(self.periods, self.values))!r})"
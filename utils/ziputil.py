@@ -1,4 +1,8 @@
+import codecs
+import mmap
+import os
 import zipfile
+from datetime import datetime
 from io import BytesIO
 
 
@@ -12,3 +16,116 @@ def create_zip_stream(txt_data, filename='JL10', encoding='CP1253'):
     with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as fil:
         fil.writestr(filename, txt_data.encode(encoding))
     return stream
+
+
+class _ChunkWriter:
+    """Αρχείο μόνο για εγγραφή που κρατάει τα bytes μέχρι το take()
+
+    Δεν έχει seek/tell, οπότε το zipfile γράφει τα μεγέθη μετά τα
+    δεδομένα (data descriptor) χωρίς να γυρίσει πίσω.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+def stream_zip(lines, filename='JL10', encoding='CP1253', chunk_size=64 * 1024,
+               date_time=None):
+    """Zip με ένα αρχείο από τις γραμμές lines (ενωμένες με '\\n') σε
+    κομμάτια bytes, χωρίς να κρατιέται όλο το κείμενο ή το zip στη μνήμη.
+
+    Η κωδικοποίηση γίνεται σταδιακά ανά chunk_size χαρακτήρες.
+    date_time: Ημερομηνία (και ώρα) του αρχείου μέσα στο zip. Με σταθερή
+    ημερομηνία τα ίδια δεδομένα δίνουν ακριβώς τα ίδια bytes.
+    """
+    return stream_zip_members(
+        [(filename, lines)], encoding, chunk_size, date_time)
+
+
+def stream_zip_members(members, encoding='CP1253', chunk_size=64 * 1024,
+                       date_time=None):
+    """Όπως η stream_zip για πολλά αρχεία: members είναι (όνομα, γραμμές)"""
+    if date_time is None:
+        date_time = datetime.now()
+    out = _ChunkWriter()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as fil:
+        for filename, lines in members:
+            info = zipfile.ZipInfo(filename, date_time.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            encoder = codecs.getincrementalencoder(encoding)()
+            with fil.open(info, 'w') as member:
+                buf = []
+                buf_size = 0
+                for idx, line in enumerate(lines):
+                    if idx:
+                        buf.append('\n')
+                    buf.append(line)
+                    buf_size += len(line) + 1
+                    if buf_size >= chunk_size:
+                        member.write(encoder.encode(''.join(buf)))
+                        buf = []
+                        buf_size = 0
+                        if out.size:
+                            yield out.take()
+                member.write(encoder.encode(''.join(buf), final=True))
+            if out.size:
+                yield out.take()
+    yield out.take()
+
+
+def _strip_cr(line):
+    return line[:-1] if line.endswith(b"\r") else line
+
+
+def _split(chunks):
+    rest = b""
+    for chunk in chunks:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            yield _strip_cr(line)
+    if rest:
+        yield _strip_cr(rest)
+
+
+def read_lines(path, member=None, chunk_size=1024 * 1024):
+    """Οι γραμμές (bytes χωρίς την αλλαγή γραμμής) ενός αρχείου κειμένου ή
+    ενός αρχείου μέσα σε zip (member, εξ ορισμού το πρώτο)
+
+    Το απλό αρχείο διαβάζεται με mmap και το αρχείο του zip σε κομμάτια
+    chunk_size bytes, οπότε δεν φορτώνεται ποτέ όλο στη μνήμη. Η
+    αποκωδικοποίηση αφήνεται σε όποιον διαβάζει τις γραμμές.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            with archive.open(member or archive.namelist()[0]) as fil:
+                yield from _split(iter(lambda: fil.read(chunk_size), b""))
+        return
+    with open(path, "rb") as fil:
+        if os.fstat(fil.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fil.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            size = len(data)
+            while start < size:
+                end = data.find(b"\n", start)
+                if end < 0:
+                    end = size
+                yield _strip_cr(data[start:end])
+                start = end + 1